@@ -23,6 +23,7 @@
 #Project Site: https://gatc.ca/
 
 from math import ceil as _ceil
+from math import exp as _exp
 from __pyjamas__ import JS
 import sys
 
@@ -58,7 +59,7 @@ class TypedArray(object):
         """
         The TypedArray object is instantiated with either the array size, an array of TypedArray or Python type, or an existing ArrayBuffer to view, which creates a new TypedArray of size and included data as the specified type. Optional arguments include offset index at which ArrayBuffer data is inserted and length of an ArrayBuffer.
         """
-        if data:
+        if data is not None:
             if isinstance(data, int):
                 if pyjs_mode.optimized:
                     self._data = JS("new @{{typedarray}}(@{{data}})")
@@ -129,7 +130,7 @@ class TypedArray(object):
         """
         Return result of applying provided accumlator function.
         """
-        return self._array(self._data.reduce(func))
+        return self._data.reduce(func)
 
     def slice(self, i, j):
         """
@@ -410,6 +411,2385 @@ class CanvasPixelArray(TypedArray):
         return array
 
 
+class DataView(object):
+    """
+    Create an interface to JavaScript DataView, which reads and writes numbers of mixed type and byte order at byte offsets of an ArrayBuffer.
+    """
+
+    __codes = { 'b': ('Int8', 1),
+                'B': ('Uint8', 1),
+                'h': ('Int16', 2),
+                'H': ('Uint16', 2),
+                'i': ('Int32', 4),
+                'I': ('Uint32', 4),
+                'f': ('Float32', 4),
+                'd': ('Float64', 8) }
+
+    def __init__(self, buffer, offset=0, length=None, littleendian=False):
+        """
+        The DataView object is instantiated with an ArrayBuffer, or a TypedArray, Ndarray or JavaScript typed array whose buffer data is viewed without copying.
+        Optional arguments offset and length are the byte range of the view within the data, default to the end of the data.
+        Optional argument littleendian is the default byte order of the get and set methods, default big-endian as JavaScript DataView.
+        """
+        buffer, byteoffset, bytelength = _buffer(buffer)
+        if length is None:
+            length = bytelength - offset
+        if offset < 0 or length < 0 or offset+length > bytelength:
+            raise ValueError("view range out of buffer bounds")
+        offset += byteoffset
+        self._data = JS("new DataView(@{{buffer}}, @{{offset}}, @{{length}})")
+        self._littleendian = littleendian
+
+    def _get(self, code, offset, littleendian):
+        name, size = self.__codes[code]
+        if offset < 0 or offset+size > self._data.byteLength:
+            raise IndexError("offset out of range")
+        if littleendian is None:
+            littleendian = self._littleendian
+        value = JS("@{{self}}['_data']['get'+@{{name}}](@{{offset}}, @{{littleendian}})")
+        if code in 'df':
+            return value
+        return int(value)
+
+    def _set(self, code, offset, value, littleendian):
+        name, size = self.__codes[code]
+        if offset < 0 or offset+size > self._data.byteLength:
+            raise IndexError("offset out of range")
+        if littleendian is None:
+            littleendian = self._littleendian
+        if not pyjs_mode.optimized:
+            value = value.valueOf()
+        JS("@{{self}}['_data']['set'+@{{name}}](@{{offset}}, @{{value}}, @{{littleendian}});")
+        return None
+
+    def getInt8(self, offset):
+        """
+        Return int8 value at byte offset.
+        """
+        return self._get('b', offset, None)
+
+    def getUint8(self, offset):
+        """
+        Return uint8 value at byte offset.
+        """
+        return self._get('B', offset, None)
+
+    def getInt16(self, offset, littleendian=None):
+        """
+        Return int16 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('h', offset, littleendian)
+
+    def getUint16(self, offset, littleendian=None):
+        """
+        Return uint16 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('H', offset, littleendian)
+
+    def getInt32(self, offset, littleendian=None):
+        """
+        Return int32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('i', offset, littleendian)
+
+    def getUint32(self, offset, littleendian=None):
+        """
+        Return uint32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('I', offset, littleendian)
+
+    def getFloat32(self, offset, littleendian=None):
+        """
+        Return float32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('f', offset, littleendian)
+
+    def getFloat64(self, offset, littleendian=None):
+        """
+        Return float64 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._get('d', offset, littleendian)
+
+    def setInt8(self, offset, value):
+        """
+        Set int8 value at byte offset.
+        """
+        return self._set('b', offset, value, None)
+
+    def setUint8(self, offset, value):
+        """
+        Set uint8 value at byte offset.
+        """
+        return self._set('B', offset, value, None)
+
+    def setInt16(self, offset, value, littleendian=None):
+        """
+        Set int16 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('h', offset, value, littleendian)
+
+    def setUint16(self, offset, value, littleendian=None):
+        """
+        Set uint16 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('H', offset, value, littleendian)
+
+    def setInt32(self, offset, value, littleendian=None):
+        """
+        Set int32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('i', offset, value, littleendian)
+
+    def setUint32(self, offset, value, littleendian=None):
+        """
+        Set uint32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('I', offset, value, littleendian)
+
+    def setFloat32(self, offset, value, littleendian=None):
+        """
+        Set float32 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('f', offset, value, littleendian)
+
+    def setFloat64(self, offset, value, littleendian=None):
+        """
+        Set float64 value at byte offset.
+        Optional argument littleendian overrides the default byte order.
+        """
+        return self._set('d', offset, value, littleendian)
+
+    def _format(self, fmt):
+        littleendian = self._littleendian
+        if fmt and fmt[0] in '<>!=@':
+            if fmt[0] == '<':
+                littleendian = True
+            elif fmt[0] in '>!':
+                littleendian = False
+            else:
+                littleendian = _littleendian
+            fmt = fmt[1:]
+        codes = []
+        count = ''
+        for code in fmt:
+            if code in '0123456789':
+                count += code
+            elif code in self.__codes or code == 'x':
+                if count:
+                    codes.extend([code] * int(count))
+                else:
+                    codes.append(code)
+                count = ''
+            elif code != ' ':
+                raise ValueError("bad char in format")
+        return littleendian, codes
+
+    def calcsize(self, fmt):
+        """
+        Return size in bytes of the record format.
+        """
+        littleendian, codes = self._format(fmt)
+        size = 0
+        for code in codes:
+            if code == 'x':
+                size += 1
+            else:
+                size += self.__codes[code][1]
+        return size
+
+    def unpack(self, fmt, offset=0):
+        """
+        Return tuple of the values of a record read at byte offset.
+        Argument fmt is a struct module style format of codes b B h H i I f d, x is a pad byte and a count prefix repeats a code.
+        The first character may be '<' little-endian, '>' or '!' big-endian, '=' or '@' native byte order, default the view byte order.
+        Fields are packed without alignment padding.
+        """
+        littleendian, codes = self._format(fmt)
+        values = []
+        for code in codes:
+            if code == 'x':
+                offset += 1
+            else:
+                values.append(self._get(code, offset, littleendian))
+                offset += self.__codes[code][1]
+        return tuple(values)
+
+    def iter_unpack(self, fmt, offset=0, count=None):
+        """
+        Return iterator of the records of format read consecutively from byte offset.
+        Optional argument count is the number of records, default reads the records to the end of the view.
+        """
+        size = self.calcsize(fmt)
+        if count is None:
+            count = (self._data.byteLength - offset) // size
+        for index in range(count):
+            yield self.unpack(fmt, offset+index*size)
+
+    def pack(self, fmt, offset, *values):
+        """
+        Write values as a record of format at byte offset.
+        """
+        littleendian, codes = self._format(fmt)
+        if len(values) != len([code for code in codes if code != 'x']):
+            raise ValueError("pack expected %d items" % len([code for code in codes if code != 'x']))
+        index = 0
+        for code in codes:
+            if code == 'x':
+                offset += 1
+            else:
+                self._set(code, offset, values[index], littleendian)
+                offset += self.__codes[code][1]
+                index += 1
+        return None
+
+    def getByteLength(self):
+        """
+        Return view.byteLength attribute.
+        """
+        return self._data.byteLength
+
+    def getBuffer(self):
+        """
+        Return view.buffer attribute.
+        """
+        return self._data.buffer
+
+    def getByteOffset(self):
+        """
+        Return view.byteOffset attribute.
+        """
+        return self._data.byteOffset
+
+    def getArray(self):
+        """
+        Return JavaScript DataView.
+        """
+        return self._data
+
+
+_reduce_better = JS("""{
+    'min': function(v, m) {
+        return v < m || (v !== v && m === m);
+    },
+    'max': function(v, m) {
+        return v > m || (v !== v && m === m);
+    }
+}""")
+
+
+_reduce_ops = JS("""{
+    'sum': function(x, a, len, step, c, ddof) {
+        var s = 0, e = 0, t, y, i;
+        if (!c) {
+            for (i = 0; i < len; i++, a += step) {
+                s += x[a];
+            }
+            return s;
+        }
+        for (i = 0; i < len; i++, a += step) {
+            y = x[a] - e;
+            t = s + y;
+            e = (t - s) - y;
+            s = t;
+        }
+        return s;
+    },
+    'prod': function(x, a, len, step, c, ddof) {
+        var p = 1;
+        for (var i = 0; i < len; i++, a += step) {
+            p *= x[a];
+        }
+        return p;
+    },
+    'min': function(x, a, len, step, c, ddof) {
+        var better = @{{_reduce_better}}['min'], m = x[a], v;
+        for (var i = 1; i < len; i++) {
+            a += step;
+            v = x[a];
+            if (better(v, m)) {
+                m = v;
+            }
+        }
+        return m;
+    },
+    'max': function(x, a, len, step, c, ddof) {
+        var better = @{{_reduce_better}}['max'], m = x[a], v;
+        for (var i = 1; i < len; i++) {
+            a += step;
+            v = x[a];
+            if (better(v, m)) {
+                m = v;
+            }
+        }
+        return m;
+    },
+    'argmin': function(x, a, len, step, c, ddof) {
+        var better = @{{_reduce_better}}['min'], m = x[a], k = 0, v;
+        for (var i = 1; i < len; i++) {
+            a += step;
+            v = x[a];
+            if (better(v, m)) {
+                m = v;
+                k = i;
+            }
+        }
+        return k;
+    },
+    'argmax': function(x, a, len, step, c, ddof) {
+        var better = @{{_reduce_better}}['max'], m = x[a], k = 0, v;
+        for (var i = 1; i < len; i++) {
+            a += step;
+            v = x[a];
+            if (better(v, m)) {
+                m = v;
+                k = i;
+            }
+        }
+        return k;
+    },
+    'var': function(x, a, len, step, c, ddof) {
+        var mean = 0, m2 = 0, d, v;
+        for (var i = 0; i < len; i++, a += step) {
+            v = x[a];
+            d = v - mean;
+            mean += d / (i + 1);
+            m2 += d * (v - mean);
+        }
+        return m2 / (len - ddof);
+    }
+}""")
+
+
+_kernel_reduce = JS("""function(f, c, ddof, x, xo, len, step, shape, strides, z) {
+    var ndim = shape.length;
+    var n = 1;
+    var k;
+    xo = +xo;
+    len = +len;
+    step = +step;
+    for (k = 0; k < ndim; k++) {
+        n *= shape[k];
+    }
+    var count = [];
+    for (k = 0; k < ndim; k++) {
+        count.push(0);
+    }
+    var xi = xo;
+    for (var o = 0; o < n; o++) {
+        z[o] = f(x, xi, len, step, c, ddof);
+        for (k = ndim - 1; k >= 0; k--) {
+            count[k]++;
+            xi += strides[k];
+            if (count[k] < shape[k]) {
+                break;
+            }
+            count[k] = 0;
+            xi -= strides[k] * shape[k];
+        }
+    }
+}""")
+
+
+_kernel_matmul = JS("""function(n, m, p, bshape, x, xo, xbs, xrs, xcs, y, yo, ybs, yrs, ycs, z, zo, zbs, zrs, zcs) {
+    var tile = 32;
+    var nb = bshape.length;
+    var batches = 1;
+    var i, j, k, i0, i1, j0, j1;
+    xo = +xo;
+    yo = +yo;
+    zo = +zo;
+    for (k = 0; k < nb; k++) {
+        batches *= bshape[k];
+    }
+    if (batches === 0 || n === 0 || p === 0) {
+        return;
+    }
+    var packB = yrs !== 1 && m > 1;
+    var packA = xcs !== 1 && m > 1;
+    var t = packB ? new Float64Array(m * p) : null;
+    var a = packA ? new Float64Array(tile * m) : null;
+    var packed = -1;
+    var count = [];
+    for (k = 0; k < nb; k++) {
+        count.push(0);
+    }
+    var xb = xo, yb = yo, zb = zo;
+    for (var b = 0; b < batches; b++) {
+        var bt, tb, ts;
+        if (packB) {
+            if (yb !== packed) {
+                for (j = 0; j < p; j++) {
+                    var yj = yb + j * ycs;
+                    var tj = j * m;
+                    for (k = 0; k < m; k++) {
+                        t[tj + k] = y[yj + k * yrs];
+                    }
+                }
+                packed = yb;
+            }
+            bt = t;
+            tb = 0;
+            ts = m;
+        } else {
+            bt = y;
+            tb = yb;
+            ts = ycs;
+        }
+        for (i0 = 0; i0 < n; i0 += tile) {
+            i1 = Math.min(i0 + tile, n);
+            var at, ab, as;
+            if (packA) {
+                for (i = i0; i < i1; i++) {
+                    var xi = xb + i * xrs;
+                    var ai = (i - i0) * m;
+                    for (k = 0; k < m; k++) {
+                        a[ai + k] = x[xi + k * xcs];
+                    }
+                }
+                at = a;
+                ab = -i0 * m;
+                as = m;
+            } else {
+                at = x;
+                ab = xb;
+                as = xrs;
+            }
+            for (j0 = 0; j0 < p; j0 += tile) {
+                j1 = Math.min(j0 + tile, p);
+                for (i = i0; i < i1; i++) {
+                    var ar = ab + i * as;
+                    var zr = zb + i * zrs;
+                    for (j = j0; j + 3 < j1; j += 4) {
+                        var b0 = tb + j * ts, b1 = b0 + ts, b2 = b1 + ts, b3 = b2 + ts;
+                        var s0 = 0, s1 = 0, s2 = 0, s3 = 0, v;
+                        for (k = 0; k < m; k++) {
+                            v = at[ar + k];
+                            s0 += v * bt[b0 + k];
+                            s1 += v * bt[b1 + k];
+                            s2 += v * bt[b2 + k];
+                            s3 += v * bt[b3 + k];
+                        }
+                        z[zr + j * zcs] = s0;
+                        z[zr + (j + 1) * zcs] = s1;
+                        z[zr + (j + 2) * zcs] = s2;
+                        z[zr + (j + 3) * zcs] = s3;
+                    }
+                    for (; j < j1; j++) {
+                        var br = tb + j * ts;
+                        var s = 0;
+                        for (k = 0; k < m; k++) {
+                            s += at[ar + k] * bt[br + k];
+                        }
+                        z[zr + j * zcs] = s;
+                    }
+                }
+            }
+        }
+        for (k = nb - 1; k >= 0; k--) {
+            count[k]++;
+            xb += xbs[k];
+            yb += ybs[k];
+            zb += zbs[k];
+            if (count[k] < bshape[k]) {
+                break;
+            }
+            count[k] = 0;
+            xb -= xbs[k] * bshape[k];
+            yb -= ybs[k] * bshape[k];
+            zb -= zbs[k] * bshape[k];
+        }
+    }
+}""")
+
+
+_kernel_bitrange = JS("""function(op, data, bits, start, end) {
+    bits = +bits;
+    start = +start;
+    end = +end;
+    if (start >= end) {
+        return;
+    }
+    var full = bits === 32 ? 0xFFFFFFFF : (1 << bits) - 1;
+    var w0 = Math.floor(start / bits), w1 = Math.floor((end - 1) / bits);
+    var s = start - w0 * bits, e = end - w1 * bits;
+    var head = full >>> s;
+    var tail = e >= bits ? full : full & ~(full >>> e);
+    var w;
+    if (w0 === w1) {
+        head &= tail;
+    }
+    if (op === 'fill') {
+        data[w0] |= head;
+        for (w = w0 + 1; w < w1; w++) {
+            data[w] = full;
+        }
+        if (w1 > w0) {
+            data[w1] |= tail;
+        }
+    } else if (op === 'clear') {
+        data[w0] &= ~head;
+        for (w = w0 + 1; w < w1; w++) {
+            data[w] = 0;
+        }
+        if (w1 > w0) {
+            data[w1] &= ~tail;
+        }
+    } else {
+        data[w0] ^= head;
+        for (w = w0 + 1; w < w1; w++) {
+            data[w] = ~data[w];
+        }
+        if (w1 > w0) {
+            data[w1] ^= tail;
+        }
+    }
+}""")
+
+
+_kernel_bitslice = JS("""function(dst, src, bits, start, count) {
+    bits = +bits;
+    start = +start;
+    count = +count;
+    var full = bits === 32 ? 0xFFFFFFFF : (1 << bits) - 1;
+    var words = Math.ceil(count / bits);
+    var w = Math.floor(start / bits), sh = start - w * bits;
+    var v;
+    for (var r = 0; r < words; r++, w++) {
+        if (sh === 0) {
+            v = src[w];
+        } else {
+            v = (src[w] << sh) | (src[w + 1] >>> (bits - sh));
+        }
+        dst[r] = v & full;
+    }
+    var e = count - (words - 1) * bits;
+    if (words > 0 && e < bits) {
+        dst[words - 1] &= full & ~(full >>> e);
+    }
+}""")
+
+
+_kernel_popcount = JS("""function(data, bits, width) {
+    bits = +bits;
+    width = +width;
+    var words = Math.min(Math.ceil(width / bits), data.length);
+    var e = width - (words - 1) * bits;
+    var full = bits === 32 ? 0xFFFFFFFF : (1 << bits) - 1;
+    var count = 0, v;
+    for (var w = 0; w < words; w++) {
+        v = data[w];
+        if (w === words - 1 && e < bits) {
+            v &= full & ~(full >>> e);
+        }
+        v = v - ((v >>> 1) & 0x55555555);
+        v = (v & 0x33333333) + ((v >>> 2) & 0x33333333);
+        count += (((v + (v >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+    }
+    return count;
+}""")
+
+
+_clz32 = JS("""Math.clz32 || function(x) {
+    x = x >>> 0;
+    if (x === 0) {
+        return 32;
+    }
+    var n = 0;
+    while (!(x & 0x80000000)) {
+        x = (x << 1) >>> 0;
+        n++;
+    }
+    return n;
+}""")
+
+
+_kernel_bitscan = JS("""function(op, data, bits, index) {
+    bits = +bits;
+    index = +index;
+    var clz = @{{_clz32}};
+    var full = bits === 32 ? 0xFFFFFFFF : (1 << bits) - 1;
+    var n = data.length;
+    var w = Math.floor(index / bits), j = index - w * bits, v;
+    if (op === 'prev') {
+        if (w >= n) {
+            w = n - 1;
+            j = bits - 1;
+        }
+        if (w < 0) {
+            return -1;
+        }
+        v = data[w] & (j + 1 >= bits ? full : full & ~(full >>> (j + 1)));
+        while (true) {
+            if (v !== 0) {
+                return w * bits + bits - 1 - (31 - clz(v & -v));
+            }
+            w--;
+            if (w < 0) {
+                return -1;
+            }
+            v = data[w];
+        }
+    }
+    var clear = op === 'nextclear';
+    if (w >= n) {
+        return clear ? index : -1;
+    }
+    v = (clear ? ~data[w] & full : data[w]) & (full >>> j);
+    while (true) {
+        if (v !== 0) {
+            return w * bits + clz(v) - (32 - bits);
+        }
+        w++;
+        if (w >= n) {
+            return clear ? n * bits : -1;
+        }
+        v = clear ? ~data[w] & full : data[w];
+    }
+}""")
+
+
+_kernel_maskalpha = JS("""function(dst, words, data, w, h, threshold) {
+    words = +words;
+    w = +w;
+    h = +h;
+    threshold = +threshold;
+    for (var y = 0; y < h; y++) {
+        var row = y * w * 4 + 3, dr = y * words;
+        for (var k = 0; k < words; k++) {
+            var v = 0, x = k * 32, xe = Math.min(x + 32, w);
+            for (var bit = 31; x < xe; x++, bit--) {
+                if (data[row + x * 4] > threshold) {
+                    v |= 1 << bit;
+                }
+            }
+            dst[dr + k] = v;
+        }
+    }
+}""")
+
+
+_kernel_maskoverlap = JS("""function(op, a, aw, ah, awords, b, bw, bh, bwords, ox, oy, out) {
+    var clz = @{{_clz32}};
+    aw = +aw;
+    ah = +ah;
+    awords = +awords;
+    bw = +bw;
+    bh = +bh;
+    bwords = +bwords;
+    ox = +ox;
+    oy = +oy;
+    var y0 = Math.max(0, oy), y1 = Math.min(ah, oy + bh);
+    var x0 = Math.max(0, ox), x1 = Math.min(aw, ox + bw);
+    if (y0 >= y1 || x0 >= x1) {
+        return op === 'pos' ? -1 : 0;
+    }
+    var k0 = x0 >> 5, k1 = (x1 - 1) >> 5;
+    var count = 0;
+    for (var y = y0; y < y1; y++) {
+        var ar = y * awords, br = (y - oy) * bwords;
+        for (var k = k0; k <= k1; k++) {
+            var s = k * 32 - ox;
+            var wi = Math.floor(s / 32), sh = s - wi * 32;
+            var v = wi >= 0 && wi < bwords ? b[br + wi] : 0;
+            if (sh !== 0) {
+                v = (v << sh) | (wi + 1 >= 0 && wi + 1 < bwords ? b[br + wi + 1] >>> (32 - sh) : 0);
+            }
+            v = (a[ar + k] & v) >>> 0;
+            if (v !== 0) {
+                if (op === 'pos') {
+                    return y * aw + k * 32 + clz(v);
+                } else if (op === 'mask') {
+                    out[ar + k] = v;
+                }
+                v = v - ((v >>> 1) & 0x55555555);
+                v = (v & 0x33333333) + ((v >>> 2) & 0x33333333);
+                count += (((v + (v >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+            }
+        }
+    }
+    return op === 'pos' ? -1 : count;
+}""")
+
+
+_kernel_maskcentroid = JS("""function(data, words, h) {
+    var clz = @{{_clz32}};
+    var n = 0, sx = 0, sy = 0, v, t;
+    words = +words;
+    h = +h;
+    for (var y = 0; y < h; y++) {
+        for (var k = 0; k < words; k++) {
+            v = data[y * words + k];
+            while (v !== 0) {
+                t = clz(v);
+                n++;
+                sx += k * 32 + t;
+                sy += y;
+                v &= ~(0x80000000 >>> t);
+            }
+        }
+    }
+    return [n, sx, sy];
+}""")
+
+
+_kernel_maskoutline = JS("""function(data, w, h, words, every) {
+    w = +w;
+    h = +h;
+    words = +words;
+    every = +every;
+    var dx = [1, 1, 0, -1, -1, -1, 0, 1], dy = [0, 1, 1, 1, 0, -1, -1, -1];
+    var lut = [], i, x, y;
+    for (i = 0; i < 8; i++) {
+        lut[(dx[i] + 1) * 3 + dy[i] + 1] = i;
+    }
+    var fg = function(x, y) {
+        if (x < 0 || y < 0 || x >= w || y >= h) {
+            return false;
+        }
+        return ((data[y * words + (x >> 5)] >>> (31 - (x & 31))) & 1) === 1;
+    };
+    var step = function(px, py, d) {
+        for (var k = 1; k <= 8; k++) {
+            var nd = (d + k) % 8;
+            var qx = px + dx[nd], qy = py + dy[nd];
+            if (fg(qx, qy)) {
+                var bd = (d + k - 1) % 8;
+                return [qx, qy, lut[(px + dx[bd] - qx + 1) * 3 + py + dy[bd] - qy + 1]];
+            }
+        }
+        return null;
+    };
+    var sx = -1, sy = -1;
+    for (y = 0; y < h && sx < 0; y++) {
+        for (x = 0; x < w; x++) {
+            if (fg(x, y)) {
+                sx = x;
+                sy = y;
+                break;
+            }
+        }
+    }
+    if (sx < 0) {
+        return [];
+    }
+    var points = [sx, sy];
+    var first = step(sx, sy, 4);
+    if (first === null) {
+        return points;
+    }
+    var cx = first[0], cy = first[1], cd = first[2];
+    var limit = 4 * w * h + 8;
+    for (i = 1; i < limit; i++) {
+        if (cx === sx && cy === sy) {
+            var next = step(sx, sy, cd);
+            if (next[0] === first[0] && next[1] === first[1]) {
+                break;
+            }
+        }
+        if (i % every === 0) {
+            points.push(cx, cy);
+        }
+        var s = step(cx, cy, cd);
+        cx = s[0];
+        cy = s[1];
+        cd = s[2];
+    }
+    return points;
+}""")
+
+
+_littleendian = JS("""typeof Uint32Array === 'undefined' || new Uint8Array(new Uint32Array([1]).buffer)[0] === 1""")
+
+
+_pixel_argb = JS("""@{{_littleendian}} ? function(v) {
+    return ((v & 0xFF00FF00) | ((v >>> 16) & 0xFF) | ((v & 0xFF) << 16)) >>> 0;
+} : function(v) {
+    return ((v >>> 8) | (v << 24)) >>> 0;
+}""")
+
+
+_pixel_native = JS("""@{{_littleendian}} ? @{{_pixel_argb}} : function(v) {
+    return ((v << 8) | (v >>> 24)) >>> 0;
+}""")
+
+
+_kernel_pixels = JS("""function(op, pixels, stride, x, y, w, h, data, dw, doff, value) {
+    var argb = @{{_pixel_argb}}, native = @{{_pixel_native}};
+    stride = +stride;
+    x = +x;
+    y = +y;
+    w = +w;
+    h = +h;
+    dw = +dw;
+    doff = +doff;
+    if (x === 0 && w === stride && dw === w) {
+        w *= h;
+        h = 1;
+    }
+    var r, i, row, d;
+    if (op === 'fill') {
+        value = native(+value);
+        for (r = 0; r < h; r++) {
+            row = (y + r) * stride + x;
+            if (pixels.fill) {
+                pixels.fill(value, row, row + w);
+            } else {
+                for (i = row; i < row + w; i++) {
+                    pixels[i] = value;
+                }
+            }
+        }
+    } else if (op === 'get') {
+        for (r = 0; r < h; r++) {
+            row = (y + r) * stride + x;
+            d = doff + r * dw;
+            for (i = 0; i < w; i++) {
+                data[d + i] = argb(pixels[row + i]);
+            }
+        }
+    } else if (op === 'set') {
+        for (r = 0; r < h; r++) {
+            row = (y + r) * stride + x;
+            d = doff + r * dw;
+            for (i = 0; i < w; i++) {
+                pixels[row + i] = native(data[d + i]);
+            }
+        }
+    } else {
+        for (r = 0; r < h; r++) {
+            row = (y + r) * stride + x;
+            for (i = row; i < row + w; i++) {
+                pixels[i] = native(+value(argb(pixels[i])));
+            }
+        }
+    }
+}""")
+
+
+_kernel_blit = JS("""function(mode, dst, dbytes, dstride, dx, dy, src, sbytes, sstride, sx, sy, w, h, key) {
+    dstride = +dstride;
+    dx = +dx;
+    dy = +dy;
+    sstride = +sstride;
+    sx = +sx;
+    sy = +sy;
+    w = +w;
+    h = +h;
+    var r, i, d, s, v, n = w * 4;
+    if (mode === 'copy') {
+        var down = src.buffer !== dst.buffer || sy >= dy;
+        for (var k = 0; k < h; k++) {
+            r = down ? k : h - 1 - k;
+            s = (sy + r) * sstride + sx;
+            dst.set(src.subarray(s, s + w), (dy + r) * dstride + dx);
+        }
+        return;
+    }
+    if (src.buffer === dst.buffer) {
+        sbytes = new Uint8ClampedArray(sbytes);
+        src = new Uint32Array(sbytes.buffer);
+    }
+    if (mode === 'colorkey') {
+        var native = @{{_pixel_native}};
+        var mask = native(0x00FFFFFF), nkey = native(+key) & mask;
+        for (r = 0; r < h; r++) {
+            d = (dy + r) * dstride + dx;
+            s = (sy + r) * sstride + sx;
+            for (i = 0; i < w; i++) {
+                v = src[s + i];
+                if ((v & mask) !== nkey) {
+                    dst[d + i] = v;
+                }
+            }
+        }
+    } else if (mode === 'alpha') {
+        var sa, a, b, oa;
+        for (r = 0; r < h; r++) {
+            d = ((dy + r) * dstride + dx) * 4;
+            s = ((sy + r) * sstride + sx) * 4;
+            for (i = 0; i < n; i += 4) {
+                sa = sbytes[s + i + 3];
+                if (sa === 255) {
+                    dst[(d + i) >> 2] = src[(s + i) >> 2];
+                } else if (sa !== 0) {
+                    a = sa / 255;
+                    b = dbytes[d + i + 3] * (255 - sa) / 65025;
+                    oa = a + b;
+                    dbytes[d + i] = (sbytes[s + i] * a + dbytes[d + i] * b) / oa;
+                    dbytes[d + i + 1] = (sbytes[s + i + 1] * a + dbytes[d + i + 1] * b) / oa;
+                    dbytes[d + i + 2] = (sbytes[s + i + 2] * a + dbytes[d + i + 2] * b) / oa;
+                    dbytes[d + i + 3] = oa * 255;
+                }
+            }
+        }
+    } else if (mode === 'add') {
+        for (r = 0; r < h; r++) {
+            d = ((dy + r) * dstride + dx) * 4;
+            s = ((sy + r) * sstride + sx) * 4;
+            for (i = 0; i < n; i += 4) {
+                dbytes[d + i] += sbytes[s + i];
+                dbytes[d + i + 1] += sbytes[s + i + 1];
+                dbytes[d + i + 2] += sbytes[s + i + 2];
+            }
+        }
+    } else {
+        for (r = 0; r < h; r++) {
+            d = ((dy + r) * dstride + dx) * 4;
+            s = ((sy + r) * sstride + sx) * 4;
+            for (i = 0; i < n; i += 4) {
+                dbytes[d + i] = (dbytes[d + i] * sbytes[s + i] + 255) >> 8;
+                dbytes[d + i + 1] = (dbytes[d + i + 1] * sbytes[s + i + 1] + 255) >> 8;
+                dbytes[d + i + 2] = (dbytes[d + i + 2] * sbytes[s + i + 2] + 255) >> 8;
+            }
+        }
+    }
+}""")
+
+
+_kernel_convolve = JS("""function(src, so, s0, s1, sc, h, w, nc, dst, oh, ow, k, kh, kw, col, row, c0, c1, boundary, fill) {
+    so = +so;
+    s0 = +s0;
+    s1 = +s1;
+    sc = +sc;
+    h = +h;
+    w = +w;
+    nc = +nc;
+    oh = +oh;
+    ow = +ow;
+    kh = +kh;
+    kw = +kw;
+    c0 = +c0;
+    c1 = +c1;
+    fill = +fill;
+    var a, b, i, j, ch, t, acc, base;
+    if (src.buffer === dst.buffer) {
+        src = new src.constructor(src);
+    }
+    var table = function(count, n, c, taps) {
+        var idx = new Int32Array(count + taps - 1);
+        for (var p = 0; p < idx.length; p++) {
+            var t = p + c - taps + 1;
+            if (t >= 0 && t < n) {
+                idx[p] = t;
+            } else if (boundary === 'nearest') {
+                idx[p] = t < 0 ? 0 : n - 1;
+            } else if (boundary === 'wrap') {
+                idx[p] = ((t % n) + n) % n;
+            } else if (boundary === 'symm') {
+                t = ((t % (2 * n)) + 2 * n) % (2 * n);
+                idx[p] = t < n ? t : 2 * n - 1 - t;
+            } else {
+                idx[p] = -1;
+            }
+        }
+        return idx;
+    };
+    var rt = table(oh, h, c0, kh), ct = table(ow, w, c1, kw);
+    if (col === null && kh > 1 && kw > 1) {
+        var pi = 0, pj = 0, piv = 0;
+        for (a = 0; a < kh; a++) {
+            for (b = 0; b < kw; b++) {
+                if (Math.abs(k[a * kw + b]) > Math.abs(piv)) {
+                    piv = k[a * kw + b];
+                    pi = a;
+                    pj = b;
+                }
+            }
+        }
+        if (piv !== 0) {
+            col = new Float64Array(kh);
+            row = new Float64Array(kw);
+            for (a = 0; a < kh; a++) {
+                col[a] = k[a * kw + pj];
+            }
+            for (b = 0; b < kw; b++) {
+                row[b] = k[pi * kw + b] / piv;
+            }
+            var tol = Math.abs(piv) * 1e-9;
+            for (a = 0; a < kh && col !== null; a++) {
+                for (b = 0; b < kw; b++) {
+                    if (Math.abs(k[a * kw + b] - col[a] * row[b]) > tol) {
+                        col = null;
+                        break;
+                    }
+                }
+            }
+        }
+    }
+    if (col !== null) {
+        var tmp = new Float64Array(h * ow), line = new Float64Array(ow), rowsum = 0;
+        for (b = 0; b < kw; b++) {
+            rowsum += row[b];
+        }
+        for (ch = 0; ch < nc; ch++) {
+            base = so + ch * sc;
+            for (i = 0; i < h; i++) {
+                var rb = base + i * s0;
+                for (j = 0; j < ow; j++) {
+                    acc = 0;
+                    for (b = 0; b < kw; b++) {
+                        t = ct[j + kw - 1 - b];
+                        acc += row[b] * (t < 0 ? fill : src[rb + t * s1]);
+                    }
+                    tmp[i * ow + j] = acc;
+                }
+            }
+            for (i = 0; i < oh; i++) {
+                for (j = 0; j < ow; j++) {
+                    line[j] = 0;
+                }
+                for (a = 0; a < kh; a++) {
+                    var cf = col[a];
+                    t = rt[i + kh - 1 - a];
+                    if (t < 0) {
+                        cf *= fill * rowsum;
+                        for (j = 0; j < ow; j++) {
+                            line[j] += cf;
+                        }
+                    } else {
+                        t *= ow;
+                        for (j = 0; j < ow; j++) {
+                            line[j] += cf * tmp[t + j];
+                        }
+                    }
+                }
+                for (j = 0; j < ow; j++) {
+                    dst[(i * ow + j) * nc + ch] = line[j];
+                }
+            }
+        }
+        return;
+    }
+    for (ch = 0; ch < nc; ch++) {
+        base = so + ch * sc;
+        for (i = 0; i < oh; i++) {
+            for (j = 0; j < ow; j++) {
+                acc = 0;
+                for (a = 0; a < kh; a++) {
+                    var ri = rt[i + kh - 1 - a];
+                    for (b = 0; b < kw; b++) {
+                        t = ct[j + kw - 1 - b];
+                        acc += k[a * kw + b] * (ri < 0 || t < 0 ? fill : src[base + ri * s0 + t * s1]);
+                    }
+                }
+                dst[(i * ow + j) * nc + ch] = acc;
+            }
+        }
+    }
+}""")
+
+
+_kernel_boxblur = JS("""function(data, w, h, nc, r) {
+    w = +w;
+    h = +h;
+    nc = +nc;
+    r = +r;
+    var rw = w * nc, norm = 1 / ((2 * r + 1) * (2 * r + 1));
+    var tmp = new Float64Array(w * h * nc), acc = new Float64Array(rw);
+    var x, y, c, d, i, lo, hi;
+    for (y = 0; y < h; y++) {
+        var row = y * rw;
+        for (c = 0; c < nc; c++) {
+            var s = 0;
+            for (d = -r; d <= r; d++) {
+                s += data[row + Math.min(Math.max(d, 0), w - 1) * nc + c];
+            }
+            for (x = 0; x < w; x++) {
+                tmp[row + x * nc + c] = s;
+                lo = Math.max(x - r, 0);
+                hi = Math.min(x + r + 1, w - 1);
+                s += data[row + hi * nc + c] - data[row + lo * nc + c];
+            }
+        }
+    }
+    for (d = -r; d <= r; d++) {
+        lo = Math.min(Math.max(d, 0), h - 1) * rw;
+        for (i = 0; i < rw; i++) {
+            acc[i] += tmp[lo + i];
+        }
+    }
+    for (y = 0; y < h; y++) {
+        var out = y * rw;
+        lo = Math.max(y - r, 0) * rw;
+        hi = Math.min(y + r + 1, h - 1) * rw;
+        for (i = 0; i < rw; i++) {
+            data[out + i] = acc[i] * norm;
+            acc[i] += tmp[hi + i] - tmp[lo + i];
+        }
+    }
+}""")
+
+
+_kernel_median = JS("""function(data, w, h, nc, r) {
+    w = +w;
+    h = +h;
+    nc = +nc;
+    r = +r;
+    var src = new data.constructor(data);
+    var hist = new Int32Array(256), half = ((2 * r + 1) * (2 * r + 1)) >> 1;
+    var x, y, c, d, e, v, yy, med, lt, xo, xi;
+    for (c = 0; c < nc; c++) {
+        for (y = 0; y < h; y++) {
+            for (v = 0; v < 256; v++) {
+                hist[v] = 0;
+            }
+            for (d = -r; d <= r; d++) {
+                yy = Math.min(Math.max(y + d, 0), h - 1) * w;
+                for (e = -r; e <= r; e++) {
+                    hist[src[(yy + Math.min(Math.max(e, 0), w - 1)) * nc + c]]++;
+                }
+            }
+            med = 0;
+            lt = 0;
+            while (lt + hist[med] <= half) {
+                lt += hist[med];
+                med++;
+            }
+            data[y * w * nc + c] = med;
+            for (x = 1; x < w; x++) {
+                xo = Math.max(x - r - 1, 0);
+                xi = Math.min(x + r, w - 1);
+                for (d = -r; d <= r; d++) {
+                    yy = Math.min(Math.max(y + d, 0), h - 1) * w;
+                    v = src[(yy + xo) * nc + c];
+                    hist[v]--;
+                    if (v < med) {
+                        lt--;
+                    }
+                    v = src[(yy + xi) * nc + c];
+                    hist[v]++;
+                    if (v < med) {
+                        lt++;
+                    }
+                }
+                while (lt > half) {
+                    med--;
+                    lt -= hist[med];
+                }
+                while (lt + hist[med] <= half) {
+                    lt += hist[med];
+                    med++;
+                }
+                data[(y * w + x) * nc + c] = med;
+            }
+        }
+    }
+}""")
+
+
+_kernel_sobel = JS("""function(data, w, h, nc) {
+    w = +w;
+    h = +h;
+    nc = +nc;
+    var src = new data.constructor(data);
+    var channels = Math.min(nc, 3), rw = w * nc;
+    for (var y = 0; y < h; y++) {
+        var r0 = Math.max(y - 1, 0) * rw, r1 = y * rw, r2 = Math.min(y + 1, h - 1) * rw;
+        for (var x = 0; x < w; x++) {
+            var x0 = Math.max(x - 1, 0) * nc, x1 = x * nc, x2 = Math.min(x + 1, w - 1) * nc;
+            for (var c = 0; c < channels; c++) {
+                var gx = src[r0 + x2 + c] + 2 * src[r1 + x2 + c] + src[r2 + x2 + c] - src[r0 + x0 + c] - 2 * src[r1 + x0 + c] - src[r2 + x0 + c];
+                var gy = src[r2 + x0 + c] + 2 * src[r2 + x1 + c] + src[r2 + x2 + c] - src[r0 + x0 + c] - 2 * src[r0 + x1 + c] - src[r0 + x2 + c];
+                data[r1 + x1 + c] = Math.sqrt(gx * gx + gy * gy);
+            }
+        }
+    }
+}""")
+
+
+_kernel_resize = JS("""function(src, so, s0, s1, sc, h, w, nc, dst, oh, ow, method) {
+    so = +so;
+    s0 = +s0;
+    s1 = +s1;
+    sc = +sc;
+    h = +h;
+    w = +w;
+    nc = +nc;
+    oh = +oh;
+    ow = +ow;
+    var i, j, c, v, p, q, row, out;
+    var isint = !(dst instanceof Float32Array || dst instanceof Float64Array);
+    if (src.buffer === dst.buffer) {
+        src = new src.constructor(src);
+    }
+    if (method === 'nearest') {
+        var yt = new Int32Array(oh), xt = new Int32Array(ow);
+        for (i = 0; i < oh; i++) {
+            yt[i] = Math.min(Math.floor((i + 0.5) * h / oh), h - 1) * s0;
+        }
+        for (j = 0; j < ow; j++) {
+            xt[j] = Math.min(Math.floor((j + 0.5) * w / ow), w - 1) * s1;
+        }
+        for (i = 0; i < oh; i++) {
+            row = so + yt[i];
+            out = i * ow * nc;
+            for (j = 0; j < ow; j++) {
+                p = row + xt[j];
+                for (c = 0; c < nc; c++) {
+                    dst[out++] = src[p + c * sc];
+                }
+            }
+        }
+        return;
+    }
+    if (method === 'bilinear') {
+        var linear = function(count, n, stride) {
+            var t0 = new Int32Array(count), t1 = new Int32Array(count), tw = new Float64Array(count);
+            for (var k = 0; k < count; k++) {
+                var f = Math.min(Math.max((k + 0.5) * n / count - 0.5, 0), n - 1);
+                var f0 = Math.floor(f);
+                t0[k] = f0 * stride;
+                t1[k] = Math.min(f0 + 1, n - 1) * stride;
+                tw[k] = f - f0;
+            }
+            return [t0, t1, tw];
+        };
+        var ys = linear(oh, h, s0), xs = linear(ow, w, s1);
+        var y0 = ys[0], y1 = ys[1], wy = ys[2], x0 = xs[0], x1 = xs[1], wx = xs[2];
+        for (i = 0; i < oh; i++) {
+            var r0 = so + y0[i], r1 = so + y1[i], b = wy[i], a = 1 - b;
+            out = i * ow * nc;
+            for (j = 0; j < ow; j++) {
+                var d = wx[j], e = 1 - d;
+                for (c = 0; c < nc; c++) {
+                    q = c * sc;
+                    v = a * (e * src[r0 + x0[j] + q] + d * src[r0 + x1[j] + q]) + b * (e * src[r1 + x0[j] + q] + d * src[r1 + x1[j] + q]);
+                    dst[out++] = isint ? Math.round(v) : v;
+                }
+            }
+        }
+        return;
+    }
+    var area = function(count, n) {
+        var scale = n / count, start = new Int32Array(count + 1), index = [], weight = [];
+        for (var k = 0; k < count; k++) {
+            var lo = k * scale, hi = (k + 1) * scale;
+            start[k] = index.length;
+            for (var s = Math.floor(lo); s < hi && s < n; s++) {
+                index.push(s);
+                weight.push((Math.min(hi, s + 1) - Math.max(lo, s)) / scale);
+            }
+        }
+        start[count] = index.length;
+        return [start, new Int32Array(index), new Float64Array(weight)];
+    };
+    var ya = area(oh, h), xa = area(ow, w);
+    var ystart = ya[0], yidx = ya[1], yw = ya[2], xstart = xa[0], xidx = xa[1], xw = xa[2];
+    var tmp = new Float64Array(h * ow * nc), line = new Float64Array(ow * nc), n = ow * nc;
+    for (i = 0; i < h; i++) {
+        row = so + i * s0;
+        out = i * n;
+        for (j = 0; j < ow; j++) {
+            for (c = 0; c < nc; c++) {
+                v = 0;
+                for (p = xstart[j]; p < xstart[j + 1]; p++) {
+                    v += xw[p] * src[row + xidx[p] * s1 + c * sc];
+                }
+                tmp[out++] = v;
+            }
+        }
+    }
+    for (i = 0; i < oh; i++) {
+        for (j = 0; j < n; j++) {
+            line[j] = 0;
+        }
+        for (p = ystart[i]; p < ystart[i + 1]; p++) {
+            row = yidx[p] * n;
+            for (j = 0; j < n; j++) {
+                line[j] += yw[p] * tmp[row + j];
+            }
+        }
+        out = i * n;
+        for (j = 0; j < n; j++) {
+            dst[out + j] = isint ? Math.round(line[j]) : line[j];
+        }
+    }
+}""")
+
+
+_kernel_grayscale = JS("""function(data, n, dst, rgba) {
+    n = +n;
+    var isint = !(dst instanceof Float32Array || dst instanceof Float64Array);
+    for (var i = 0, p = 0; i < n; i++, p += 4) {
+        var v = 0.299 * data[p] + 0.587 * data[p + 1] + 0.114 * data[p + 2];
+        if (rgba) {
+            dst[p] = dst[p + 1] = dst[p + 2] = v;
+        } else {
+            dst[i] = isint ? Math.round(v) : v;
+        }
+    }
+}""")
+
+
+_kernel_hsv = JS("""function(op, data, n, hsv) {
+    n = +n;
+    var i, p, q, r, g, b, h, s, v, max, min, d, f, k;
+    if (op === 'to') {
+        for (i = 0, p = 0, q = 0; i < n; i++, p += 4, q += 3) {
+            r = data[p] / 255;
+            g = data[p + 1] / 255;
+            b = data[p + 2] / 255;
+            max = Math.max(r, g, b);
+            min = Math.min(r, g, b);
+            d = max - min;
+            if (d === 0) {
+                h = 0;
+            } else if (max === r) {
+                h = (g - b) / d;
+                if (h < 0) {
+                    h += 6;
+                }
+            } else if (max === g) {
+                h = (b - r) / d + 2;
+            } else {
+                h = (r - g) / d + 4;
+            }
+            hsv[q] = h / 6;
+            hsv[q + 1] = max === 0 ? 0 : d / max;
+            hsv[q + 2] = max;
+        }
+        return;
+    }
+    for (i = 0, p = 0, q = 0; i < n; i++, p += 4, q += 3) {
+        h = hsv[q] * 6;
+        s = hsv[q + 1];
+        v = hsv[q + 2] * 255;
+        k = Math.floor(h);
+        f = h - k;
+        k = ((k % 6) + 6) % 6;
+        var m = v * (1 - s), x = v * (1 - s * f), y = v * (1 - s * (1 - f));
+        if (k === 0) {
+            r = v; g = y; b = m;
+        } else if (k === 1) {
+            r = x; g = v; b = m;
+        } else if (k === 2) {
+            r = m; g = v; b = y;
+        } else if (k === 3) {
+            r = m; g = x; b = v;
+        } else if (k === 4) {
+            r = y; g = m; b = v;
+        } else {
+            r = v; g = m; b = x;
+        }
+        data[p] = r;
+        data[p + 1] = g;
+        data[p + 2] = b;
+    }
+}""")
+
+
+_kernel_palette = JS("""function(op, data, n, dst, palette) {
+    n = +n;
+    var i, p, c, count = palette.length >> 2;
+    if (op === 'cube') {
+        for (var r = 0; r < 32; r++) {
+            for (var g = 0; g < 32; g++) {
+                for (var b = 0; b < 32; b++) {
+                    var best = 0, dist = Infinity;
+                    for (c = 0; c < count; c++) {
+                        var dr = palette[c * 4] - (r * 8 + 4), dg = palette[c * 4 + 1] - (g * 8 + 4), db = palette[c * 4 + 2] - (b * 8 + 4);
+                        var e = dr * dr + dg * dg + db * db;
+                        if (e < dist) {
+                            dist = e;
+                            best = c;
+                        }
+                    }
+                    dst[(r << 10) | (g << 5) | b] = best;
+                }
+            }
+        }
+    } else if (op === 'quantize') {
+        for (i = 0, p = 0; i < n; i++, p += 4) {
+            dst[i] = palette[((data[p] >> 3) << 10) | ((data[p + 1] >> 3) << 5) | (data[p + 2] >> 3)];
+        }
+    } else {
+        var native = @{{_pixel_native}}, lut = new Uint32Array(256);
+        for (c = 0; c < count; c++) {
+            lut[c] = native(((palette[c * 4 + 3] << 24) | (palette[c * 4] << 16) | (palette[c * 4 + 1] << 8) | palette[c * 4 + 2]) >>> 0);
+        }
+        for (i = 0; i < n; i++) {
+            dst[i] = lut[data[i]];
+        }
+    }
+}""")
+
+
+_kernel_histogram = JS("""function(x, n, bins, lo, hi, edges, counts) {
+    n = +n;
+    bins = +bins;
+    lo = +lo;
+    hi = +hi;
+    var i, v, k, a, b;
+    if (edges === null) {
+        var scale = bins / (hi - lo);
+        for (i = 0; i < n; i++) {
+            v = x[i];
+            if (v >= lo && v <= hi) {
+                k = Math.floor((v - lo) * scale);
+                counts[k < bins ? k : bins - 1]++;
+            }
+        }
+        return;
+    }
+    lo = edges[0];
+    hi = edges[bins];
+    for (i = 0; i < n; i++) {
+        v = x[i];
+        if (v >= lo && v <= hi) {
+            a = 0;
+            b = bins;
+            while (b - a > 1) {
+                k = (a + b) >> 1;
+                if (v < edges[k]) {
+                    b = k;
+                } else {
+                    a = k;
+                }
+            }
+            counts[a]++;
+        }
+    }
+}""")
+
+
+_kernel_bincount = JS("""function(op, x, n, weights, counts) {
+    n = +n;
+    var i, v;
+    if (op === 'max') {
+        var max = 0;
+        for (i = 0; i < n; i++) {
+            v = x[i];
+            if (v < 0) {
+                return -1;
+            }
+            if (v > max) {
+                max = v;
+            }
+        }
+        return max;
+    }
+    if (weights === null) {
+        for (i = 0; i < n; i++) {
+            counts[x[i]]++;
+        }
+    } else {
+        for (i = 0; i < n; i++) {
+            counts[x[i]] += weights[i];
+        }
+    }
+}""")
+
+
+_kernel_scan = JS("""function(op, x, xo, shape, strides, axis, z) {
+    xo = +xo;
+    axis = +axis;
+    var nd = shape.length, len = shape[axis], xs = strides[axis];
+    var zstrides = [], size = 1, d, i, k;
+    for (d = nd - 1; d >= 0; d--) {
+        zstrides[d] = size;
+        size *= shape[d];
+    }
+    if (size === 0) {
+        return;
+    }
+    var zs = zstrides[axis], count = size / len, index = [];
+    for (d = 0; d < nd; d++) {
+        index[d] = 0;
+    }
+    for (k = 0; k < count; k++) {
+        var xp = xo, zp = 0;
+        for (d = 0; d < nd; d++) {
+            xp += index[d] * strides[d];
+            zp += index[d] * zstrides[d];
+        }
+        var acc = op === 'sum' ? 0 : 1;
+        for (i = 0; i < len; i++) {
+            acc = op === 'sum' ? acc + x[xp] : acc * x[xp];
+            z[zp] = acc;
+            xp += xs;
+            zp += zs;
+        }
+        for (d = nd - 1; d >= 0; d--) {
+            if (d !== axis) {
+                if (++index[d] < shape[d]) {
+                    break;
+                }
+                index[d] = 0;
+            }
+        }
+    }
+}""")
+
+
+_kernel_channelhist = JS("""function(data, n, counts, channel) {
+    n = +n;
+    channel = +channel;
+    var i, p = 0;
+    if (channel >= 0) {
+        for (i = 0, p = channel; i < n; i++, p += 4) {
+            counts[data[p]]++;
+        }
+        return;
+    }
+    for (i = 0; i < n; i++, p += 4) {
+        counts[data[p]]++;
+        counts[256 + data[p + 1]]++;
+        counts[512 + data[p + 2]]++;
+        counts[768 + data[p + 3]]++;
+    }
+}""")
+
+
+_kernel_equalize = JS("""function(data, n) {
+    n = +n;
+    var counts = new Uint32Array(768), lut = new Uint8ClampedArray(768);
+    var i, c, p;
+    for (i = 0, p = 0; i < n; i++, p += 4) {
+        counts[data[p]]++;
+        counts[256 + data[p + 1]]++;
+        counts[512 + data[p + 2]]++;
+    }
+    for (c = 0; c < 768; c += 256) {
+        var cdf = 0, first = 0;
+        for (i = 0; i < 256; i++) {
+            if (counts[c + i] !== 0) {
+                first = counts[c + i];
+                break;
+            }
+        }
+        for (i = 0; i < 256; i++) {
+            cdf += counts[c + i];
+            lut[c + i] = n > first ? (cdf - first) * 255 / (n - first) : i;
+        }
+    }
+    for (i = 0, p = 0; i < n; i++, p += 4) {
+        data[p] = lut[data[p]];
+        data[p + 1] = lut[256 + data[p + 1]];
+        data[p + 2] = lut[512 + data[p + 2]];
+    }
+}""")
+
+
+_kernel_mask = JS("""function(op, x, xo, shape, strides, mask, bits, values, value, out) {
+    xo = +xo;
+    bits = +bits;
+    var nd = shape.length, n = 1, d, k, c = 0, p = xo, sel, index = [];
+    for (d = 0; d < nd; d++) {
+        n *= shape[d];
+        index.push(0);
+    }
+    for (k = 0; k < n; k++) {
+        if (bits) {
+            sel = (mask[(k / bits) | 0] >>> (bits - 1 - k % bits)) & 1;
+        } else {
+            sel = mask[k];
+        }
+        if (sel) {
+            if (op === 'get') {
+                out[c] = x[p];
+            } else if (op === 'set') {
+                x[p] = values === null ? value : values[c];
+            }
+            c++;
+        }
+        for (d = nd - 1; d >= 0; d--) {
+            p += strides[d];
+            if (++index[d] < shape[d]) {
+                break;
+            }
+            p -= strides[d] * shape[d];
+            index[d] = 0;
+        }
+    }
+    return c;
+}""")
+
+
+_kernel_nonzero = JS("""function(x, xo, shape, strides, coords) {
+    xo = +xo;
+    var nd = shape.length, n = 1, d, k, c = 0, p = xo, index = [];
+    for (d = 0; d < nd; d++) {
+        n *= shape[d];
+        index.push(0);
+    }
+    for (k = 0; k < n; k++) {
+        if (x[p] !== 0) {
+            if (coords !== null) {
+                for (d = 0; d < nd; d++) {
+                    coords[d][c] = index[d];
+                }
+            }
+            c++;
+        }
+        for (d = nd - 1; d >= 0; d--) {
+            p += strides[d];
+            if (++index[d] < shape[d]) {
+                break;
+            }
+            p -= strides[d] * shape[d];
+            index[d] = 0;
+        }
+    }
+    return c;
+}""")
+
+
+_kernel_take = JS("""function(x, dim, inner, outer, idx, n, z) {
+    dim = +dim;
+    inner = +inner;
+    outer = +outer;
+    n = +n;
+    var ids = new Int32Array(n), i, k, o, j, s, d;
+    for (k = 0; k < n; k++) {
+        i = idx[k];
+        if (i < 0) {
+            i += dim;
+        }
+        if (!(i >= 0 && i < dim)) {
+            return -1;
+        }
+        ids[k] = i;
+    }
+    for (o = 0, d = 0; o < outer; o++) {
+        for (k = 0; k < n; k++) {
+            s = (o * dim + ids[k]) * inner;
+            for (j = 0; j < inner; j++) {
+                z[d++] = x[s + j];
+            }
+        }
+    }
+    return n;
+}""")
+
+
+_kernel_scatter = JS("""function(x, xo, shape, strides, idx, n, values, value) {
+    xo = +xo;
+    n = +n;
+    var nd = shape.length, dim = shape[0], inner = 1, ids = new Int32Array(n), index = [];
+    var i, k, j, d, p, v = 0;
+    for (d = 1; d < nd; d++) {
+        inner *= shape[d];
+        index.push(0);
+    }
+    for (k = 0; k < n; k++) {
+        i = idx[k];
+        if (i < 0) {
+            i += dim;
+        }
+        if (!(i >= 0 && i < dim)) {
+            return -1;
+        }
+        ids[k] = i;
+    }
+    for (k = 0; k < n; k++) {
+        p = xo + ids[k] * strides[0];
+        for (j = 0; j < inner; j++) {
+            x[p] = values === null ? value : values[v++];
+            for (d = nd - 1; d >= 1; d--) {
+                p += strides[d];
+                if (++index[d - 1] < shape[d]) {
+                    break;
+                }
+                p -= strides[d] * shape[d];
+                index[d - 1] = 0;
+            }
+        }
+    }
+    return n;
+}""")
+
+
+_kernel_gather = JS("""function(op, x, xo, shape, strides, coords, n, values, value, z) {
+    xo = +xo;
+    n = +n;
+    var nd = coords.length, pos = new Float64Array(n), i, k, d, p;
+    for (k = 0; k < n; k++) {
+        p = xo;
+        for (d = 0; d < nd; d++) {
+            i = coords[d][k];
+            if (i < 0) {
+                i += shape[d];
+            }
+            if (!(i >= 0 && i < shape[d])) {
+                return -1;
+            }
+            p += i * strides[d];
+        }
+        pos[k] = p;
+    }
+    if (op === 'get') {
+        for (k = 0; k < n; k++) {
+            z[k] = x[pos[k]];
+        }
+    } else if (values === null) {
+        for (k = 0; k < n; k++) {
+            x[pos[k]] = value;
+        }
+    } else {
+        var vn = values.length;
+        for (k = 0; k < n; k++) {
+            x[pos[k]] = values[k % vn];
+        }
+    }
+    return n;
+}""")
+
+
+_kernel_put = JS("""function(x, xo, shape, strides, idx, n, values, value) {
+    xo = +xo;
+    n = +n;
+    var nd = shape.length, size = 1, ids = new Float64Array(n), vn = values === null ? 0 : values.length;
+    var i, k, d, p, f;
+    for (d = 0; d < nd; d++) {
+        size *= shape[d];
+    }
+    for (k = 0; k < n; k++) {
+        i = idx[k];
+        if (i < 0) {
+            i += size;
+        }
+        if (!(i >= 0 && i < size)) {
+            return -1;
+        }
+        ids[k] = i;
+    }
+    for (k = 0; k < n; k++) {
+        f = ids[k];
+        p = xo;
+        for (d = nd - 1; d >= 0; d--) {
+            p += (f % shape[d]) * strides[d];
+            f = Math.floor(f / shape[d]);
+        }
+        x[p] = values === null ? value : values[k % vn];
+    }
+    return n;
+}""")
+
+
+_kernel_sort = JS("""function(op, x, xo, shape, strides, axis, z, kth) {
+    xo = +xo;
+    axis = +axis;
+    var nd = shape.length, len = shape[axis], xs = strides[axis];
+    var zstrides = [], size = 1, d, i, k, j;
+    for (d = nd - 1; d >= 0; d--) {
+        zstrides[d] = size;
+        size *= shape[d];
+    }
+    if (size === 0) {
+        return;
+    }
+    var arg = op === 'argsort' || op === 'argpartition';
+    var lane = arg ? new Float64Array(len) : new x.constructor(len);
+    var idx = arg ? new Int32Array(len) : null;
+    var less = function(a, b) {
+        return a < b || (b !== b && a === a);
+    };
+    var val = arg ? function(i) {
+        return lane[idx[i]];
+    } : function(i) {
+        return lane[i];
+    };
+    var cmp = function(a, b) {
+        var u = lane[a], v = lane[b];
+        return less(u, v) ? -1 : (less(v, u) ? 1 : a - b);
+    };
+    var select = function(arr, lo, hi, k) {
+        while (hi > lo) {
+            var pv = val((lo + hi) >> 1), i = lo, j = hi, t;
+            while (i <= j) {
+                while (less(val(i), pv)) {
+                    i++;
+                }
+                while (less(pv, val(j))) {
+                    j--;
+                }
+                if (i <= j) {
+                    t = arr[i];
+                    arr[i] = arr[j];
+                    arr[j] = t;
+                    i++;
+                    j--;
+                }
+            }
+            if (k <= j) {
+                hi = j;
+            } else if (k >= i) {
+                lo = i;
+            } else {
+                return;
+            }
+        }
+    };
+    var zs = zstrides[axis], count = size / len, index = [];
+    for (d = 0; d < nd; d++) {
+        index.push(0);
+    }
+    for (k = 0; k < count; k++) {
+        var xp = xo, zp = 0;
+        for (d = 0; d < nd; d++) {
+            xp += index[d] * strides[d];
+            zp += index[d] * zstrides[d];
+        }
+        if (op === 'sort' && xs === 1) {
+            x.subarray(xp, xp + len).sort();
+        } else {
+            for (i = 0; i < len; i++) {
+                lane[i] = x[xp + i * xs];
+            }
+            var arr = arg ? idx : lane;
+            if (arg) {
+                for (i = 0; i < len; i++) {
+                    idx[i] = i;
+                }
+            }
+            if (op === 'sort') {
+                lane.sort();
+            } else if (op === 'argsort') {
+                idx.sort(cmp);
+            } else {
+                for (i = 0, j = 0; i < kth.length; i++) {
+                    select(arr, j, len - 1, kth[i]);
+                    j = kth[i] + 1;
+                }
+            }
+            if (arg) {
+                for (i = 0; i < len; i++) {
+                    z[zp + i * zs] = idx[i];
+                }
+            } else {
+                for (i = 0; i < len; i++) {
+                    x[xp + i * xs] = lane[i];
+                }
+            }
+        }
+        for (d = nd - 1; d >= 0; d--) {
+            if (d !== axis) {
+                if (++index[d] < shape[d]) {
+                    break;
+                }
+                index[d] = 0;
+            }
+        }
+    }
+}""")
+
+
+_kernel_searchsorted = JS("""function(a, ao, as, n, v, m, right, z) {
+    ao = +ao;
+    as = +as;
+    n = +n;
+    m = +m;
+    var less = function(a, b) {
+        return a < b || (b !== b && a === a);
+    };
+    for (var j = 0; j < m; j++) {
+        var x = v[j], lo = 0, hi = n, mid, e;
+        while (lo < hi) {
+            mid = (lo + hi) >> 1;
+            e = a[ao + mid * as];
+            if (right ? !less(x, e) : less(e, x)) {
+                lo = mid + 1;
+            } else {
+                hi = mid;
+            }
+        }
+        z[j] = lo;
+    }
+}""")
+
+
+_kernel_unique = JS("""function(s, n, values, counts) {
+    n = +n;
+    var c = -1, v, prev;
+    for (var i = 0; i < n; i++) {
+        v = s[i];
+        if (c < 0 || !(v === prev || (v !== v && prev !== prev))) {
+            c++;
+            if (values !== null) {
+                values[c] = v;
+                if (counts !== null) {
+                    counts[c] = 0;
+                }
+            }
+        }
+        if (counts !== null) {
+            counts[c]++;
+        }
+        prev = v;
+    }
+    return c + 1;
+}""")
+
+
+_kernel_byteswap = JS("""function(bytes, size) {
+    size = +size;
+    var n = bytes.length, half = size >> 1, i, j, t;
+    for (i = 0; i < n; i += size) {
+        for (j = 0; j < half; j++) {
+            t = bytes[i + j];
+            bytes[i + j] = bytes[i + size - 1 - j];
+            bytes[i + size - 1 - j] = t;
+        }
+    }
+}""")
+
+
+_kernel_bitbytes = JS("""function(op, data, bits, bytes, n, width) {
+    bits = +bits;
+    n = +n;
+    width = +width;
+    var per = bits >> 3, size = data.length * bits, k, w, shift;
+    if (op === 'from') {
+        data.fill(0);
+    }
+    for (k = 0; k < n; k++) {
+        w = (k / per) | 0;
+        shift = (per - 1 - k % per) * 8;
+        if (op === 'to') {
+            bytes[k] = (data[w] >>> shift) & 255;
+        } else {
+            data[w] |= bytes[k] << shift;
+        }
+    }
+    if (op === 'to') {
+        if ((width & 7) && (width >> 3) < n) {
+            bytes[width >> 3] &= (0xff00 >> (width & 7)) & 255;
+        }
+    } else {
+        for (k = width; k < size; k++) {
+            data[(k / bits) | 0] &= ~(1 << (bits - 1 - k % bits));
+        }
+    }
+}""")
+
+
+_kernel_bitruns = JS("""function(data, bits, width, runs) {
+    bits = +bits;
+    width = +width;
+    var full = bits === 32 ? 0xffffffff : (1 << bits) - 1;
+    var n = 0, state = 0, run = 0, i = 0, word, v;
+    while (i < width) {
+        word = data[(i / bits) | 0];
+        if (i % bits === 0 && i + bits <= width && word === (state ? full : 0)) {
+            run += bits;
+            i += bits;
+            continue;
+        }
+        v = (word >>> (bits - 1 - i % bits)) & 1;
+        if (v !== state) {
+            if (runs !== null) {
+                runs[n] = run;
+            }
+            n++;
+            run = 0;
+            state = v;
+        }
+        run++;
+        i++;
+    }
+    if (runs !== null) {
+        runs[n] = run;
+    }
+    return n + 1;
+}""")
+
+
+_kernel_rldecode = JS("""function(values, counts, n, z) {
+    n = +n;
+    var i = 0, c;
+    for (var k = 0; k < n; k++) {
+        c = counts[k];
+        if (i + c > z.length) {
+            return -1;
+        }
+        z.fill(values[k], i, i + c);
+        i += c;
+    }
+    return i;
+}""")
+
+
+_base64 = JS("""{
+    'chars': 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/',
+    'encode': function(bytes) {
+        var chars = this.chars, n = bytes.length, out = [], i, v;
+        for (i = 0; i + 2 < n; i += 3) {
+            v = (bytes[i] << 16) | (bytes[i + 1] << 8) | bytes[i + 2];
+            out.push(chars[v >> 18] + chars[(v >> 12) & 63] + chars[(v >> 6) & 63] + chars[v & 63]);
+        }
+        if (i < n) {
+            v = (bytes[i] << 16) | (i + 1 < n ? bytes[i + 1] << 8 : 0);
+            out.push(chars[v >> 18] + chars[(v >> 12) & 63] + (i + 1 < n ? chars[(v >> 6) & 63] : '=') + '=');
+        }
+        return out.join('');
+    },
+    'decode': function(text) {
+        var table = new Int8Array(128).fill(-1), n, out, i, j, k, c, v;
+        for (i = 0; i < 64; i++) {
+            table[this.chars.charCodeAt(i)] = i;
+        }
+        text = text.replace(/[\\s=]+$/, '').replace(/\\s+/g, '');
+        n = text.length;
+        if (n % 4 === 1) {
+            return null;
+        }
+        out = new Uint8Array((n * 3) >> 2);
+        for (i = 0, j = 0; i < n; i += 4) {
+            v = 0;
+            for (k = 0; k < 4; k++) {
+                c = i + k < n ? text.charCodeAt(i + k) : 65;
+                c = c < 128 ? table[c] : -1;
+                if (c < 0) {
+                    return null;
+                }
+                v = (v << 6) | c;
+            }
+            out[j++] = v >> 16;
+            if (j < out.length) {
+                out[j++] = (v >> 8) & 255;
+            }
+            if (j < out.length) {
+                out[j++] = v & 255;
+            }
+        }
+        return out;
+    }
+}""")
+
+
+_op_exprs = { 'add': '(%s + %s)',
+              'sub': '(%s - %s)',
+              'mul': '(%s * %s)',
+              'truediv': '(%s / %s)',
+              'floordiv': 'Math.floor(%s / %s)',
+              'mod': 'mod(%s, %s)',
+              'pow': 'Math.pow(%s, %s)',
+              'lshift': '(%s << %s)',
+              'rshift': '(%s >> %s)',
+              'urshift': '(%s >>> %s)',
+              'and': '(%s & %s)',
+              'or': '(%s | %s)',
+              'xor': '(%s ^ %s)',
+              'lt': '(%s < %s ? 1 : 0)',
+              'le': '(%s <= %s ? 1 : 0)',
+              'eq': '(%s == %s ? 1 : 0)',
+              'ne': '(%s != %s ? 1 : 0)',
+              'gt': '(%s > %s ? 1 : 0)',
+              'ge': '(%s >= %s ? 1 : 0)',
+              'neg': '(-%s)',
+              'abs': 'Math.abs(%s)',
+              'invert': '(~%s)' }
+
+
+class _KernelCache(object):
+
+    def __init__(self, size):
+        self._size = size
+        self._kernels = {}
+        self._keys = []
+
+    def get(self, key):
+        if key in self._kernels:
+            return self._kernels[key]
+        return None
+
+    def set(self, key, kernel):
+        if len(self._keys) >= self._size:
+            del self._kernels[self._keys.pop(0)]
+        self._kernels[key] = kernel
+        self._keys.append(key)
+
+_kernels = _KernelCache(256)
+_palettes = _KernelCache(16)
+
+
+def _kernel_source(count, scalars, expr, contiguous):
+    """
+    Return JavaScript parameters and source of an elementwise kernel over count arrays and scalars.
+    The expression references array elements as a0[i] if contiguous, otherwise as a0[p0], and scalars as s0.
+    """
+    ids = range(count)
+    names = ['s%d' % j for j in range(scalars)]
+    src = ['var mod = function(a, b) {var r = a % b; return (r !== 0 && (r < 0) !== (b < 0)) ? r + b : r;};',
+           'var i, k;']
+    if contiguous:
+        params = ['n', 'z'] + ['a%d' % j for j in ids] + names
+        src.extend(['n = +n;',
+                    'for (i = 0; i < n; i++) {',
+                    '    z[i] = %s;' % expr,
+                    '}'])
+        return ', '.join(params), '\n'.join(src)
+    params = ['shape', 'z', 'zo', 'zs']
+    for j in ids:
+        params.extend(['a%d' % j, 'o%d' % j, 'S%d' % j])
+    params.extend(names)
+    src.extend(['var ndim = shape.length, n = 1;',
+                'for (k = 0; k < ndim; k++) {',
+                '    n *= shape[k];',
+                '}',
+                'if (n === 0) {',
+                '    return;',
+                '}',
+                'var last = ndim - 1;',
+                'var len = shape[last], outer = n / len;',
+                'var zl = zs[last], zi = +zo;',
+                'var count = [];',
+                'for (k = 0; k < ndim; k++) {',
+                '    count.push(0);',
+                '}'])
+    src.extend(['var l%d = S%d[last];' % (j,j) for j in ids])
+    src.extend(['o%d = +o%d;' % (j,j) for j in ids])
+    src.extend(['for (var o = 0; o < outer; o++) {',
+                '    var c = zi;'])
+    src.extend(['    var p%d = o%d;' % (j,j) for j in ids])
+    src.extend(['    for (i = 0; i < len; i++) {',
+                '        z[c] = %s;' % expr,
+                '        c += zl;'])
+    src.extend(['        p%d += l%d;' % (j,j) for j in ids])
+    src.extend(['    }',
+                '    for (k = last - 1; k >= 0; k--) {',
+                '        count[k]++;',
+                '        zi += zs[k];'])
+    src.extend(['        o%d += S%d[k];' % (j,j) for j in ids])
+    src.extend(['        if (count[k] < shape[k]) {',
+                '            break;',
+                '        }',
+                '        count[k] = 0;',
+                '        zi -= zs[k] * shape[k];'])
+    src.extend(['        o%d -= S%d[k] * shape[k];' % (j,j) for j in ids])
+    src.extend(['    }',
+                '}'])
+    return ', '.join(params), '\n'.join(src)
+
+
+def _compile_kernel(key, count, scalars, expr, contiguous):
+    """
+    Return cached JavaScript kernel of key, compiling the elementwise expression on first use.
+    """
+    kernel = _kernels.get(key)
+    if kernel is None:
+        params, source = _kernel_source(count, scalars, expr, contiguous)
+        kernel = JS("new Function(@{{params}}, @{{source}})")
+        _kernels.set(key, kernel)
+    return kernel
+
+
+def _op_kernel(op, dtype, xdtype, ydtype, contiguous):
+    """
+    Return JavaScript kernel of op specialized for the result and operand dtypes and layout.
+    Argument ydtype is None for a scalar operand.
+    """
+    key = '%s|%s|%s|%s|%s' % (op, dtype, xdtype, ydtype, contiguous)
+    kernel = _kernels.get(key)
+    if kernel is not None:
+        return kernel
+    if contiguous:
+        x, y = 'a0[i]', 'a1[i]'
+    else:
+        x, y = 'a0[p0]', 'a1[p1]'
+    if ydtype is None:
+        y = 's0'
+        count, scalars = 1, 1
+    else:
+        count, scalars = 2, 0
+    if op == 'assign':
+        expr = y
+    elif op in ('neg', 'abs', 'invert'):
+        expr = _op_exprs[op] % x
+    else:
+        expr = _op_exprs[op] % (x, y)
+    return _compile_kernel(key, count, scalars, expr, contiguous)
+
+
+def _jsarray(seq):
+    """
+    Return JavaScript array of the sequence of numbers.
+    """
+    if pyjs_mode.optimized:
+        return list(seq).getArray()
+    else:
+        return [value.valueOf() for value in seq].getArray()
+
+
+def _size(shape):
+    """
+    Return element count of shape.
+    """
+    size = 1
+    for dim in shape:
+        size *= dim
+    return size
+
+
+def _buffer(data):
+    """
+    Return ArrayBuffer, byte offset and byte length of the data of an ArrayBuffer, TypedArray, DataView, Ndarray or JavaScript typed array.
+    A strided Ndarray view returns the data of a contiguous copy.
+    """
+    if isinstance(data, Ndarray):
+        data = data._ascontiguous()._data
+    if isinstance(data, (TypedArray, DataView)):
+        data = data._data
+    if JS("ArrayBuffer.isView(@{{data}})"):
+        return data.buffer, data.byteOffset, data.byteLength
+    return data, 0, data.byteLength
+
+
+def _strides(shape):
+    """
+    Return C-contiguous element strides of shape.
+    """
+    strides = []
+    size = 1
+    for dim in shape[::-1]:
+        strides.insert(0, size)
+        size *= dim
+    return tuple(strides)
+
+
+def _contiguous(shape, strides):
+    """
+    Check whether strides describe a C-contiguous layout of shape.
+    """
+    size = 1
+    for i in range(len(shape)-1, -1, -1):
+        if shape[i] != 1 and strides[i] != size:
+            return False
+        size *= shape[i]
+    return True
+
+
+def _slice_range(start, stop, step, dim):
+    """
+    Return start index, length and step of slice over dimension.
+    """
+    if step is None:
+        step = 1
+    elif step == 0:
+        raise ValueError("slice step cannot be zero")
+    if step > 0:
+        lower, upper = 0, dim
+    else:
+        lower, upper = -1, dim-1
+    if start is None:
+        start = {True:lower, False:upper}[step > 0]
+    else:
+        if start < 0:
+            start += dim
+        start = max(lower, min(start, upper))
+    if stop is None:
+        stop = {True:upper, False:lower}[step > 0]
+    else:
+        if stop < 0:
+            stop += dim
+        stop = max(lower, min(stop, upper))
+    if step > 0:
+        length = (stop - start + step - 1) // step
+    else:
+        length = (start - stop - step - 1) // (-step)
+    return start, max(length, 0), step
+
+
+def _broadcast_shape(shape1, shape2):
+    """
+    Return shape of arrays broadcast together.
+    Raises TypeError if shapes are not compatible.
+    """
+    ndim = max(len(shape1), len(shape2))
+    shape1 = (1,)*(ndim-len(shape1)) + tuple(shape1)
+    shape2 = (1,)*(ndim-len(shape2)) + tuple(shape2)
+    shape = []
+    for i in range(ndim):
+        if shape1[i] == shape2[i] or shape2[i] == 1:
+            shape.append(shape1[i])
+        elif shape1[i] == 1:
+            shape.append(shape2[i])
+        else:
+            raise TypeError("array shapes are not compatible")
+    return tuple(shape)
+
+
+def _broadcast_strides(shape, strides, bshape):
+    """
+    Return strides of array broadcast to bshape, with zero stride on broadcast axes.
+    """
+    pad = len(bshape) - len(shape)
+    bstrides = [0] * pad
+    for i in range(len(shape)):
+        if shape[i] == 1:
+            bstrides.append(0)
+        else:
+            bstrides.append(strides[i])
+    return bstrides
+
+
+def _evaluate(flat, strided, arrays, scalars, dtype, out):
+    """
+    Return array of an elementwise expression over arrays broadcast together and scalars, evaluated in a single loop.
+    Arguments flat and strided are the expression for the contiguous and strided kernels.
+    Raises TypeError if array shapes or out dtype are not compatible.
+    """
+    shape = ()
+    for array in arrays:
+        shape = _broadcast_shape(shape, array._shape)
+    if out is None:
+        out = Ndarray(shape, dtype)
+    elif tuple(out._shape) != shape:
+        raise TypeError("array shapes are not compatible")
+    elif out._dtype != dtype:
+        raise TypeError("array dtype is not compatible")
+    _flat = out._is_contiguous()
+    for array in arrays:
+        if tuple(array._shape) != shape or not array._is_contiguous():
+            _flat = False
+    if _flat:
+        expr = flat
+        args = [_size(shape), out._data._data]
+        args.extend([array._data._data for array in arrays])
+    else:
+        expr = strided
+        args = [_jsarray(shape), out._data._data, out._offset, _jsarray(out._indices)]
+        for array in arrays:
+            args.extend([array._data._data, array._offset,
+                         _jsarray(_broadcast_strides(array._shape, array._indices, shape))])
+    args.extend(scalars)
+    key = 'lazy|%s|%s|%s|%s' % (expr, ','.join([array._dtype for array in arrays]), dtype, _flat)
+    kernel = _compile_kernel(key, len(arrays), len(scalars), expr, _flat)
+    args = _jsarray(args)
+    JS("@{{kernel}}.apply(null, @{{args}});")
+    out._modified()
+    return out
+
+
+def _fused(template, operands, dtype, out=None):
+    """
+    Return array of the JavaScript expression template evaluated elementwise in a single loop.
+    Each %s of template takes the next operand, an Ndarray or a scalar.
+    """
+    arrays, scalars, flat, strided = [], [], [], []
+    for operand in operands:
+        if isinstance(operand, Ndarray):
+            flat.append('a%d[i]' % len(arrays))
+            strided.append('a%d[p%d]' % (len(arrays), len(arrays)))
+            arrays.append(operand)
+        else:
+            flat.append('s%d' % len(scalars))
+            strided.append('s%d' % len(scalars))
+            scalars.append(operand)
+    return _evaluate(template % tuple(flat), template % tuple(strided), arrays, scalars, dtype, out)
+
+
 class Ndarray(object):
 
     __typedarray = { 'uint8c':  Uint8ClampedArray,
@@ -430,7 +2810,11 @@ class Ndarray(object):
                  'int32':'int32', 'i':'int32', 6:'int32',
                  'uint32':'uint32', 'I':'uint32', 3:'uint32',
                  'float32':'float32', 'f':'float32', 7:'float32',
-                 'float64':'float64', 'd':'float64', 8:'float64' }
+                 'float64':'float64', 'd':'float64', 8:'float64',
+                 'i1':'int8', 'u1':'uint8', 'i2':'int16', 'u2':'uint16',
+                 'i4':'int32', 'u4':'uint32', 'f4':'float32', 'f8':'float64' }
+
+    _mask = False
 
     def __init__(self, dim, dtype='float64'):
         """
@@ -446,39 +2830,35 @@ class Ndarray(object):
                 'uint32'    Uint32Array
                 'float32'   Float32Array
                 'float64'   Float64Array
+        The numpy codes 'i1', 'u1', 'i2', 'u2', 'i4', 'u4', 'f4' and 'f8' are also accepted.
         """
         self._dtype = self.__dtypes[dtype]
         typedarray = self.__typedarray[self._dtype]
+        self._offset = 0
         if isinstance(dim, tuple):
-            size = 1
-            for i in dim:
-                size *= i
-            self._data = typedarray(size)
+            self._data = typedarray(_size(dim))
             self._shape = dim
-            indices = []
-            for i in self._shape:
-                size /= i
-                indices.append(size)
-            self._indices = tuple(indices)
+            self._indices = _strides(dim)
         elif isinstance(dim, int):
             self._data = typedarray(dim)
             self._shape = (dim,)
-            self._indices = (self._shape[0],)
+            self._indices = (1,)
         elif isinstance(dim, list):
             if not (len(dim)>0 and isinstance(dim[0], list)):
                 self._data = typedarray(dim)
                 self._shape = (len(dim),)
-                self._indices = (self._shape[0],)
+                self._indices = (1,)
             else:
                 _dat = self._lflatten(dim)
                 _dim = self._lshape(dim)
                 self._data = typedarray(list(_dat))
                 self._shape = (len(self._data),)
+                self._indices = (1,)
                 self.setshape(tuple(_dim))
         else:
             self._data = dim
             self._shape = (len(dim),)
-            self._indices = (self._shape[0],)
+            self._indices = (1,)
 
     def getshape(self):
         """
@@ -498,27 +2878,19 @@ class Ndarray(object):
         """
         if isinstance(dim[0], tuple):
             dim = dim[0]
-        size = 1
-        for i in dim:
-            size *= i
-        array_size = 1
-        for i in self._shape:
-            array_size *= i
-        if size != array_size:
+        if _size(dim) != _size(self._shape):
             raise TypeError("array size cannot change")
+        if not self._is_contiguous():
+            raise TypeError("array shape of non-contiguous view cannot change")
         self._shape = dim
-        indices = []
-        for i in self._shape:
-            size /= i
-            indices.append(size)
-        self._indices = tuple(indices)
+        self._indices = _strides(dim)
         return None
 
     shape = property(getshape, setshape)
 
     def _lflatten(self, l):
         for el in l:
-            if isinstance(el, list):
+            if isinstance(el, (list,tuple)):
                 for _l in self._lflatten(el):
                     yield _l
             else:
@@ -530,106 +2902,350 @@ class Ndarray(object):
             yield len(_l)
             _l = _l[0]
 
-    def __getitem__(self, index):
-        if hasattr(index, '__len__'):
-            indexLn, shapeLn = index.__len__(), len(self._shape)
-            if indexLn == shapeLn:
-                return self._data[sum([index[i]*self._indices[i] for i in range(indexLn)])]
+    def _index(self, index):
+        if not isinstance(index, (list,tuple)):
+            index = (index,)
+        if len(index) > len(self._shape):
+            raise IndexError("too many indices for array")
+        offset = self._offset
+        shape = []
+        indices = []
+        axis = 0
+        for i in index:
+            dim = self._shape[axis]
+            stride = self._indices[axis]
+            if isinstance(i, slice):
+                start, length, step = _slice_range(i.start, i.stop, i.step, dim)
+                offset += start * stride
+                shape.append(length)
+                indices.append(stride * step)
             else:
-                begin = sum([index[i]*self._indices[i] for i in range(indexLn)])
-                end = begin + self._indices[indexLn-1]
-                subarray = self._data.subarray(begin, end)
-                array = Ndarray(subarray, self._dtype)
-                array._shape = self._shape[indexLn:]
-                array._indices = self._indices[indexLn:]
-                return array
-        else:
-            if len(self._shape) == 1:
-                return self._data[index]
+                if i < 0:
+                    i += dim
+                if i < 0 or i >= dim:
+                    raise IndexError("index out of range")
+                offset += i * stride
+            axis += 1
+        shape.extend(self._shape[axis:])
+        indices.extend(self._indices[axis:])
+        return tuple(shape), tuple(indices), offset
+
+    def _view(self, shape, indices, offset):
+        array = Ndarray(self._data, self._dtype)
+        array._shape = shape
+        array._indices = indices
+        array._mask = self._mask
+        if _contiguous(shape, indices):
+            array._data = self._data.subarray(offset, offset+_size(shape))
+        else:
+            array._offset = offset
+        return array
+
+    def _is_contiguous(self):
+        return self._offset == 0 and _contiguous(self._shape, self._indices)
+
+    def _modified(self):
+        return None
+
+    def _ascontiguous(self):
+        if self._is_contiguous():
+            return self
+        else:
+            return self.copy()
+
+    def _assign(self, value):
+        if hasattr(value, '__iter__'):
+            if isinstance(value, (list,tuple)):
+                value = Ndarray(list(self._lflatten(value)), self._dtype)
             else:
-                begin = index * self._indices[0]
-                end = begin + self._indices[0]
-                subarray = self._data.subarray(begin, end)
-                array = Ndarray(subarray, self._dtype)
-                array._shape = self._shape[1:]
-                array._indices = self._indices[1:]
-                return array
+                value = self._get_array(value)
+            if value._shape != self._shape and _size(value._shape) == _size(self._shape):
+                value = value.reshape(self._shape)
+        self._elementwise('assign', value, self)
+        return None
+
+    def __getitem__(self, index):
+        if isinstance(index, int) and len(self._shape) == 1:
+            if index < 0:
+                index += self._shape[0]
+            return self._data[self._offset + index*self._indices[0]]
+        if isinstance(index, tuple) and len(index) == len(self._shape):
+            offset = self._scalar_offset(index)
+            if offset >= 0:
+                return self._data[offset]
+        if self._is_fancy(index):
+            return self._fancy(index)
+        shape, indices, offset = self._index(index)
+        if not shape:
+            return self._data[offset]
+        return self._view(shape, indices, offset)
 
     def __setitem__(self, index, value):
-        def unpack(obj, lst=None):
-            if lst is None:
-                lst = []
-            for element in obj:
-                if isinstance(element, (list,tuple)):
-                    unpack(element, lst)
-                else:
-                    lst.append(element)
-            return lst
-        if hasattr(index, '__len__'):
-            indexLn, shapeLn = index.__len__(), len(self._shape)
-            if indexLn == shapeLn:
-                self._data[sum([index[i]*self._indices[i] for i in range(indexLn)])] = value
+        if isinstance(index, int) and len(self._shape) == 1:
+            if index < 0:
+                index += self._shape[0]
+            self._data[self._offset + index*self._indices[0]] = value
+            return None
+        if isinstance(index, tuple) and len(index) == len(self._shape):
+            offset = self._scalar_offset(index)
+            if offset >= 0:
+                self._data[offset] = value
+                return None
+        if self._is_fancy(index):
+            self._fancy(index, value, True)
+            return None
+        shape, indices, offset = self._index(index)
+        if not shape:
+            self._data[offset] = value
+        else:
+            self._view(shape, indices, offset)._assign(value)
+        return None
+
+    def _scalar_offset(self, index):
+        offset = self._offset
+        axis = 0
+        for i in index:
+            if not isinstance(i, int):
+                return -1
+            dim = self._shape[axis]
+            if i < 0:
+                i += dim
+            if i < 0 or i >= dim:
+                raise IndexError("index out of range")
+            offset += i * self._indices[axis]
+            axis += 1
+        return offset
+
+    def _is_fancy(self, index):
+        if isinstance(index, (Ndarray, BitSet, TypedArray)):
+            return True
+        if isinstance(index, tuple):
+            for i in index:
+                if isinstance(i, (Ndarray, TypedArray)):
+                    return True
+        return False
+
+    def _indexarray(self, indices):
+        if isinstance(indices, Ndarray):
+            if 'int' not in indices._dtype:
+                raise IndexError("arrays used as indices must be of integer type")
+            return indices._ascontiguous()._data._data, tuple(indices._shape)
+        if isinstance(indices, TypedArray):
+            return indices._data, (len(indices),)
+        if isinstance(indices, int):
+            return Int32Array([indices])._data, ()
+        indices = Int32Array(list(indices))
+        return indices._data, (len(indices),)
+
+    def _fancy(self, index, value=None, assign=False):
+        if isinstance(index, BitSet) or (isinstance(index, Ndarray) and index._mask):
+            return self._masked(index, value, assign)
+        if not isinstance(index, tuple):
+            if not assign:
+                return self.take(index, 0)
+            if len(self._shape) > 1:
+                idx, ishape = self._indexarray(index)
+                n = _size(ishape)
+                values = None
+                if hasattr(value, '__iter__'):
+                    shape = ishape + tuple(self._shape[1:])
+                    value = self._get_array(value)
+                    if tuple(value._shape) != shape or not value._is_contiguous():
+                        array = Ndarray(shape, self._dtype)
+                        array._elementwise('assign', value, array)
+                        value = array
+                    values, value = value._data._data, 0
+                elif not pyjs_mode.optimized:
+                    value = value.valueOf()
+                x, xo = self._data._data, self._offset
+                _shape, _strides = _jsarray(self._shape), _jsarray(self._indices)
+                if JS("@{{_kernel_scatter}}(@{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{idx}}, @{{n}}, @{{values}}, @{{value}})") < 0:
+                    raise IndexError("index out of range")
+                self._modified()
+                return None
+            index = (index,)
+        if len(index) != len(self._shape):
+            raise IndexError("index arrays must index every dimension")
+        arrays, shape = [], ()
+        for i in index:
+            data, ishape = self._indexarray(i)
+            if ishape and shape and ishape != shape:
+                raise IndexError("index arrays must have the same shape")
+            if ishape:
+                shape = ishape
+            arrays.append((data, ishape))
+        n = _size(shape)
+        coords = []
+        for data, ishape in arrays:
+            if not ishape and shape:
+                data = Int32Array([JS("@{{data}}[0]")] * n)._data
+            coords.append(data)
+        x, xo = self._data._data, self._offset
+        _shape, _strides, coords = _jsarray(self._shape), _jsarray(self._indices), _jsarray(coords)
+        if assign:
+            values = None
+            if hasattr(value, '__iter__'):
+                values = self._get_array(value)._ascontiguous()._data._data
+            elif not pyjs_mode.optimized:
+                value = value.valueOf()
+            self._modified()
+            count = JS("@{{_kernel_gather}}('set', @{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{coords}}, @{{n}}, @{{values}}, @{{value}}, null)")
+            out = None
+        else:
+            if shape:
+                out = Ndarray(shape, self._dtype)
             else:
-                begin = sum([index[i]*self._indices[i] for i in range(indexLn)])
-                end = begin + self._indices[indexLn-1]
-                subarray = self._data.subarray(begin, end)
-                if isinstance(value, Ndarray):
-                    value = value._data
-                else:
-                    if isinstance(value[0], (list,tuple)):
-                        value = unpack(value)
-                subarray.set(value)
+                out = Ndarray(1, self._dtype)
+            z = out._data._data
+            count = JS("@{{_kernel_gather}}('get', @{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{coords}}, @{{n}}, null, 0, @{{z}})")
+            if not shape:
+                out = out[0]
+        if count < 0:
+            raise IndexError("index out of range")
+        return out
+
+    def take(self, indices, axis=None):
+        """
+        Return array of elements gathered at indices along axis.
+        Argument indices is an int, sequence, Int32Array or integer Ndarray, negative indices count from the end.
+        Optional argument axis, default takes from the flattened array.
+        """
+        array = self._ascontiguous()
+        if axis is None:
+            shape, axis = (_size(array._shape),), 0
+        else:
+            shape = tuple(array._shape)
+            if axis < 0:
+                axis += len(shape)
+            if axis < 0 or axis >= len(shape):
+                raise ValueError("axis out of range")
+        idx, ishape = self._indexarray(indices)
+        n = _size(ishape)
+        oshape = shape[:axis] + ishape + shape[axis+1:]
+        if oshape:
+            out = Ndarray(oshape, self._dtype)
+        else:
+            out = Ndarray(1, self._dtype)
+        dim, inner, outer = shape[axis], _size(shape[axis+1:]), _size(shape[:axis])
+        x, z = array._data._data, out._data._data
+        if JS("@{{_kernel_take}}(@{{x}}, @{{dim}}, @{{inner}}, @{{outer}}, @{{idx}}, @{{n}}, @{{z}})") < 0:
+            raise IndexError("index out of range")
+        if not oshape:
+            return out[0]
+        return out
+
+    def put(self, indices, values):
+        """
+        Set elements at flat indices to values, which are repeated if shorter than indices.
+        Argument indices is an int, sequence, Int32Array or integer Ndarray, negative indices count from the end.
+        """
+        idx, ishape = self._indexarray(indices)
+        n = _size(ishape)
+        value = 0
+        if hasattr(values, '__iter__'):
+            values = self._get_array(values)._ascontiguous()._data._data
         else:
-            if len(self._shape) == 1:
-                self._data[index] = value
+            value, values = values, None
+            if not pyjs_mode.optimized:
+                value = value.valueOf()
+        x, xo = self._data._data, self._offset
+        _shape, _strides = _jsarray(self._shape), _jsarray(self._indices)
+        if JS("@{{_kernel_put}}(@{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{idx}}, @{{n}}, @{{values}}, @{{value}})") < 0:
+            raise IndexError("index out of range")
+        self._modified()
+        return None
+
+    def _masked(self, mask, value=None, assign=False):
+        if isinstance(mask, BitSet):
+            data, bits = mask._data._data, mask._bit
+        elif mask._dtype in ('uint8', 'uint8c') and tuple(mask._shape) == tuple(self._shape):
+            data, bits = mask._ascontiguous()._data._data, 0
+        else:
+            raise IndexError("mask must be a uint8 mask array of the array shape or a BitSet")
+        x, xo = self._data._data, self._offset
+        shape, strides = _jsarray(self._shape), _jsarray(self._indices)
+        count = JS("@{{_kernel_mask}}('count', @{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, @{{data}}, @{{bits}}, null, 0, null)")
+        if not assign:
+            out = Ndarray(count, self._dtype)
+            z = out._data._data
+            JS("@{{_kernel_mask}}('get', @{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, @{{data}}, @{{bits}}, null, 0, @{{z}})")
+            return out
+        values = None
+        if hasattr(value, '__iter__'):
+            value = self._get_array(value)
+            if _size(value._shape) == 1:
+                value = value._ascontiguous()._data[0]
+            elif _size(value._shape) != count:
+                raise ValueError("value array size does not match number of masked elements")
             else:
-                begin = index * self._indices[0]
-                end = begin + self._indices[0]
-                subarray = self._data.subarray(begin, end)
-                if isinstance(value, Ndarray):
-                    value = value._data
-                else:
-                    if isinstance(value[0], (list,tuple)):
-                        value = unpack(value)
-                subarray.set(value)
+                values = value._ascontiguous()._data._data
+        if values is None and not pyjs_mode.optimized:
+            value = value.valueOf()
+        self._modified()
+        JS("@{{_kernel_mask}}('set', @{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, @{{data}}, @{{bits}}, @{{values}}, @{{value}}, null)")
         return None
 
+    def compress(self, condition, axis=None):
+        """
+        Return array of the slices along axis where condition is nonzero.
+        Argument condition is a 1D sequence, default axis selects from the flattened array.
+        """
+        condition = np._array(condition)
+        if len(condition._shape) != 1:
+            raise ValueError("condition must be a 1D array")
+        if axis is None:
+            length = _size(self._shape)
+        else:
+            if axis < 0:
+                axis += len(self._shape)
+            if axis < 0 or axis >= len(self._shape):
+                raise ValueError("axis out of range")
+            length = self._shape[axis]
+        x, xo = condition._data._data, condition._offset
+        shape, strides = _jsarray(condition._shape), _jsarray(condition._indices)
+        count = JS("@{{_kernel_nonzero}}(@{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, null)")
+        indices = Ndarray(int(count), 'int32')
+        coords = _jsarray([indices._data._data])
+        JS("@{{_kernel_nonzero}}(@{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, @{{coords}})")
+        if count and indices[int(count)-1] >= length:
+            raise IndexError("condition is longer than array size")
+        return self.take(indices, axis)
+
     def __getslice__(self, lower, upper):
-        subarray = self._data.subarray(lower, upper)
-        return Ndarray(subarray, self._dtype)
+        start, length, step = _slice_range(lower, upper, 1, self._shape[0])
+        offset = self._offset + start*self._indices[0]
+        return self._view((length,)+tuple(self._shape[1:]), self._indices, offset)
 
     def __setslice__(self, lower, upper, data):
-        subarray = self._data.subarray(lower, upper)
-        subarray.set(data)
+        self.__getslice__(lower, upper)._assign(data)
         return None
 
     def __iter__(self):
         if len(self._shape) > 1:
             index = 0
+            shape = self._shape[1:]
+            indices = self._indices[1:]
             while index < self._shape[0]:
-                begin = index * self._indices[0]
-                end = begin + self._indices[0]
-                subarray = self._data.subarray(begin, end)
-                array = Ndarray(subarray, self._dtype)
-                array._shape = self._shape[1:]
-                array._indices = self._indices[1:]
-                yield array
+                yield self._view(shape, indices, self._offset + index*self._indices[0])
                 index += 1
         else:
             index = 0
+            offset = self._offset
+            stride = self._indices[0]
             while index < self._shape[0]:
-                yield self._data[index]
+                yield self._data[offset + index*stride]
                 index += 1
 
     def _array_dim(self):
         if 'int' in self._dtype:
-            vmax = len(str(max(self._data)))
-            vmin = len(str(min(self._data)))
-            vlen = {True:vmax, False:vmin}[vmax>vmin]
+            vmax = len(str(self.max()))
+            vmin = len(str(self.min()))
             vfmt = '%*d'
         else:
-            vlen = max([len('%0.4f'%v) for v in self._data])
+            vmax = len('%0.4f'%self.max())
+            vmin = len('%0.4f'%self.min())
             vfmt = '%*.4f'
+        vlen = {True:vmax, False:vmin}[vmax>vmin]
         return vlen, vfmt
 
     def _array_str(self, array, vlen, vfmt, vstr):
@@ -670,486 +3286,427 @@ class Ndarray(object):
         return self._shape[0]
 
     def __lt__(self, other):
-        ndarray = Ndarray(len(self._data), 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] < other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] < other_data[i]
-        return ndarray
+        return self._elementwise('lt', other, dtype='uint8')
 
     def __le__(self, other):
-        ndarray = Ndarray(self._shape, 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] <= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] <= other_data[i]
-        return ndarray
-    
+        return self._elementwise('le', other, dtype='uint8')
+
     def __eq__(self, other):
-        ndarray = Ndarray(self._shape, 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] == other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] == other_data[i]
-        return ndarray
-    
+        return self._elementwise('eq', other, dtype='uint8')
+
     def __ne__(self, other):
-        ndarray = Ndarray(self._shape, 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] != other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] != other_data[i]
-        return ndarray
-    
+        return self._elementwise('ne', other, dtype='uint8')
+
     def __gt__(self, other):
-        ndarray = Ndarray(self._shape, 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] > other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] > other_data[i]
-        return ndarray
+        return self._elementwise('gt', other, dtype='uint8')
 
     def __ge__(self, other):
-        ndarray = Ndarray(self._shape, 'uint8')
-        ndarray._shape = self._shape
-        ndarray._indices = self._indices
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] >= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] >= other_data[i]
-        return ndarray
+        return self._elementwise('ge', other, dtype='uint8')
 
     def __add__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] + other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] + other_data[i]
-        return ndarray
+        return self._elementwise('add', other)
 
     def __sub__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] - other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] - other_data[i]
-        return ndarray
+        return self._elementwise('sub', other)
 
     def __mul__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] * other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] * other_data[i]
-        return ndarray
+        return self._elementwise('mul', other)
 
     def __div__(self, other):
         return self.__truediv__(other)
 
     def __truediv__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] / other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] / other_data[i]
-        return ndarray
+        return self._elementwise('truediv', other)
 
     def __floordiv__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] // other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] // other_data[i]
-        return ndarray
+        return self._elementwise('floordiv', other)
 
     def __divmod__(self, other):
         return self.__floordiv__(other), self.__mod__(other)
 
     def __mod__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] % other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] % other_data[i]
-        return ndarray
+        return self._elementwise('mod', other)
 
     def __pow__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] ** other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] ** other_data[i]
-        return ndarray
+        return self._elementwise('pow', other)
 
     def __neg__(self):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        for i in range(len(data)):
-            ndarray_data[i] = -data[i]
-        return ndarray
+        return self._elementwise('neg', 0)
 
     def __pos__(self):
         ndarray = self.copy()
         return ndarray
 
     def __abs__(self):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        for i in range(len(data)):
-            if data[i] < 0:
-                ndarray_data[i] = -data[i]
-        return ndarray
+        return self._elementwise('abs', 0)
 
     def __matmul__(self, other):
-        _other = self._get_array(other)
-        x_dim = len(self._shape)
-        y_dim = len(_other._shape)
-        if x_dim != y_dim:
-            raise ValueError('incompatible array shapes for matmul')
-        if x_dim == 1:
-            if self._shape[0] == _other._shape[0]:
-                data = self._data
-                other_data = _other._data
-                result = 0
-                for i in range(len(data)):
-                    result += (data[i] * other_data[i])
-                return result
-            else:
-                raise ValueError('incompatible array shapes for matmul')
-        xshape = self._shape[-2:]
-        yshape = _other._shape[-2:]
-        if xshape[1] == yshape[0]:
-            m = xshape[1]
-            n = xshape[0]
-            p = yshape[1]
-            d = self._shape[:-2]
-            d_len = 1
-            for v in d:
-                d_len*=v
-        else:
-            raise ValueError('incompatible array shapes for matmul')
-        _data = self._data.__class__(d_len*n*p)
-        array = Ndarray(_data, self._dtype)
-        array.setshape(d+(n,p))
-        if x_dim == 2:
-            arrays = [(self, _other, array)]
-        elif x_dim == 3:
-            arrays = [(self[i], _other[i], array[i])
-              for i in range(d[0])]
-        elif x_dim == 4:
-            arrays = [(self[i,j], _other[i,j], array[i,j])
-              for i,j in [(i,j) for i in range(d[0]) for j in range(d[1])]]
-        elif x_dim == 5:
-            arrays = [(self[i,j,k], _other[i,j,k], array[i,j,k])
-              for i,j,k in [(i,j,k) for i in range(d[0]) for j in range(d[1]) for k in range(d[2])]]
-        else:
-            raise ValueError('incompatible array shapes for matmul')
-        for _x, _y, _array in arrays:
-            _x_data = _x._data
-            _y_data = _y._data
-            _array_data = _array._data
-            for i in range(n):
-                for j in range(p):
-                    result = 0
-                    for k in range(m):
-                        result += (_x_data[i*m+k] * _y_data[k*p+j])
-                    _array_data[i*p+j] = result
-        return array
+        return self._matmul(other, None, False)
 
     def __iadd__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] += other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] += other_data[i]
-        return self
+        return self._elementwise('add', other, self)
 
     def __isub__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] -= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] -= other_data[i]
-        return self
+        return self._elementwise('sub', other, self)
 
     def __imul__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] *= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] *= other_data[i]
-        return self
+        return self._elementwise('mul', other, self)
 
     def __idiv__(self, other):
         return self.__itruediv__(other)
 
     def __itruediv__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] /= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] /= other_data[i]
-        return self
+        return self._elementwise('truediv', other, self)
 
     def __ifloordiv__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] //= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] //= other_data[i]
-        return self
+        return self._elementwise('floordiv', other, self)
 
     def __imod__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] %= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] %= other_data[i]
-        return self
+        return self._elementwise('mod', other, self)
 
     def __ipow__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] **= other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] **= other_data[i]
-        return self
+        return self._elementwise('pow', other, self)
 
     def __lshift__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] << other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] << other_data[i]
-        return ndarray
+        return self._elementwise('lshift', other)
 
     def __rshift__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] >> other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] >> other_data[i]
-        return ndarray
+        return self._elementwise('rshift', other)
 
     def __and__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] & other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] & other_data[i]
-        return ndarray
+        return self._elementwise('and', other)
 
     def __or__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] | other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] | other_data[i]
-        return ndarray
+        return self._elementwise('or', other)
 
     def __xor__(self, other):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] ^ other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                ndarray_data[i] = data[i] ^ other_data[i]
-        return ndarray
+        return self._elementwise('xor', other)
 
     def __ilshift__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] = data[i] << other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] = data[i] << other_data[i]
-        return self
+        return self._elementwise('lshift', other, self)
 
     def __irshift__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] = data[i] >> other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] = data[i] >> other_data[i]
-        return self
+        return self._elementwise('rshift', other, self)
 
     def __iand__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] = data[i] & other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] = data[i] & other_data[i]
-        return self
+        return self._elementwise('and', other, self)
 
     def __ior__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] = data[i] | other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] = data[i] | other_data[i]
-        return self
+        return self._elementwise('or', other, self)
 
     def __ixor__(self, other):
-        data = self._data
-        if not hasattr(other, '__iter__'):
-            for i in range(len(data)):
-                data[i] = data[i] ^ other
-        else:
-            other_data = self._get_data(other)
-            for i in range(len(data)):
-                data[i] = data[i] ^ other_data[i]
-        return self
+        return self._elementwise('xor', other, self)
 
     def __invert__(self):
-        ndarray = self.empty()
-        ndarray_data = ndarray._data
-        data = self._data
-        for i in range(len(data)):
-            ndarray_data[i] = ~data[i]
-        return ndarray
-
-    def _get_data(self, other):
-        if not isinstance(other, Ndarray):
-            if isinstance(other, list):
-                other = Ndarray(other, self._dtype)
-            else:
-                other = Ndarray(list(other), self._dtype)
-        if self._shape != other._shape:
+        return self._elementwise('invert', 0)
+
+    def _elementwise(self, op, other, out=None, dtype=None):
+        if dtype is None:
+            dtype = self._dtype
+        if op == 'rshift' and dtype.startswith('uint'):
+            op = 'urshift'
+        scalar = not hasattr(other, '__iter__')
+        if scalar:
+            shape = tuple(self._shape)
+            ydtype = None
+            if not pyjs_mode.optimized:
+                other = other.valueOf()
+        else:
+            other = self._get_array(other)
+            shape = _broadcast_shape(self._shape, other._shape)
+            ydtype = other._dtype
+        if out is None:
+            out = Ndarray(shape, dtype)
+        elif tuple(out._shape) != shape:
             raise TypeError("array shapes are not compatible")
-        return other._data
+        elif out._dtype != dtype:
+            raise TypeError("array dtype is not compatible")
+        if op != 'assign':
+            out._mask = (op in ('lt', 'le', 'eq', 'ne', 'gt', 'ge')
+                         or (op in ('and', 'or', 'xor') and not scalar and self._mask and other._mask))
+        out._modified()
+        x, z = self._data._data, out._data._data
+        if (tuple(self._shape) == shape and self._is_contiguous()
+                and out._is_contiguous()
+                and (scalar or (tuple(other._shape) == shape
+                                and other._is_contiguous()))):
+            kernel = _op_kernel(op, dtype, self._dtype, ydtype, True)
+            n = _size(shape)
+            if scalar:
+                JS("@{{kernel}}(@{{n}}, @{{z}}, @{{x}}, @{{other}});")
+            else:
+                y = other._data._data
+                JS("@{{kernel}}(@{{n}}, @{{z}}, @{{x}}, @{{y}});")
+            return out
+        kernel = _op_kernel(op, dtype, self._dtype, ydtype, False)
+        zo, zs = out._offset, _jsarray(out._indices)
+        xo = self._offset
+        xs = _jsarray(_broadcast_strides(self._shape, self._indices, shape))
+        _shape = _jsarray(shape)
+        if scalar:
+            JS("@{{kernel}}(@{{_shape}}, @{{z}}, @{{zo}}, @{{zs}}, @{{x}}, @{{xo}}, @{{xs}}, @{{other}});")
+        else:
+            y, yo = other._data._data, other._offset
+            ys = _jsarray(_broadcast_strides(other._shape, other._indices, shape))
+            JS("@{{kernel}}(@{{_shape}}, @{{z}}, @{{zo}}, @{{zs}}, @{{x}}, @{{xo}}, @{{xs}}, @{{y}}, @{{yo}}, @{{ys}});")
+        return out
+
+    def _reduce(self, op, axis, keepdims, dtype, ddof=0):
+        if axis is None:
+            array = self._ascontiguous()
+            x, xo = array._data._data, 0
+            length, step = _size(self._shape), 1
+            oshape, ostrides = (), ()
+            if keepdims:
+                shape = (1,) * len(self._shape)
+            else:
+                shape = ()
+        else:
+            if axis < 0:
+                axis += len(self._shape)
+            if axis < 0 or axis >= len(self._shape):
+                raise ValueError("axis out of range")
+            x, xo = self._data._data, self._offset
+            length, step = self._shape[axis], self._indices[axis]
+            oshape = tuple(self._shape[:axis]) + tuple(self._shape[axis+1:])
+            ostrides = tuple(self._indices[:axis]) + tuple(self._indices[axis+1:])
+            if keepdims:
+                shape = tuple(self._shape[:axis]) + (1,) + tuple(self._shape[axis+1:])
+            else:
+                shape = oshape
+        if length == 0 and op in ('min', 'max', 'argmin', 'argmax'):
+            raise ValueError("zero-size array to reduction operation")
+        if shape:
+            out = Ndarray(tuple(shape), dtype)
+        else:
+            out = Ndarray(1, dtype)
+        func = JS("@{{_reduce_ops}}[@{{op}}]")
+        compensated = 'float' in self._dtype
+        if not pyjs_mode.optimized:
+            ddof = ddof.valueOf()
+        z = out._data._data
+        _oshape, _ostrides = _jsarray(oshape), _jsarray(ostrides)
+        JS("@{{_kernel_reduce}}(@{{func}}, @{{compensated}}, @{{ddof}}, @{{x}}, @{{xo}}, @{{length}}, @{{step}}, @{{_oshape}}, @{{_ostrides}}, @{{z}});")
+        if shape:
+            return out
+        return out[0]
+
+    def _reduce_dtype(self):
+        if 'float' in self._dtype:
+            return self._dtype
+        return 'float64'
+
+    def sum(self, axis=None, keepdims=False):
+        """
+        Return sum of array elements.
+        Optional argument axis to sum along, default sums all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Integer arrays are summed in float64, float arrays use compensated summation.
+        """
+        result = self._reduce('sum', axis, keepdims, self._reduce_dtype())
+        if not isinstance(result, Ndarray) and 'int' in self._dtype:
+            result = int(result)
+        return result
+
+    def prod(self, axis=None, keepdims=False):
+        """
+        Return product of array elements.
+        Optional argument axis to multiply along, default multiplies all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        """
+        result = self._reduce('prod', axis, keepdims, self._reduce_dtype())
+        if not isinstance(result, Ndarray) and 'int' in self._dtype:
+            result = int(result)
+        return result
+
+    def mean(self, axis=None, keepdims=False):
+        """
+        Return mean of array elements.
+        Optional argument axis to average along, default averages all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Returns NaN if there are no elements to average.
+        """
+        result = self._reduce('sum', axis, keepdims, self._reduce_dtype())
+        if axis is None:
+            count = _size(self._shape)
+        else:
+            count = self._shape[axis]
+        if count == 0:
+            if isinstance(result, Ndarray):
+                result.fill(JS("NaN"))
+                return result
+            return JS("NaN")
+        if isinstance(result, Ndarray):
+            return result._elementwise('truediv', count, result)
+        return result / count
+
+    def min(self, axis=None, keepdims=False):
+        """
+        Return minimum of array elements, NaN if any element is NaN.
+        Optional argument axis to reduce along, default reduces all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Raises ValueError if the array is empty.
+        """
+        return self._reduce('min', axis, keepdims, self._dtype)
+
+    def max(self, axis=None, keepdims=False):
+        """
+        Return maximum of array elements, NaN if any element is NaN.
+        Optional argument axis to reduce along, default reduces all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Raises ValueError if the array is empty.
+        """
+        return self._reduce('max', axis, keepdims, self._dtype)
+
+    def argmin(self, axis=None, keepdims=False):
+        """
+        Return index of minimum array element, the first NaN if any element is NaN.
+        Optional argument axis to reduce along, default returns the flat index.
+        Optional argument keepdims retains reduced axis with size 1.
+        Raises ValueError if the array is empty.
+        """
+        result = self._reduce('argmin', axis, keepdims, 'int32')
+        if not isinstance(result, Ndarray):
+            result = int(result)
+        return result
+
+    def argmax(self, axis=None, keepdims=False):
+        """
+        Return index of maximum array element, the first NaN if any element is NaN.
+        Optional argument axis to reduce along, default returns the flat index.
+        Optional argument keepdims retains reduced axis with size 1.
+        Raises ValueError if the array is empty.
+        """
+        result = self._reduce('argmax', axis, keepdims, 'int32')
+        if not isinstance(result, Ndarray):
+            result = int(result)
+        return result
+
+    def var(self, axis=None, keepdims=False, ddof=0):
+        """
+        Return variance of array elements.
+        Optional argument axis to reduce along, default reduces all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Optional argument ddof is the delta degrees of freedom.
+        """
+        return self._reduce('var', axis, keepdims, self._reduce_dtype(), ddof)
+
+    def std(self, axis=None, keepdims=False, ddof=0):
+        """
+        Return standard deviation of array elements.
+        Optional argument axis to reduce along, default reduces all elements.
+        Optional argument keepdims retains reduced axis with size 1.
+        Optional argument ddof is the delta degrees of freedom.
+        """
+        result = self._reduce('var', axis, keepdims, self._reduce_dtype(), ddof)
+        if isinstance(result, Ndarray):
+            return result._elementwise('pow', 0.5, result)
+        return result ** 0.5
+
+    def _scan(self, op, axis, dtype):
+        if dtype is None:
+            dtype = self._reduce_dtype()
+        if axis is None:
+            array = self._ascontiguous()
+            x, xo = array._data._data, 0
+            shape, strides, axis = (_size(self._shape),), (1,), 0
+        else:
+            if axis < 0:
+                axis += len(self._shape)
+            if axis < 0 or axis >= len(self._shape):
+                raise ValueError("axis out of range")
+            x, xo = self._data._data, self._offset
+            shape, strides = tuple(self._shape), tuple(self._indices)
+        out = Ndarray(shape, dtype)
+        z = out._data._data
+        _shape, _strides = _jsarray(shape), _jsarray(strides)
+        JS("@{{_kernel_scan}}(@{{op}}, @{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{axis}}, @{{z}});")
+        return out
+
+    def cumsum(self, axis=None, dtype=None):
+        """
+        Return cumulative sum of array elements.
+        Optional argument axis to accumulate along, default accumulates the flattened array.
+        Optional argument dtype of the result, integer arrays default to float64.
+        """
+        return self._scan('sum', axis, dtype)
+
+    def cumprod(self, axis=None, dtype=None):
+        """
+        Return cumulative product of array elements.
+        Optional argument axis to accumulate along, default accumulates the flattened array.
+        Optional argument dtype of the result, integer arrays default to float64.
+        """
+        return self._scan('prod', axis, dtype)
+
+    def _sortlanes(self, op, axis, kth=None):
+        if axis < 0:
+            axis += len(self._shape)
+        if axis < 0 or axis >= len(self._shape):
+            raise ValueError("axis out of range")
+        if kth is not None:
+            dim = self._shape[axis]
+            if not hasattr(kth, '__iter__'):
+                kth = [kth]
+            kths = []
+            for k in kth:
+                if k < 0:
+                    k += dim
+                if k < 0 or k >= dim:
+                    raise ValueError("kth out of range")
+                kths.append(k)
+            kths.sort()
+            kth = _jsarray(kths)
+        out, z = None, None
+        if op in ('argsort', 'argpartition'):
+            out = Ndarray(tuple(self._shape), 'int32')
+            z = out._data._data
+        x, xo = self._data._data, self._offset
+        _shape, _strides = _jsarray(self._shape), _jsarray(self._indices)
+        JS("@{{_kernel_sort}}(@{{op}}, @{{x}}, @{{xo}}, @{{_shape}}, @{{_strides}}, @{{axis}}, @{{z}}, @{{kth}});")
+        if out is None:
+            self._modified()
+        return out
+
+    def _flattened(self):
+        array = self._ascontiguous()
+        return array.reshape((_size(array._shape),))
+
+    def sort(self, axis=-1):
+        """
+        Sort array in place along axis, default the last axis.
+        Lanes are sorted numerically by the native TypedArray sort, NaN sorts last.
+        """
+        self._sortlanes('sort', axis)
+        return None
+
+    def argsort(self, axis=-1):
+        """
+        Return int32 array of indices that sort the array along axis, default the last axis.
+        Equal elements keep their order, NaN sorts last. Axis None sorts the flattened array.
+        """
+        if axis is None:
+            return self._flattened()._sortlanes('argsort', 0)
+        return self._sortlanes('argsort', axis)
+
+    def partition(self, kth, axis=-1):
+        """
+        Partition array in place along axis so the element at index kth is in its sorted position.
+        Smaller elements move before it and larger elements after it, in no particular order.
+        Argument kth is an int or sequence of ints, negative indices count from the end.
+        """
+        self._sortlanes('partition', axis, kth)
+        return None
+
+    def argpartition(self, kth, axis=-1):
+        """
+        Return int32 array of indices that partition the array along axis at index kth.
+        Argument kth is an int or sequence of ints, negative indices count from the end.
+        Axis None partitions the flattened array.
+        """
+        if axis is None:
+            return self._flattened()._sortlanes('argpartition', 0, kth)
+        return self._sortlanes('argpartition', axis, kth)
 
     def _get_array(self, other):
         if not isinstance(other, Ndarray):
@@ -1159,58 +3716,234 @@ class Ndarray(object):
                 other = Ndarray(list(other), self._dtype)
         return other
 
-    def op(self, operator, other):
+    def op(self, operator, other, out=None):
         """
         Arithemtic operation across array elements.
         Arguments include operator and int/array.
         Operators: 'add', 'sub', 'mul', 'div', etc.
+        Optional argument out is an array to write the result into,
+        of the broadcast shape and the array dtype.
         Return array of the operation.
+        Raises TypeError if out shape or dtype is not compatible.
         Note: operator special methods not called in
         Pyjs --optimized mode unless build with
         the --enable-operator-funcs option.
         """
-        return getattr(self, '__'+operator+'__')(other)
-
-    def cmp(self, operator, other):
+        if out is None:
+            return getattr(self, '__'+operator+'__')(other)
+        if operator == 'matmul':
+            return self._matmul(other, out, False)
+        if operator == 'div':
+            operator = 'truediv'
+        if operator in ('lt', 'le', 'eq', 'ne', 'gt', 'ge'):
+            return self._elementwise(operator, other, out, 'uint8')
+        return self._elementwise(operator, other, out)
+
+    def cmp(self, operator, other, out=None):
         """
         Comparison operation across array elements.
         Arguments include operator and int/array.
         Operators: 'lt', 'le', 'eq', 'ne', 'gt', 'ge'.
+        Optional argument out is a uint8 array to write the result into.
         Return comparison array.
+        Raises TypeError if out shape or dtype is not compatible.
         Note: comparison special methods not called.
         """
-        return getattr(self, '__'+operator+'__')(other)
+        if out is None:
+            return getattr(self, '__'+operator+'__')(other)
+        return self._elementwise(operator, other, out, 'uint8')
 
-    def matmul(self, other):
+    def matmul(self, other, out=None, transposed=False):
         """
         Matrix multiplication.
-        Argument is an int or array.
-        Return matrix multiplied array.
+        Argument is an array, leading dimensions are broadcast as a stack of matrices.
+        Optional argument out is an array of the result shape and array dtype to write into, not accepted for a scalar result.
+        Optional argument transposed indicates other is provided with its last two axes swapped.
+        Return matrix multiplied array, or a scalar for two 1d arrays.
+        """
+        return self._matmul(other, out, transposed)
+
+    def _matmul(self, other, out, transposed):
+        _other = self._get_array(other)
+        x_shape, x_indices = tuple(self._shape), tuple(self._indices)
+        y_shape, y_indices = tuple(_other._shape), tuple(_other._indices)
+        x_vec = len(x_shape) == 1
+        y_vec = len(y_shape) == 1
+        if transposed and not y_vec:
+            y_shape = y_shape[:-2] + (y_shape[-1], y_shape[-2])
+            y_indices = y_indices[:-2] + (y_indices[-1], y_indices[-2])
+        if x_vec:
+            n, m = 1, x_shape[0]
+            xrs, xcs = 0, x_indices[0]
+        else:
+            n, m = x_shape[-2], x_shape[-1]
+            xrs, xcs = x_indices[-2], x_indices[-1]
+        if y_vec:
+            k, p = y_shape[0], 1
+            yrs, ycs = y_indices[0], 0
+        else:
+            k, p = y_shape[-2], y_shape[-1]
+            yrs, ycs = y_indices[-2], y_indices[-1]
+        if k != m:
+            raise ValueError('incompatible array shapes for matmul')
+        try:
+            bshape = _broadcast_shape(x_shape[:-2], y_shape[:-2])
+        except TypeError:
+            raise ValueError('incompatible array shapes for matmul')
+        shape = bshape
+        if not x_vec:
+            shape += (n,)
+        if not y_vec:
+            shape += (p,)
+        if not shape:
+            if out is not None:
+                raise ValueError('output array is not supported for a scalar matmul result')
+            out = Ndarray(1, 'float64')
+            zrs, zcs, zbs = 0, 0, ()
+        else:
+            if out is None:
+                out = Ndarray(shape, self._dtype)
+            elif tuple(out._shape) != shape:
+                raise ValueError('incompatible output array shape for matmul')
+            elif out._dtype != self._dtype:
+                raise ValueError('incompatible output array dtype for matmul')
+            zbs = out._indices[:len(bshape)]
+            if x_vec:
+                zrs, zcs = 0, out._indices[-1]
+            elif y_vec:
+                zrs, zcs = out._indices[-1], 0
+            else:
+                zrs, zcs = out._indices[-2], out._indices[-1]
+        x, xo = self._data._data, self._offset
+        y, yo = _other._data._data, _other._offset
+        z, zo = out._data._data, out._offset
+        if JS("@{{z}}.buffer === @{{x}}.buffer"):
+            _self = self.copy()
+            x, xo, x_indices = _self._data._data, 0, _self._indices
+            if x_vec:
+                xcs = x_indices[0]
+            else:
+                xrs, xcs = x_indices[-2], x_indices[-1]
+        if JS("@{{z}}.buffer === @{{y}}.buffer"):
+            _other = _other.copy()
+            y, yo, y_indices = _other._data._data, 0, _other._indices
+            if transposed and not y_vec:
+                y_indices = y_indices[:-2] + (y_indices[-1], y_indices[-2])
+            if y_vec:
+                yrs = y_indices[0]
+            else:
+                yrs, ycs = y_indices[-2], y_indices[-1]
+        xbs = _jsarray(_broadcast_strides(x_shape[:-2], x_indices[:-2], bshape))
+        ybs = _jsarray(_broadcast_strides(y_shape[:-2], y_indices[:-2], bshape))
+        zbs = _jsarray(zbs)
+        _bshape = _jsarray(bshape)
+        if not pyjs_mode.optimized:
+            n, m, p = n.valueOf(), m.valueOf(), p.valueOf()
+            xrs, xcs, yrs, ycs = xrs.valueOf(), xcs.valueOf(), yrs.valueOf(), ycs.valueOf()
+            zrs, zcs = zrs.valueOf(), zcs.valueOf()
+        JS("""@{{_kernel_matmul}}(@{{n}}, @{{m}}, @{{p}}, @{{_bshape}},
+                @{{x}}, @{{xo}}, @{{xbs}}, @{{xrs}}, @{{xcs}},
+                @{{y}}, @{{yo}}, @{{ybs}}, @{{yrs}}, @{{ycs}},
+                @{{z}}, @{{zo}}, @{{zbs}}, @{{zrs}}, @{{zcs}});""")
+        out._modified()
+        if not shape:
+            if 'int' in self._dtype:
+                return int(out[0])
+            return out[0]
+        return out
+
+    def convolve2d(self, kernel, mode='same', boundary='fill', fillvalue=0, out=None):
+        """
+        Return 2D convolution of the array with a 2D kernel, applied per channel for a 3D array.
+        Optional argument mode 'same' returns output of array size centered, 'valid' only where kernel fully overlaps.
+        Optional argument boundary is 'fill' with fillvalue, 'wrap', 'symm' to reflect or 'nearest' to repeat edge.
+        Optional argument out is a contiguous array of the result shape to write into, default has the array dtype.
+        A separable kernel is applied as two 1D passes.
+        """
+        if isinstance(kernel, Ndarray):
+            kernel = kernel.astype('float64')
+        else:
+            kernel = Ndarray(kernel, 'float64')
+        if len(kernel._shape) != 2:
+            raise TypeError("kernel must be 2D")
+        return self._convolve(kernel._data._data, kernel._shape[0], kernel._shape[1], None, None, mode, boundary, fillvalue, out)
+
+    def _convolve(self, k, kh, kw, col, row, mode, boundary, fillvalue, out):
+        ndim = len(self._shape)
+        if ndim not in (2, 3):
+            raise TypeError("convolve2d requires 2D or 3D array")
+        if mode not in ('same', 'valid'):
+            raise ValueError("mode must be 'same' or 'valid'")
+        if boundary not in ('fill', 'wrap', 'symm', 'nearest'):
+            raise ValueError("boundary must be 'fill', 'wrap', 'symm' or 'nearest'")
+        h, w = self._shape[0], self._shape[1]
+        if mode == 'same':
+            oh, ow, c0, c1 = h, w, (kh-1)//2, (kw-1)//2
+        else:
+            oh, ow, c0, c1 = h-kh+1, w-kw+1, kh-1, kw-1
+            if oh < 1 or ow < 1:
+                raise ValueError("kernel is larger than array in valid mode")
+        if ndim == 3:
+            nc, sc = self._shape[2], self._indices[2]
+            shape = (oh, ow, nc)
+        else:
+            nc, sc = 1, 0
+            shape = (oh, ow)
+        if out is None:
+            out = Ndarray(shape, self._dtype)
+        elif tuple(out._shape) != shape or not out._is_contiguous():
+            raise TypeError("array shapes are not compatible")
+        src, so, s0, s1 = self._data._data, self._offset, self._indices[0], self._indices[1]
+        dst = out._data._data
+        JS("""@{{_kernel_convolve}}(@{{src}}, @{{so}}, @{{s0}}, @{{s1}}, @{{sc}}, @{{h}}, @{{w}}, @{{nc}},
+                @{{dst}}, @{{oh}}, @{{ow}}, @{{k}}, @{{kh}}, @{{kw}}, @{{col}}, @{{row}},
+                @{{c0}}, @{{c1}}, @{{boundary}}, @{{fillvalue}});""")
+        out._modified()
+        return out
+
+    def resize(self, height, width, method='bilinear', out=None):
+        """
+        Return 2D array resampled to height and width, applied per channel for a 3D array.
+        Optional argument method is 'nearest', 'bilinear' or 'area' for box-area averaging.
+        Optional argument out is a contiguous array of the result shape to write into, default has the array dtype.
         """
-        return self.__matmul__(other)
+        ndim = len(self._shape)
+        if ndim not in (2, 3):
+            raise TypeError("resize requires 2D or 3D array")
+        if method not in ('nearest', 'bilinear', 'area'):
+            raise ValueError("method must be 'nearest', 'bilinear' or 'area'")
+        if ndim == 3:
+            nc, sc = self._shape[2], self._indices[2]
+            shape = (height, width, nc)
+        else:
+            nc, sc = 1, 0
+            shape = (height, width)
+        if out is None:
+            out = Ndarray(shape, self._dtype)
+        elif tuple(out._shape) != shape or not out._is_contiguous():
+            raise TypeError("array shapes are not compatible")
+        src, so, s0, s1 = self._data._data, self._offset, self._indices[0], self._indices[1]
+        h, w, dst = self._shape[0], self._shape[1], out._data._data
+        JS("""@{{_kernel_resize}}(@{{src}}, @{{so}}, @{{s0}}, @{{s1}}, @{{sc}}, @{{h}}, @{{w}}, @{{nc}},
+                @{{dst}}, @{{height}}, @{{width}}, @{{method}});""")
+        out._modified()
+        return out
 
     def reshape(self, dim):
         """
         Return view of array with new shape.
         Argument is new shape.
         Raises TypeError if shape is not appropriate.
+        A non-contiguous array is copied before reshape.
         """
-        size = 1
-        for i in dim:
-            size *= i
-        array_size = 1
-        for i in self._shape:
-            array_size *= i
-        if size != array_size:
+        if _size(dim) != _size(self._shape):
             raise TypeError("array size cannot change")
+        if not self._is_contiguous():
+            return self.copy().reshape(dim)
         subarray = self._data.subarray(0)
-        array = Ndarray(subarray)
+        array = Ndarray(subarray, self._dtype)
         array._shape = dim
-        indices = []
-        for i in array._shape:
-            size /= i
-            indices.append(size)
-        array._indices = tuple(indices)
+        array._indices = _strides(dim)
         return array
 
     def set(self, data):
@@ -1218,6 +3951,11 @@ class Ndarray(object):
         Set array elements.
         Data argument can be a 1d/2d array or number used to set Ndarray elements, data used repetitively if consists of fewer elements than Ndarray.
         """
+        if not self._is_contiguous():
+            array = self.copy()
+            array.set(data)
+            self._assign(array)
+            return None
         if isinstance(data, (list,tuple)):
             if pyjs_mode.optimized:
                 if isinstance(data[0], (list,tuple,TypedArray)):
@@ -1233,52 +3971,47 @@ class Ndarray(object):
             data = data.getArray()
             dataLn = data.length
         else:
-            if pyjs_mode.optimized:
-                for index in range(self._data._data.length):
-                    JS("@{{self}}['_data']['_data'][@{{index}}]=@{{data}};")
-            else:
-                data = data.valueOf()
-                for index in range(self._data._data.length):
-                    JS("@{{self}}['_data']['_data'][@{{index}}]=@{{data}};")
+            self._elementwise('assign', data, self)
             return None
         if dataLn == self._data._data.length:
-            for index in range(self._data._data.length):
-                JS("@{{self}}['_data']['_data'][@{{index}}]=@{{data}}[@{{index}}];")
+            JS("@{{self}}['_data']['_data'].set(@{{data}});")
         else:
             for index in range(self._data._data.length):
                 JS("@{{self}}['_data']['_data'][@{{index}}]=@{{data}}[@{{index}}%@{{dataLn}}];")
+        self._modified()
         return None
 
     def fill(self, value):
         """
         Set array elements to value argument.
         """
-        if pyjs_mode.optimized:
-            for index in range(self._data._data.length):
-                JS("@{{self}}['_data']['_data'][@{{index}}]=@{{value}};")
-        else:
-            value = value.valueOf()
-            for index in range(self._data._data.length):
-                JS("@{{self}}['_data']['_data'][@{{index}}]=@{{value}};")
+        self._elementwise('assign', value, self)
         return None
 
     def copy(self):
         """
         Return copy of array.
+        A copy of a strided view is C-contiguous.
         """
+        if not self._is_contiguous():
+            ndarray = self.empty()
+            ndarray._elementwise('assign', self, ndarray)
+            ndarray._mask = self._mask
+            return ndarray
         array = self._data.__class__(self._data)
         ndarray = Ndarray(array, self._dtype)
         ndarray._shape = self._shape
         ndarray._indices = self._indices
+        ndarray._mask = self._mask
         return ndarray
 
     def empty(self):
         """
         Return empty copy of array.
         """
-        ndarray = Ndarray(len(self._data), self._dtype)
+        ndarray = Ndarray(_size(self._shape), self._dtype)
         ndarray._shape = self._shape
-        ndarray._indices = self._indices
+        ndarray._indices = _strides(self._shape)
         return ndarray
 
     def astype(self, dtype):
@@ -1286,6 +4019,8 @@ class Ndarray(object):
         Return copy of array.
         Argument dtype is TypedArray data type.
         """
+        if not self._is_contiguous():
+            return self.copy().astype(dtype)
         typedarray = self.__typedarray[self.__dtypes[dtype]]
         array = typedarray(self._data)
         ndarray = Ndarray(array, dtype)
@@ -1297,11 +4032,7 @@ class Ndarray(object):
         """
         Return view of array.
         """
-        subarray = self._data.subarray(0)
-        array = Ndarray(subarray)
-        array._shape = self._shape
-        array._indices = self._indices
-        return array
+        return self._view(self._shape, self._indices, self._offset)
 
     def swapaxes(self, axis1, axis2):
         """
@@ -1309,54 +4040,1556 @@ class Ndarray(object):
         Arguments are the axis to swap.
         Return view of array with axes changed.
         """
-        array = Ndarray(self._data, self._dtype)
-        shape = list(self._shape)
-        shape[axis1], shape[axis2] = shape[axis2], shape[axis1]
-        array._shape = tuple(shape)
-        indices = list(self._indices)
-        indices[axis1], indices[axis2] = indices[axis2], indices[axis1]
-        array._indices = tuple(indices)
+        axes = list(range(len(self._shape)))
+        axes[axis1], axes[axis2] = axes[axis2], axes[axis1]
+        return self.transpose(axes)
+
+    def transpose(self, *axes):
+        """
+        Permute axes of array.
+        Optional argument is the axes order, default reverses the axes.
+        Return view of array with axes permuted.
+        """
+        if not axes:
+            axes = range(len(self._shape)-1, -1, -1)
+        elif isinstance(axes[0], (list,tuple)):
+            axes = axes[0]
+        shape = tuple([self._shape[axis] for axis in axes])
+        indices = tuple([self._indices[axis] for axis in axes])
+        return self._view(shape, indices, self._offset)
+
+    def tolist(self):
+        """
+        Return array as a list.
+        """
+        def to_list(array, l):
+            if hasattr(array[0], '__iter__'):
+                if len(l) == 0:
+                    _l = l
+                else:
+                    l = [l]
+                    _l = l[0]
+                for i, a in enumerate(array):
+                    _l.append([])
+                    to_list(a, _l[i])
+            else:
+                l.extend([v for v in array])
+            return l
+        return to_list(self, [])
+
+    def deferred(self):
+        """
+        Return LazyArray of array.
+        Operations on the LazyArray are deferred and evaluated in a single fused loop.
+        """
+        return LazyArray(self)
+
+    def getArray(self):
+        """
+        Return JavaScript TypedArray.
+        A strided view returns the TypedArray of a contiguous copy.
+        """
+        return self._ascontiguous()._data.getArray()
+
+    def tobytes(self):
+        """
+        Return Uint8Array of the array data bytes in C order.
+        The bytes of a contiguous array are a view sharing its ArrayBuffer, a strided view is copied first.
+        """
+        data = self._ascontiguous()._data
+        return Uint8Array(data.getBuffer(), data.getByteOffset(), data.getByteLength())
+
+    def tobytes_npy(self):
+        """
+        Return Uint8Array of the array in NumPy .npy version 1.0 format, a header followed by the data bytes in C order.
+        Data is written in the native byte order, 'uint8c' is written as 'u1'.
+        """
+        data = self.tobytes()
+        code = { 'uint8c':'u1', 'int8':'i1', 'uint8':'u1', 'int16':'i2', 'uint16':'u2',
+                 'int32':'i4', 'uint32':'u4', 'float32':'f4', 'float64':'f8' }[self._dtype]
+        if code[1] == '1':
+            order = '|'
+        elif _littleendian:
+            order = '<'
+        else:
+            order = '>'
+        shape = ', '.join([str(dim) for dim in self._shape])
+        if len(self._shape) == 1:
+            shape += ','
+        header = "{'descr': '%s%s', 'fortran_order': False, 'shape': (%s), }" % (order, code, shape)
+        header += ' ' * (63 - (10+len(header)) % 64) + '\n'
+        start = 10 + len(header)
+        out = Uint8Array(start+len(data))
+        out[0] = 0x93
+        for index in range(5):
+            out[index+1] = ord('NUMPY'[index])
+        out[6], out[7] = 1, 0
+        out[8], out[9] = len(header) & 255, len(header) >> 8
+        for index in range(len(header)):
+            out[index+10] = ord(header[index])
+        out.set(data, start)
+        return out
+
+    def tobase64(self):
+        """
+        Return base64 string of the array data bytes in C order.
+        """
+        data = self.tobytes()._data
+        return JS("@{{_base64}}.encode(@{{data}})")
+
+    def torle(self):
+        """
+        Return run-length encoding of the array elements in C order as a tuple of an array of the run values and a uint32 array of the run lengths.
+        """
+        array = self._ascontiguous()
+        x, n = array._data._data, _size(array._shape)
+        count = int(JS("@{{_kernel_unique}}(@{{x}}, @{{n}}, null, null)"))
+        values, counts = Ndarray(count, self._dtype), Ndarray(count, 'uint32')
+        _values, _counts = values._data._data, counts._data._data
+        JS("@{{_kernel_unique}}(@{{x}}, @{{n}}, @{{_values}}, @{{_counts}});")
+        return values, counts
+
+
+class LazyArray(object):
+
+    """
+    LazyArray defers Ndarray operations, building an expression tree that is evaluated in a single fused loop over the TypedArray data without intermediate arrays. Evaluation kernels are compiled once per expression structure, dtypes and layout, and reused from the kernel cache. Intermediate results are computed in JavaScript double precision, the result is stored in the array dtype.
+    """
+
+    def __init__(self, array, op=None, operands=None):
+        """
+        Create a lazy expression of an Ndarray.
+        Argument array is an Ndarray or list, operations on the LazyArray build the expression.
+        """
+        if op is None and not isinstance(array, Ndarray):
+            array = Ndarray(array)
+        self._array = array
+        self._op = op
+        self._operands = operands
+        self._result = None
+
+    def _binary(self, op, other):
+        if isinstance(other, (Ndarray, list, tuple)):
+            other = LazyArray(other)
+        elif not isinstance(other, LazyArray):
+            if not pyjs_mode.optimized:
+                other = other.valueOf()
+        return LazyArray(None, op, [self, other])
+
+    def _compile(self, arrays, scalars, dtype):
+        if self._op is None:
+            k = 0
+            while k < len(arrays) and arrays[k] is not self._array:
+                k += 1
+            if k == len(arrays):
+                arrays.append(self._array)
+            return 'a%d[i]' % k, 'a%d[p%d]' % (k,k)
+        flat, strided = [], []
+        for operand in self._operands:
+            if isinstance(operand, LazyArray):
+                f, s = operand._compile(arrays, scalars, dtype)
+            else:
+                f = s = 's%d' % len(scalars)
+                scalars.append(operand)
+            flat.append(f)
+            strided.append(s)
+        op = self._op
+        if op == 'rshift' and dtype.startswith('uint'):
+            op = 'urshift'
+        template = _op_exprs[op]
+        return template % tuple(flat), template % tuple(strided)
+
+    def _dtype(self):
+        if self._op in ('lt', 'le', 'eq', 'ne', 'gt', 'ge'):
+            return 'uint8'
+        node = self
+        while node._op is not None:
+            for operand in node._operands:
+                if isinstance(operand, LazyArray):
+                    node = operand
+                    break
+        return node._array._dtype
+
+    def evaluate(self, out=None):
+        """
+        Evaluate the expression in a single fused loop.
+        Optional argument out is an array to write the result into.
+        Return the result array.
+        Raises TypeError if array shapes or out dtype are not compatible.
+        """
+        if self._op is None:
+            if out is None:
+                return self._array
+            return self._array._elementwise('assign', self._array, out)
+        dtype = self._dtype()
+        arrays, scalars = [], []
+        flat, strided = self._compile(arrays, scalars, dtype)
+        out = _evaluate(flat, strided, arrays, scalars, dtype, out)
+        out._mask = self._op in ('lt', 'le', 'eq', 'ne', 'gt', 'ge')
+        self._result = out
+        return out
+
+    def _evaluated(self):
+        if self._result is None:
+            self.evaluate()
+        return self._result
+
+    def op(self, operator, other=None):
+        """
+        Defer operation across array elements.
+        Arguments include operator and int/array/LazyArray.
+        Operators: 'add', 'sub', 'mul', 'div', 'lt', 'neg', etc.
+        Return LazyArray of the operation.
+        """
+        if operator == 'div':
+            operator = 'truediv'
+        if operator in ('neg', 'abs', 'invert'):
+            return LazyArray(None, operator, [self])
+        return self._binary(operator, other)
+
+    def getshape(self):
+        """
+        Return shape of the evaluated array.
+        """
+        return self._evaluated()._shape
+
+    shape = property(getshape)
+
+    def __getitem__(self, index):
+        return self._evaluated()[index]
+
+    def __iter__(self):
+        return self._evaluated().__iter__()
+
+    def __len__(self):
+        return len(self._evaluated())
+
+    def __str__(self):
+        return str(self._evaluated())
+
+    def __repr__(self):
+        return 'LazyArray(%s)' % repr(self._evaluated())
+
+    def tolist(self):
+        """
+        Return evaluated array as a list.
+        """
+        return self._evaluated().tolist()
+
+    def __add__(self, other):
+        return self._binary('add', other)
+
+    def __sub__(self, other):
+        return self._binary('sub', other)
+
+    def __mul__(self, other):
+        return self._binary('mul', other)
+
+    def __div__(self, other):
+        return self._binary('truediv', other)
+
+    def __truediv__(self, other):
+        return self._binary('truediv', other)
+
+    def __floordiv__(self, other):
+        return self._binary('floordiv', other)
+
+    def __mod__(self, other):
+        return self._binary('mod', other)
+
+    def __pow__(self, other):
+        return self._binary('pow', other)
+
+    def __lshift__(self, other):
+        return self._binary('lshift', other)
+
+    def __rshift__(self, other):
+        return self._binary('rshift', other)
+
+    def __and__(self, other):
+        return self._binary('and', other)
+
+    def __or__(self, other):
+        return self._binary('or', other)
+
+    def __xor__(self, other):
+        return self._binary('xor', other)
+
+    def __lt__(self, other):
+        return self._binary('lt', other)
+
+    def __le__(self, other):
+        return self._binary('le', other)
+
+    def __eq__(self, other):
+        return self._binary('eq', other)
+
+    def __ne__(self, other):
+        return self._binary('ne', other)
+
+    def __gt__(self, other):
+        return self._binary('gt', other)
+
+    def __ge__(self, other):
+        return self._binary('ge', other)
+
+    def __neg__(self):
+        return LazyArray(None, 'neg', [self])
+
+    def __abs__(self):
+        return LazyArray(None, 'abs', [self])
+
+    def __invert__(self):
+        return LazyArray(None, 'invert', [self])
+
+
+class RecordDtype(object):
+
+    """
+    RecordDtype describes a record of named fields, each of an Ndarray dtype and optional subarray shape.
+    Field offsets are aligned to the field element size and the record size to the largest element size, so every field of a record array can be viewed by a TypedArray.
+    """
+
+    def __init__(self, fields):
+        """
+        Create a record dtype.
+        Argument fields is a list of (name, dtype) or (name, dtype, shape) tuples.
+        """
+        self._names = []
+        self._fields = {}
+        offset, alignment = 0, 1
+        for field in fields:
+            name, dtype = field[0], Ndarray(0, field[1])._dtype
+            if len(field) > 2:
+                shape = field[2]
+                if isinstance(shape, int):
+                    shape = (shape,)
+                shape = tuple(shape)
+            else:
+                shape = ()
+            if name in self._fields:
+                raise ValueError("field name %s is duplicated" % name)
+            size = Ndarray(0, dtype)._data.getBytesPerElement()
+            offset = (offset + size - 1) // size * size
+            self._names.append(name)
+            self._fields[name] = (dtype, shape, offset, size)
+            offset += size * _size(shape)
+            alignment = max(alignment, size)
+        self._alignment = alignment
+        self._itemsize = (offset + alignment - 1) // alignment * alignment
+
+    def __str__(self):
+        return str([(name, self._fields[name][0], self._fields[name][1]) for name in self._names])
+
+    def __repr__(self):
+        return 'dtype(%s)' % str(self)
+
+    def __len__(self):
+        return len(self._names)
+
+    def getnames(self):
+        """
+        Return tuple of field names.
+        """
+        return tuple(self._names)
+
+    names = property(getnames)
+
+    def getitemsize(self):
+        """
+        Return record size in bytes, including alignment padding.
+        """
+        return self._itemsize
+
+    itemsize = property(getitemsize)
+
+    def getfield(self, name):
+        """
+        Return field (dtype, shape, offset) of name, with byte offset within the record.
+        """
+        if name not in self._fields:
+            raise KeyError("no field of name %s" % name)
+        dtype, shape, offset, size = self._fields[name]
+        return dtype, shape, offset
+
+
+class RecordArray(object):
+
+    """
+    RecordArray is a 1D array of records of a RecordDtype stored in a single ArrayBuffer.
+    The 'aos' layout interleaves the fields of each record, the 'soa' layout stores each field in a contiguous column.
+    Fields are accessed as Ndarray views of the buffer, strided in the 'aos' layout, so field operations use the Ndarray kernels without copying.
+    """
+
+    def __init__(self, size, dtype, layout='aos', buffer=None):
+        """
+        Create a record array of size records.
+        Argument dtype is a RecordDtype or list of fields.
+        Optional argument layout is 'aos' (array of structs) or 'soa' (struct of arrays).
+        Optional argument buffer is an ArrayBuffer, TypedArray or Ndarray whose data is viewed, default allocates a zeroed buffer.
+        """
+        if not isinstance(dtype, RecordDtype):
+            dtype = RecordDtype(dtype)
+        if layout not in ('aos', 'soa'):
+            raise ValueError("layout must be 'aos' or 'soa'")
+        self._dtype = dtype
+        self._layout = layout
+        self._size = size
+        self._columns = {}
+        nbytes = 0
+        for name in dtype._names:
+            ftype, shape, offset, fsize = dtype._fields[name]
+            if layout == 'aos':
+                self._columns[name] = offset
+            else:
+                nbytes = (nbytes + fsize - 1) // fsize * fsize
+                self._columns[name] = nbytes
+                nbytes += fsize * _size(shape) * size
+        if layout == 'aos':
+            nbytes = dtype._itemsize * size
+        else:
+            nbytes = (nbytes + dtype._alignment - 1) // dtype._alignment * dtype._alignment
+        if buffer is None:
+            self._data = Uint8Array(nbytes)
+        else:
+            buffer, byteoffset, bytelength = _buffer(buffer)
+            if byteoffset % dtype._alignment:
+                raise ValueError("buffer offset must be aligned to %d bytes" % dtype._alignment)
+            if bytelength < nbytes:
+                raise ValueError("buffer is smaller than requested size")
+            self._data = Uint8Array(buffer, byteoffset, nbytes)
+        self._views = {}
+
+    def _field(self, name):
+        if name in self._views:
+            return self._views[name]
+        if name not in self._columns:
+            raise KeyError("no field of name %s" % name)
+        dtype, shape, offset, fsize = self._dtype._fields[name]
+        count = _size(shape)
+        if self._layout == 'aos':
+            stride = self._dtype._itemsize // fsize
+        else:
+            stride = count
+        length = (self._size-1) * stride + count if self._size else 0
+        array = np.frombuffer(self._data, dtype, self._columns[name], length)
+        array = array._view((self._size,)+shape, (stride,)+_strides(shape), 0)
+        self._views[name] = array
+        return array
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self._field(index)
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("index out of range")
+        return tuple([self._field(name)[index] for name in self._dtype._names])
+
+    def __setitem__(self, index, value):
+        if isinstance(index, str):
+            self._field(index).set(value)
+            return None
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("index out of range")
+        if len(value) != len(self._dtype._names):
+            raise ValueError("record value must have %d fields" % len(self._dtype._names))
+        for i, name in enumerate(self._dtype._names):
+            field = self._field(name)
+            if len(field._shape) > 1:
+                field[index].set(value[i])
+            else:
+                field[index] = value[i]
+        return None
+
+    def __iter__(self):
+        index = 0
+        while index < self._size:
+            yield self[index]
+            index += 1
+
+    def __len__(self):
+        return self._size
+
+    def getdtype(self):
+        """
+        Return RecordDtype of array.
+        """
+        return self._dtype
+
+    dtype = property(getdtype)
+
+    def getlayout(self):
+        """
+        Return array layout, 'aos' or 'soa'.
+        """
+        return self._layout
+
+    def getBuffer(self):
+        """
+        Return ArrayBuffer of array.
+        """
+        return self._data.getBuffer()
+
+    def tobytes(self):
+        """
+        Return Uint8Array view of the array data bytes.
+        """
+        return self._data
+
+    def tolist(self):
+        """
+        Return array as a list of record tuples.
+        """
+        return [record for record in self]
+
+
+class ChunkedRun(object):
+
+    """
+    ChunkedRun splits an array operation into slices of rows along the first axis, so a long operation can run cooperatively between browser frames.
+    Each slice runs the kernels of the single-shot operation on row views, so throughput stays close to the single-shot path.
+    Iterate the run to process one slice per step, call run with a time budget once per frame, or start it to run asynchronously.
+    """
+
+    _reductions = ('sum', 'prod', 'min', 'max', 'mean', 'var', 'std', 'argmin', 'argmax')
+    _filters = ('gaussian_blur', 'box_blur', 'median', 'sobel')
+
+    def __init__(self, op, array, other=None, chunk=65536, axis=None, out=None):
+        """
+        Create a chunked run of operation op on array.
+        Argument op is an elementwise operator of Ndarray.op or Ndarray.cmp, 'set', a reduction 'sum', 'prod', 'min', 'max', 'mean', 'var', 'std', 'argmin' or 'argmax', 'matmul', or an ImageMatrix filter 'gaussian_blur', 'box_blur', 'median' or 'sobel'.
+        Optional argument other is the operand of an elementwise operator or matmul, the data of set broadcast to the array shape, the ddof of var and std, or the filter parameter.
+        Optional argument chunk is the approximate number of elements per slice, or multiply-adds for matmul.
+        Optional argument axis of a reduction, default reduces all elements.
+        Optional argument out is an array to write an elementwise or matmul result into.
+        Stacked matmul is sliced over the rows of all matrices of the stack.
+        """
+        if chunk < 1:
+            raise ValueError("chunk must be positive")
+        if op == 'div':
+            op = 'truediv'
+        self._pos = 0
+        self._result = None
+        self._finished = False
+        self._acc = None
+        if op in self._filters:
+            if not isinstance(array, ImageMatrix):
+                raise TypeError("filter requires an ImageMatrix")
+            self._setup_filter(op, array, other, chunk)
+        elif op in self._reductions:
+            self._setup_reduce(op, array, axis, other, chunk)
+        elif op == 'set':
+            self._setup_set(array, other, chunk)
+        elif op == 'matmul':
+            self._setup_matmul(array, other, out, chunk)
+        elif op in _op_exprs:
+            self._setup_elementwise(op, array, other, out, chunk)
+        else:
+            raise ValueError("unsupported chunked operation %s" % op)
+
+    def _rowslice(self, array, shape, start, stop):
+        if isinstance(array, Ndarray) and len(array._shape) == len(shape) and array._shape[0] == shape[0]:
+            return array[start:stop]
+        return array
+
+    def _setup_elementwise(self, op, array, other, out, chunk):
+        if op in ('lt', 'le', 'eq', 'ne', 'gt', 'ge'):
+            dtype = 'uint8'
+        else:
+            dtype = array._dtype
+        if other is None:
+            other = 0
+        if hasattr(other, '__iter__'):
+            other = array._get_array(other)
+            shape = _broadcast_shape(array._shape, other._shape)
+        else:
+            shape = tuple(array._shape)
+        if out is None:
+            out = Ndarray(shape, dtype)
+        elif tuple(out._shape) != shape:
+            raise TypeError("array shapes are not compatible")
+        def func(start, stop):
+            x = self._rowslice(array, shape, start, stop)
+            y = self._rowslice(other, shape, start, stop)
+            x._elementwise(op, y, out[start:stop], dtype)
+        self._plan(func, lambda: out, shape[0], _size(shape[1:]), chunk)
+
+    def _setup_set(self, array, data, chunk):
+        shape = tuple(array._shape)
+        if isinstance(data, (list,tuple)):
+            data = Ndarray(list(array._lflatten(data)), array._dtype)
+        if hasattr(data, '__iter__'):
+            data = array._get_array(data)
+            if tuple(data._shape) != shape and _size(data._shape) == _size(shape):
+                data = data.reshape(shape)
+        def func(start, stop):
+            array[start:stop]._assign(self._rowslice(data, shape, start, stop))
+        def finish():
+            array._modified()
+            return array
+        self._plan(func, finish, shape[0], _size(shape[1:]), chunk)
+
+    def _better(self, better, value, best):
+        if not pyjs_mode.optimized:
+            value, best = value.valueOf(), best.valueOf()
+        return JS("@{{better}}(@{{value}}, @{{best}})")
+
+    def _unravel(self, index, shape):
+        indices = []
+        for dim in shape[::-1]:
+            indices.insert(0, index % dim)
+            index //= dim
+        return indices
+
+    def _block(self, array, start, stop, op, axis, ddof):
+        block = array[start:stop]
+        if op in ('var', 'std'):
+            return getattr(block, op)(axis, False, ddof)
+        return getattr(block, op)(axis)
+
+    def _setup_reduce(self, op, array, axis, ddof, chunk):
+        ndim = len(array._shape)
+        if ddof is None:
+            ddof = 0
+        if axis is not None:
+            if axis < 0:
+                axis += ndim
+            if axis < 0 or axis >= ndim:
+                raise ValueError("axis out of range")
+            if ndim == 1:
+                axis = None
+        name = op
+        if op == 'mean':
+            name = 'sum'
+        elif op in ('var', 'std'):
+            name = 'moments'
+        elif op in ('argmin', 'argmax'):
+            name = 'arg'
+        if op in ('min', 'argmin'):
+            better = JS("@{{_reduce_better}}['min']")
+        else:
+            better = JS("@{{_reduce_better}}['max']")
+        rowsize = _size(array._shape[1:])
+        if axis is None:
+            def func(start, stop):
+                if name == 'moments':
+                    n = (stop-start) * rowsize
+                    value = (n, self._block(array, start, stop, 'mean', None, 0),
+                             self._block(array, start, stop, 'var', None, 0) * n)
+                elif name == 'arg':
+                    block = array[start:stop]
+                    index = self._block(array, start, stop, op, None, 0)
+                    value = (index + start*rowsize, block[tuple(self._unravel(index, block._shape))])
+                else:
+                    value = self._block(array, start, stop, name, None, 0)
+                if self._acc is None:
+                    self._acc = value
+                elif name == 'sum':
+                    self._acc += value
+                elif name == 'prod':
+                    self._acc *= value
+                elif name in ('min', 'max'):
+                    if self._better(better, value, self._acc):
+                        self._acc = value
+                elif name == 'moments':
+                    na, mean, m2 = self._acc
+                    nb, n = value[0], self._acc[0] + value[0]
+                    delta = value[1] - mean
+                    self._acc = (n, mean + delta*nb/n, m2 + value[2] + delta*delta*na*nb/n)
+                elif self._better(better, value[1], self._acc[1]):
+                    self._acc = value
+            count = _size(array._shape)
+        elif axis == 0:
+            def func(start, stop):
+                if name == 'moments':
+                    nb = stop - start
+                    mean = self._block(array, start, stop, 'mean', 0, 0)
+                    m2 = self._block(array, start, stop, 'var', 0, 0)
+                    m2._elementwise('mul', nb, m2)
+                    value = (nb, mean, m2)
+                elif name == 'arg':
+                    value = (self._block(array, start, stop, op, 0, 0), self._block(array, start, stop, op[3:], 0, 0))
+                else:
+                    value = self._block(array, start, stop, name, 0, 0)
+                if self._acc is None:
+                    self._acc = value
+                elif name == 'sum':
+                    self._acc._elementwise('add', value, self._acc)
+                elif name == 'prod':
+                    self._acc._elementwise('mul', value, self._acc)
+                elif name == 'moments':
+                    na, mean, m2 = self._acc
+                    nb, n = value[0], na + value[0]
+                    _fused('(%s + %s + (%s - %s) * (%s - %s) * %s)',
+                           [m2, value[2], value[1], mean, value[1], mean, na*nb/float(n)], m2._dtype, m2)
+                    _fused('(%s + (%s - %s) * %s)', [mean, value[1], mean, nb/float(n)], mean._dtype, mean)
+                    self._acc = (n, mean, m2)
+                elif name == 'arg':
+                    index, best = self._acc
+                    b = value[1]
+                    _fused('(%s(%s, %s) ? %s + %s : %s)', [better, b, best, value[0], start, index], 'int32', index)
+                    _fused('(%s(%s, %s) ? %s : %s)', [better, b, best, b, best], best._dtype, best)
+                else:
+                    _fused('(%s(%s, %s) ? %s : %s)', [better, value, self._acc, value, self._acc], self._acc._dtype, self._acc)
+            count = array._shape[0]
+        else:
+            def func(start, stop):
+                value = self._block(array, start, stop, op, axis, ddof)
+                if self._acc is None:
+                    self._acc = Ndarray((array._shape[0],)+tuple(value._shape[1:]), value._dtype)
+                self._acc[start:stop].set(value)
+            count = 1
+        def finish():
+            if self._acc is None:
+                if op in ('var', 'std'):
+                    return getattr(array, op)(axis, False, ddof)
+                return getattr(array, op)(axis)
+            if op == 'mean' and count != 1:
+                if count == 0:
+                    return JS("NaN")
+                if isinstance(self._acc, Ndarray):
+                    return self._acc._elementwise('truediv', count, self._acc)
+                return self._acc / count
+            if name == 'moments':
+                n, mean, m2 = self._acc
+                if isinstance(m2, Ndarray):
+                    m2._elementwise('truediv', n-ddof, m2)
+                    if op == 'std':
+                        m2._elementwise('pow', 0.5, m2)
+                    return m2
+                if n - ddof > 0:
+                    m2 = m2 / float(n-ddof)
+                else:
+                    m2 = JS("NaN")
+                if op == 'std':
+                    return m2 ** 0.5
+                return m2
+            if name == 'arg':
+                return self._acc[0]
+            return self._acc
+        self._plan(func, finish, array._shape[0], rowsize, chunk)
+
+    def _batch(self, array, shape, index):
+        if not shape:
+            return array
+        index = index[len(index)-len(shape):]
+        return array[tuple([index[d] if shape[d] > 1 else 0 for d in range(len(shape))])]
+
+    def _setup_matmul(self, array, other, out, chunk):
+        other = array._get_array(other)
+        xshape, yshape = tuple(array._shape), tuple(other._shape)
+        if len(xshape) > 1:
+            xbatch, rows, columns = xshape[:-2], xshape[-2], xshape[-1]
+        else:
+            xbatch, rows, columns = (), None, xshape[0]
+        if len(yshape) > 1:
+            ybatch, width = yshape[:-2], yshape[-1]
+        else:
+            ybatch, width = (), None
+        try:
+            bshape = _broadcast_shape(xbatch, ybatch)
+        except TypeError:
+            raise ValueError('incompatible array shapes for matmul')
+        shape = bshape
+        if rows is not None:
+            shape += (rows,)
+        if width is not None:
+            shape += (width,)
+        if not shape:
+            raise ValueError('chunked matmul requires an array result')
+        if out is None:
+            out = Ndarray(shape, array._dtype)
+        elif tuple(out._shape) != shape:
+            raise ValueError('incompatible output array shape for matmul')
+        elif out._dtype != array._dtype:
+            raise ValueError('incompatible output array dtype for matmul')
+        nrows = rows or 1
+        def func(start, stop):
+            while start < stop:
+                batch, r0 = start // nrows, start % nrows
+                r1 = min(nrows, r0+stop-start)
+                index = self._unravel(batch, bshape)
+                x = self._batch(array, xbatch, index)
+                z = self._batch(out, bshape, index)
+                if rows is not None:
+                    x, z = x[r0:r1], z[r0:r1]
+                x.matmul(self._batch(other, ybatch, index), z)
+                start += r1 - r0
+        self._plan(func, lambda: out, _size(bshape)*nrows, columns*(width or 1), chunk)
+
+    def _setup_filter(self, op, image, param, chunk):
+        data, w, h = image._imagedata.data._data, image._imagedata.width, image._imagedata.height
+        r, stride = image._filter_radius(op, param), w*4
+        def func(start, stop):
+            top, bottom = max(start-r, 0), min(stop+r, h)
+            source = JS("new Uint8ClampedArray((@{{bottom}} - @{{top}}) * @{{stride}})")
+            carry = self._acc
+            if carry is not None:
+                JS("@{{source}}.set(@{{carry}}, 0);")
+            JS("@{{source}}.set(@{{data}}.subarray(@{{start}} * @{{stride}}, @{{bottom}} * @{{stride}}), (@{{start}} - @{{top}}) * @{{stride}});")
+            band = JS("@{{source}}.slice()")
+            image._filter(op, param, band, w, bottom-top)
+            ctop = max(stop-r, 0)
+            self._acc = JS("@{{source}}.subarray((@{{ctop}} - @{{top}}) * @{{stride}}, (@{{stop}} - @{{top}}) * @{{stride}})")
+            JS("@{{data}}.set(@{{band}}.subarray((@{{start}} - @{{top}}) * @{{stride}}, (@{{stop}} - @{{top}}) * @{{stride}}), @{{start}} * @{{stride}});")
+            image._markDirty(0, start, w, stop-start)
+        self._plan(func, lambda: image, h, stride, chunk)
+
+    def _plan(self, func, finish, count, rowsize, chunk):
+        self._func = func
+        self._finish = finish
+        self._count = count
+        self._rows = max(chunk // max(rowsize, 1), 1)
+        return None
+
+    def step(self):
+        """
+        Run the next slice.
+        Return True when the operation is finished.
+        """
+        if self._finished:
+            return True
+        stop = min(self._pos+self._rows, self._count)
+        if stop > self._pos:
+            self._func(self._pos, stop)
+        self._pos = stop
+        if self._pos >= self._count:
+            self._result = self._finish()
+            self._finished = True
+            self._func = self._finish = None
+        return self._finished
+
+    def run(self, budget=None):
+        """
+        Run slices until the operation is finished or budget milliseconds have elapsed, at least one slice per call.
+        Default budget runs to the end.
+        Return True when the operation is finished.
+        """
+        start = JS("Date.now()")
+        while not self.step():
+            if budget is not None and JS("Date.now()") - start >= budget:
+                break
+        return self._finished
+
+    def start(self, callback=None, budget=8):
+        """
+        Run the operation asynchronously, running slices for up to budget milliseconds per event loop turn.
+        Optional argument callback is called with the result when the operation is finished.
+        """
+        def tick():
+            if self.run(budget):
+                if callback is not None:
+                    callback(self._result)
+            else:
+                JS("setTimeout(@{{tick}}, 0);")
+        JS("setTimeout(@{{tick}}, 0);")
+        return None
+
+    def __iter__(self):
+        while not self.step():
+            yield self.getProgress()
+        yield 1.0
+
+    def getProgress(self):
+        """
+        Return fraction of the operation completed, from 0.0 to 1.0.
+        """
+        if self._finished:
+            return 1.0
+        return self._pos / float(self._count)
+
+    def isFinished(self):
+        """
+        Check whether the operation is finished.
+        """
+        return self._finished
+
+    def getResult(self):
+        """
+        Return the operation result, or None before the operation is finished.
+        Elementwise and matmul operations return the out array, reductions a number or array, and filters the ImageMatrix.
+        """
+        return self._result
+
+
+class NP(object):
+
+    def zeros(self, size, dtype):
+        """
+        Return Ndarray of size and dtype with zeroed values.
+        """
+        return Ndarray(size, dtype)
+
+    def swapaxes(self, array, axis1, axis2):
+        """
+        Return array with axes swapped.
+        """
+        return array.swapaxes(axis1, axis2)
+
+    def transpose(self, array, axes=None):
+        """
+        Return array with axes permuted.
+        """
+        if axes is None:
+            return array.transpose()
+        return array.transpose(axes)
+
+    def asmask(self, array):
+        """
+        Return uint8 array flagged as a boolean mask for indexing, a view of a uint8 array or the nonzero elements of another dtype.
+        Comparison results are masks already, other integer arrays index by position.
+        """
+        array = self._array(array)
+        if array._dtype in ('uint8', 'uint8c'):
+            array = array.view()
+            array._mask = True
+            return array
+        return array._elementwise('ne', 0, dtype='uint8')
+
+    def lazy(self, array):
+        """
+        Return LazyArray of array.
+        Operations on the LazyArray are deferred and evaluated in a single fused loop.
+        """
+        return LazyArray(array)
+
+    def frombuffer(self, buffer, dtype='float64', offset=0, count=-1):
+        """
+        Return 1D Ndarray of dtype viewing the data of buffer without copying.
+        Argument buffer is an ArrayBuffer, or a TypedArray, DataView, Ndarray or JavaScript typed array whose data is viewed.
+        Optional argument offset is the start in bytes, count is the number of elements, default -1 reads to the end of the data.
+        A start that is not aligned to the element size cannot be viewed, and is copied to a new buffer instead.
+        """
+        array = Ndarray(0, dtype)
+        itemsize = array._data.getBytesPerElement()
+        buffer, byteoffset, bytelength = _buffer(buffer)
+        if offset < 0 or offset > bytelength:
+            raise ValueError("offset must be non-negative and no greater than buffer length")
+        if count < 0:
+            if (bytelength-offset) % itemsize:
+                raise ValueError("buffer size must be a multiple of element size")
+            count = (bytelength-offset) // itemsize
+        elif offset+count*itemsize > bytelength:
+            raise ValueError("buffer is smaller than requested size")
+        start = byteoffset + offset
+        if start % itemsize:
+            end = start + count*itemsize
+            buffer, start = JS("@{{buffer}}.slice(@{{start}}, @{{end}})"), 0
+        array._data = array._data.__class__(buffer, start, count)
+        array._shape = (count,)
+        return array
+
+    def frombase64(self, text, dtype='uint8'):
+        """
+        Return 1D Ndarray of dtype of the data bytes decoded from a base64 string.
+        """
+        data = JS("@{{_base64}}.decode(@{{text}})")
+        if data is None:
+            raise ValueError("invalid base64 string")
+        return self.frombuffer(data, dtype)
+
+    def fromrle(self, values, counts, shape=None):
+        """
+        Return Ndarray decoded from run values and run lengths, of the dtype of values if an Ndarray.
+        Optional argument shape of the array, default 1D of the total run length.
+        """
+        values, counts = self._array(values)._ascontiguous(), self._array(counts)._ascontiguous()
+        n = _size(values._shape)
+        if _size(counts._shape) != n:
+            raise ValueError("values and counts must have the same size")
+        size = int(counts.sum()) if n else 0
+        if shape is None:
+            shape = (size,)
+        elif isinstance(shape, int):
+            shape = (shape,)
+        if _size(shape) != size:
+            raise ValueError("total run length does not match shape")
+        out = Ndarray(tuple(shape), values._dtype)
+        _values, _counts, z = values._data._data, counts._data._data, out._data._data
+        JS("@{{_kernel_rldecode}}(@{{_values}}, @{{_counts}}, @{{n}}, @{{z}});")
+        return out
+
+    def _npy_header(self, header):
+        values = {}
+        for key in ('descr', 'fortran_order', 'shape'):
+            index = header.find("'%s'" % key)
+            if index < 0:
+                raise ValueError("npy header has no %s" % key)
+            values[key] = header[header.find(':', index)+1:].lstrip()
+        descr = values['descr']
+        if not descr or descr[0] not in '\'"':
+            raise ValueError("npy structured dtype is not supported")
+        descr = descr[1:descr.find(descr[0], 1)]
+        fortran = values['fortran_order'].startswith('True')
+        shape = values['shape']
+        shape = [dim.strip() for dim in shape[1:shape.find(')')].split(',')]
+        shape = tuple([int(dim) for dim in shape if dim])
+        return descr, fortran, shape
+
+    def load_npy(self, buffer):
+        """
+        Return Ndarray of the NumPy .npy format data in buffer.
+        Argument buffer is an ArrayBuffer, or a TypedArray, DataView or JavaScript typed array whose data is read.
+        The array is a view of the buffer when the data is aligned and in native byte order, otherwise the data is copied.
+        Fortran order data returns a transposed view, and a 0-d array is returned with shape (1,).
+        """
+        buffer, byteoffset, bytelength = _buffer(buffer)
+        data = Uint8Array(buffer, byteoffset, bytelength)
+        if bytelength < 10 or data[0] != 0x93 or ''.join([chr(data[index]) for index in range(1, 6)]) != 'NUMPY':
+            raise ValueError("buffer is not in .npy format")
+        if data[6] == 1:
+            start = 10
+            length = data[8] | (data[9] << 8)
+        elif data[6] in (2, 3) and bytelength >= 12:
+            start = 12
+            length = data[8] | (data[9] << 8) | (data[10] << 16) | (data[11] << 24)
+        else:
+            raise ValueError("unsupported .npy format version %d" % data[6])
+        if start+length > bytelength:
+            raise ValueError("npy header is truncated")
+        header = ''.join([chr(data[index]) for index in range(start, start+length)])
+        descr, fortran, shape = self._npy_header(header)
+        order, code = descr[:1], descr[1:]
+        if code == 'b1':
+            code = 'u1'
+        try:
+            dtype = Ndarray(0, code)._dtype
+        except KeyError:
+            raise ValueError("unsupported .npy dtype %s" % descr)
+        if not shape:
+            shape = (1,)
+        count, itemsize, offset = _size(shape), int(code[1:]), start+length
+        if offset+count*itemsize > bytelength:
+            raise ValueError("npy data is truncated")
+        if itemsize > 1 and ((order == '<' and not _littleendian) or (order == '>' and _littleendian)):
+            data = data.slice(offset, offset+count*itemsize)
+            _data = data._data
+            JS("@{{_kernel_byteswap}}(@{{_data}}, @{{itemsize}});")
+            array = self.frombuffer(data, dtype, 0, count)
+        else:
+            array = self.frombuffer(data, dtype, offset, count)
+        if fortran:
+            return array.reshape(shape[::-1]).transpose()
+        return array.reshape(shape)
+
+    def run_chunked(self, op, array, other=None, chunk=65536, axis=None, out=None):
+        """
+        Return ChunkedRun of operation op on array, processed in slices of about chunk elements.
+        Iterate the run to yield between slices, call run(budget) per frame, or start(callback) to run asynchronously.
+        Operations are the elementwise operators, 'set', the reductions 'sum', 'prod', 'min', 'max', 'mean', 'var', 'std', 'argmin' and 'argmax', 'matmul', and the ImageMatrix filters.
+        """
+        return ChunkedRun(op, array, other, chunk, axis, out)
+
+    def dtype(self, dtype):
+        """
+        Return data type.
+        Argument dtype is an Ndarray dtype, returning its name, or a list of (name, dtype) or (name, dtype, shape) fields, returning a RecordDtype.
+        """
+        if isinstance(dtype, RecordDtype):
+            return dtype
+        if isinstance(dtype, list):
+            return RecordDtype(dtype)
+        return Ndarray(0, dtype)._dtype
+
+    def recarray(self, size, dtype, layout='aos', buffer=None):
+        """
+        Return RecordArray of size records of dtype, a RecordDtype or list of fields, in one ArrayBuffer.
+        Optional argument layout is 'aos' (array of structs) or 'soa' (struct of arrays).
+        Optional argument buffer is an ArrayBuffer, TypedArray or Ndarray whose data is viewed.
+        """
+        return RecordArray(size, dtype, layout, buffer)
+
+    def _array(self, array, other=None):
+        if isinstance(array, Ndarray):
+            return array
+        if isinstance(other, Ndarray):
+            dtype = other._dtype
+        else:
+            dtype = 'float64'
+        if not hasattr(array, '__iter__'):
+            array = [array]
+        elif not isinstance(array, list):
+            array = list(array)
+        return Ndarray(array, dtype)
+
+    def add(self, array1, array2, out=None):
+        """
+        Return elementwise sum of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('add', array2, out)
+
+    def subtract(self, array1, array2, out=None):
+        """
+        Return elementwise difference of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('sub', array2, out)
+
+    def multiply(self, array1, array2, out=None):
+        """
+        Return elementwise product of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('mul', array2, out)
+
+    def divide(self, array1, array2, out=None):
+        """
+        Return elementwise quotient of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('truediv', array2, out)
+
+    def true_divide(self, array1, array2, out=None):
+        """
+        Return elementwise quotient of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('truediv', array2, out)
+
+    def floor_divide(self, array1, array2, out=None):
+        """
+        Return elementwise floor quotient of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('floordiv', array2, out)
+
+    def mod(self, array1, array2, out=None):
+        """
+        Return elementwise remainder of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('mod', array2, out)
+
+    def power(self, array1, array2, out=None):
+        """
+        Return elementwise power of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('pow', array2, out)
+
+    def left_shift(self, array1, array2, out=None):
+        """
+        Return elementwise left bit shift of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('lshift', array2, out)
+
+    def right_shift(self, array1, array2, out=None):
+        """
+        Return elementwise right bit shift of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('rshift', array2, out)
+
+    def bitwise_and(self, array1, array2, out=None):
+        """
+        Return elementwise bitwise and of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('and', array2, out)
+
+    def bitwise_or(self, array1, array2, out=None):
+        """
+        Return elementwise bitwise or of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('or', array2, out)
+
+    def bitwise_xor(self, array1, array2, out=None):
+        """
+        Return elementwise bitwise xor of arrays.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('xor', array2, out)
+
+    def less(self, array1, array2, out=None):
+        """
+        Return elementwise array1 < array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('lt', array2, out, 'uint8')
+
+    def less_equal(self, array1, array2, out=None):
+        """
+        Return elementwise array1 <= array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('le', array2, out, 'uint8')
+
+    def equal(self, array1, array2, out=None):
+        """
+        Return elementwise array1 == array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('eq', array2, out, 'uint8')
+
+    def not_equal(self, array1, array2, out=None):
+        """
+        Return elementwise array1 != array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('ne', array2, out, 'uint8')
+
+    def greater(self, array1, array2, out=None):
+        """
+        Return elementwise array1 > array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('gt', array2, out, 'uint8')
+
+    def greater_equal(self, array1, array2, out=None):
+        """
+        Return elementwise array1 >= array2 as uint8 array.
+        Optional argument out is a uint8 array to write the result into.
+        """
+        return self._array(array1, array2)._elementwise('ge', array2, out, 'uint8')
+
+    def negative(self, array, out=None):
+        """
+        Return elementwise negation of array.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array)._elementwise('neg', 0, out)
+
+    def absolute(self, array, out=None):
+        """
+        Return elementwise absolute value of array.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array)._elementwise('abs', 0, out)
+
+    def invert(self, array, out=None):
+        """
+        Return elementwise bitwise inversion of array.
+        Optional argument out is an array to write the result into.
+        """
+        return self._array(array)._elementwise('invert', 0, out)
+
+    def sum(self, array, axis=None, keepdims=False):
+        """
+        Return sum of array elements along axis.
+        """
+        return self._array(array).sum(axis, keepdims)
+
+    def prod(self, array, axis=None, keepdims=False):
+        """
+        Return product of array elements along axis.
+        """
+        return self._array(array).prod(axis, keepdims)
+
+    def mean(self, array, axis=None, keepdims=False):
+        """
+        Return mean of array elements along axis.
+        Returns NaN if there are no elements to average.
+        """
+        return self._array(array).mean(axis, keepdims)
+
+    def min(self, array, axis=None, keepdims=False):
+        """
+        Return minimum of array elements along axis.
+        """
+        return self._array(array).min(axis, keepdims)
+
+    def max(self, array, axis=None, keepdims=False):
+        """
+        Return maximum of array elements along axis.
+        """
+        return self._array(array).max(axis, keepdims)
+
+    def argmin(self, array, axis=None, keepdims=False):
+        """
+        Return index of minimum array element along axis.
+        """
+        return self._array(array).argmin(axis, keepdims)
+
+    def argmax(self, array, axis=None, keepdims=False):
+        """
+        Return index of maximum array element along axis.
+        """
+        return self._array(array).argmax(axis, keepdims)
+
+    def var(self, array, axis=None, keepdims=False, ddof=0):
+        """
+        Return variance of array elements along axis.
+        """
+        return self._array(array).var(axis, keepdims, ddof)
+
+    def std(self, array, axis=None, keepdims=False, ddof=0):
+        """
+        Return standard deviation of array elements along axis.
+        """
+        return self._array(array).std(axis, keepdims, ddof)
+
+    def where(self, condition, x=None, y=None):
+        """
+        Return elementwise x where condition is nonzero, otherwise y, broadcasting arrays and scalars together in a single loop.
+        With only the condition argument, return nonzero(condition).
+        """
+        if x is None and y is None:
+            return self.nonzero(condition)
+        if x is None or y is None:
+            raise ValueError("either both or neither of x and y should be given")
+        operands, dtype = [self._array(condition)], None
+        for value in (x, y):
+            if hasattr(value, '__iter__'):
+                value = self._array(value)
+                if dtype is None:
+                    dtype = value._dtype
+            operands.append(value)
+        if dtype is None:
+            dtype = 'float64'
+        return _fused('(%s !== 0 ? %s : %s)', operands, dtype)
+
+    def nonzero(self, array):
+        """
+        Return tuple of int32 arrays of the indices of nonzero elements, one array per dimension.
+        """
+        array = self._array(array)
+        x, xo = array._data._data, array._offset
+        shape, strides = _jsarray(array._shape), _jsarray(array._indices)
+        count = JS("@{{_kernel_nonzero}}(@{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, null)")
+        result = [Ndarray(count, 'int32') for axis in range(len(array._shape))]
+        coords = _jsarray([index._data._data for index in result])
+        JS("@{{_kernel_nonzero}}(@{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, @{{coords}})")
+        return tuple(result)
+
+    def count_nonzero(self, array, axis=None):
+        """
+        Return number of nonzero elements.
+        Optional argument axis to count along, returned as an int32 array.
+        """
+        array = self._array(array)
+        if axis is not None:
+            return array._elementwise('ne', 0, dtype='uint8').sum(axis).astype('int32')
+        x, xo = array._data._data, array._offset
+        shape, strides = _jsarray(array._shape), _jsarray(array._indices)
+        return int(JS("@{{_kernel_nonzero}}(@{{x}}, @{{xo}}, @{{shape}}, @{{strides}}, null)"))
+
+    def clip(self, array, a_min, a_max, out=None):
+        """
+        Return array with elements limited to the range a_min to a_max, either bound may be None.
+        Bounds may be scalars or arrays broadcast with array.
+        Optional argument out is an array to write the result into.
+        """
+        if a_min is None and a_max is None:
+            raise ValueError("one of a_min or a_max must be given")
+        array = self._array(array)
+        expr, operands = '%s', [array]
+        for func, bound in (('Math.max', a_min), ('Math.min', a_max)):
+            if bound is not None:
+                if hasattr(bound, '__iter__'):
+                    bound = self._array(bound, array)
+                expr = func + '(' + expr + ', %s)'
+                operands.append(bound)
+        return _fused(expr, operands, array._dtype, out)
+
+    def select(self, condlist, choicelist, default=0):
+        """
+        Return array of elements from the choice of the first nonzero condition, otherwise default.
+        Conditions and choices are arrays or scalars broadcast together in a single loop.
+        """
+        if len(condlist) != len(choicelist):
+            raise ValueError("condlist and choicelist must be the same length")
+        operands, dtype = [], None
+        for i in range(len(condlist)):
+            choice = choicelist[i]
+            if hasattr(choice, '__iter__'):
+                choice = self._array(choice)
+                if dtype is None:
+                    dtype = choice._dtype
+            operands.extend([self._array(condlist[i]), choice])
+        if hasattr(default, '__iter__'):
+            default = self._array(default)
+        operands.append(default)
+        if dtype is None:
+            dtype = 'float64'
+        expr = '(%s !== 0 ? %s : ' * len(condlist) + '%s' + ')' * len(condlist)
+        return _fused(expr, operands, dtype)
+
+    def compress(self, condition, array, axis=None):
+        """
+        Return array of the slices along axis where condition is nonzero.
+        """
+        return self._array(array).compress(condition, axis)
+
+    def take(self, array, indices, axis=None):
+        """
+        Return array of elements gathered at indices along axis.
+        """
+        return self._array(array).take(indices, axis)
+
+    def put(self, array, indices, values):
+        """
+        Set elements of array at flat indices to values.
+        """
+        array.put(indices, values)
+        return None
+
+    def cumsum(self, array, axis=None, dtype=None):
+        """
+        Return cumulative sum of array elements along axis.
+        """
+        return self._array(array).cumsum(axis, dtype)
+
+    def cumprod(self, array, axis=None, dtype=None):
+        """
+        Return cumulative product of array elements along axis.
+        """
+        return self._array(array).cumprod(axis, dtype)
+
+    def histogram(self, array, bins=10, range=None):
+        """
+        Return histogram of array elements as a tuple of uint32 counts and float64 bin edges.
+        Argument bins is the number of equal-width bins over range (lower, upper), default the array min and max, or a sequence of bin edges.
+        Each bin includes its lower edge, the last bin also includes its upper edge, and elements outside the bins are not counted.
+        """
+        array = self._array(array)._ascontiguous()
+        x, n = array._data._data, _size(array._shape)
+        if isinstance(bins, int):
+            if range is not None:
+                lower, upper = range[0], range[1]
+            elif n:
+                lower, upper = array.min(), array.max()
+            else:
+                lower, upper = 0.0, 1.0
+            if lower > upper:
+                raise ValueError("histogram range lower bound must not exceed upper bound")
+            if lower == upper:
+                lower, upper = lower - 0.5, upper + 0.5
+            edges = Ndarray(bins+1, 'float64')
+            width = (upper - lower) / float(bins)
+            index = 0
+            while index <= bins:
+                edges[index] = lower + index*width
+                index += 1
+            edges[bins] = upper
+            _edges = None
+        else:
+            edges = Ndarray(list(bins), 'float64')
+            bins = len(edges) - 1
+            lower, upper = edges[0], edges[bins]
+            _edges = edges._data._data
+        counts = Ndarray(bins, 'uint32')
+        _counts = counts._data._data
+        JS("@{{_kernel_histogram}}(@{{x}}, @{{n}}, @{{bins}}, @{{lower}}, @{{upper}}, @{{_edges}}, @{{_counts}});")
+        return counts, edges
+
+    def bincount(self, array, weights=None, minlength=0):
+        """
+        Return count of occurrences of each value in a non-negative integer array as uint32.
+        Optional argument weights is an array of weights to sum per value instead, returned as float64.
+        Optional argument minlength is the minimum number of bins.
+        """
+        array = self._array(array)
+        if 'int' not in array._dtype:
+            raise TypeError("bincount requires an integer array")
+        array = array._ascontiguous()
+        x, n = array._data._data, _size(array._shape)
+        top = JS("@{{_kernel_bincount}}('max', @{{x}}, @{{n}}, null, null)")
+        if top < 0:
+            raise ValueError("bincount requires non-negative values")
+        length = max(int(top)+1, minlength)
+        if weights is None:
+            counts = Ndarray(length, 'uint32')
+            _weights = None
+        else:
+            weights = self._array(weights)
+            if _size(weights._shape) != n:
+                raise ValueError("weights and array must have the same size")
+            weights = weights._ascontiguous()
+            counts = Ndarray(length, 'float64')
+            _weights = weights._data._data
+        _counts = counts._data._data
+        JS("@{{_kernel_bincount}}('count', @{{x}}, @{{n}}, @{{_weights}}, @{{_counts}});")
+        return counts
+
+    def sort(self, array, axis=-1):
+        """
+        Return sorted copy of array along axis, axis None sorts the flattened array.
+        """
+        array = self._array(array).copy()
+        if axis is None:
+            array, axis = array._flattened(), 0
+        array.sort(axis)
+        return array
+
+    def argsort(self, array, axis=-1):
+        """
+        Return int32 array of indices that sort array along axis.
+        """
+        return self._array(array).argsort(axis)
+
+    def partition(self, array, kth, axis=-1):
+        """
+        Return copy of array partitioned along axis at index kth, axis None partitions the flattened array.
+        """
+        array = self._array(array).copy()
+        if axis is None:
+            array, axis = array._flattened(), 0
+        array.partition(kth, axis)
         return array
 
-    def tolist(self):
+    def argpartition(self, array, kth, axis=-1):
         """
-        Return array as a list.
+        Return int32 array of indices that partition array along axis at index kth.
         """
-        def to_list(array, l):
-            if hasattr(array[0], '__iter__'):
-                if len(l) == 0:
-                    _l = l
-                else:
-                    l = [l]
-                    _l = l[0]
-                for i, a in enumerate(array):
-                    _l.append([])
-                    to_list(a, _l[i])
-            else:
-                l.extend([v for v in array])
-            return l
-        return to_list(self, [])
+        return self._array(array).argpartition(kth, axis)
 
-    def getArray(self):
+    def searchsorted(self, array, v, side='left'):
         """
-        Return JavaScript TypedArray.
+        Return indices where values v would be inserted into sorted 1D array to keep it sorted.
+        Argument v is a number, returning an int, or an array, returning an int32 array of its shape.
+        Optional argument side 'left' gives the first suitable index and 'right' the last.
         """
-        return self._data.getArray()
-
-
-class NP(object):
-
-    def zeros(self, size, dtype):
+        array = self._array(array)
+        if len(array._shape) != 1:
+            raise ValueError("searchsorted requires a 1D array")
+        if side not in ('left', 'right'):
+            raise ValueError("side must be 'left' or 'right'")
+        right = side == 'right'
+        a, ao, stride, n = array._data._data, array._offset, array._indices[0], array._shape[0]
+        if hasattr(v, '__iter__'):
+            values = self._array(v)._ascontiguous()
+            out = Ndarray(tuple(values._shape), 'int32')
+            m, v, z = _size(values._shape), values._data._data, out._data._data
+        else:
+            out, m = None, 1
+            v, z = Float64Array([v])._data, Int32Array(1)._data
+        JS("@{{_kernel_searchsorted}}(@{{a}}, @{{ao}}, @{{stride}}, @{{n}}, @{{v}}, @{{m}}, @{{right}}, @{{z}});")
+        if out is None:
+            return int(JS("@{{z}}[0]"))
+        return out
+
+    def unique(self, array, return_counts=False):
         """
-        Return Ndarray of size and dtype with zeroed values.
+        Return sorted 1D array of the unique elements of array, NaN values count as one element.
+        Optional argument return_counts also returns uint32 array of the occurrences of each unique element.
         """
-        return Ndarray(size, dtype)
-
-    def swapaxes(self, array, axis1, axis2):
+        array = self._array(array)
+        s = array.copy()._data._data
+        JS("@{{s}}.sort();")
+        n = _size(array._shape)
+        count = JS("@{{_kernel_unique}}(@{{s}}, @{{n}}, null, null)")
+        values = Ndarray(int(count), array._dtype)
+        _values, _counts = values._data._data, None
+        if return_counts:
+            counts = Ndarray(int(count), 'uint32')
+            _counts = counts._data._data
+        JS("@{{_kernel_unique}}(@{{s}}, @{{n}}, @{{_values}}, @{{_counts}});")
+        if return_counts:
+            return values, counts
+        return values
+
+    def matmul(self, array1, array2, out=None):
         """
-        Return array with axes swapped.
+        Return matrix product of arrays.
+        Optional argument out is an array of the result shape and array1 dtype to write into.
         """
-        return array.swapaxes(axis1, axis2)
+        return array1.matmul(array2, out)
 
     def append(self, array, values):
         """
@@ -1364,6 +5597,7 @@ class NP(object):
         """
         if isinstance(values[0], (list,tuple,TypedArray)):
             values = [value for dat in values for value in dat]
+        array = array._ascontiguous()
         newarray = Ndarray(len(array)+len(values), array._dtype)
         newarray._data.set(array._data)
         newarray._data.set(values, len(array))
@@ -1405,9 +5639,13 @@ class ImageMatrix(Ndarray):
         self._imagedata = ImageData(imagedata)
         if isinstance(self._imagedata.data, Uint8ClampedArray):
             Ndarray.__init__(self, self._imagedata.data, 'uint8c')
+            data = self._imagedata.data
+            self._pixels = Uint32Array(data.getBuffer(), data.getByteOffset(), self._imagedata.width*self._imagedata.height)
         else:
             Ndarray.__init__(self, self._imagedata.data, 'uint8')
+            self._pixels = None
         self.setshape(self._imagedata.height,self._imagedata.width,4)
+        self._dirty = None
 
     shape = Ndarray.shape
 
@@ -1423,6 +5661,113 @@ class ImageMatrix(Ndarray):
         """
         return self._imagedata.height
 
+    def setDirtyTracking(self, track=True):
+        """
+        Set tracking of modified regions from pixel setters, item assignment, blit, fill and filters.
+        Other array operations writing into the image, such as in-place operators, set, put or an out argument, mark the whole image.
+        Disabling tracking discards recorded regions.
+        """
+        if track:
+            if self._dirty is None:
+                self._dirty = []
+        else:
+            self._dirty = None
+        return None
+
+    def getDirtyRects(self):
+        """
+        Return list of (x, y, width, height) bounding rects of regions modified since clearDirty.
+        Overlapping or adjacent regions are merged, and the list is kept to at most 8 rects.
+        """
+        if self._dirty is None:
+            return []
+        return [(rect[0], rect[1], rect[2]-rect[0], rect[3]-rect[1]) for rect in self._dirty]
+
+    def clearDirty(self):
+        """
+        Clear recorded modified regions.
+        """
+        if self._dirty is not None:
+            self._dirty = []
+        return None
+
+    def _markDirty(self, x=0, y=0, w=None, h=None):
+        if self._dirty is None:
+            return None
+        if w is None:
+            w, h = self._imagedata.width, self._imagedata.height
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x+w, self._imagedata.width), min(y+h, self._imagedata.height)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        rects = self._dirty
+        for rect in rects:
+            if rect[0] <= x0 and rect[1] <= y0 and rect[2] >= x1 and rect[3] >= y1:
+                return None
+        merged = True
+        while merged:
+            merged = False
+            for rect in rects:
+                if rect[0] <= x1 and x0 <= rect[2] and rect[1] <= y1 and y0 <= rect[3]:
+                    x0, y0 = min(x0, rect[0]), min(y0, rect[1])
+                    x1, y1 = max(x1, rect[2]), max(y1, rect[3])
+                    rects.remove(rect)
+                    merged = True
+                    break
+        rects.append([x0, y0, x1, y1])
+        while len(rects) > 8:
+            best = None
+            for i in range(len(rects)):
+                for j in range(i+1, len(rects)):
+                    a, b = rects[i], rects[j]
+                    growth = ((max(a[2], b[2]) - min(a[0], b[0])) * (max(a[3], b[3]) - min(a[1], b[1]))
+                              - (a[2]-a[0])*(a[3]-a[1]) - (b[2]-b[0])*(b[3]-b[1]))
+                    if best is None or growth < best[0]:
+                        best = (growth, i, j)
+            a, b = rects[best[1]], rects[best[2]]
+            del rects[best[2]]
+            rects[best[1]] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+        return None
+
+    def _modified(self):
+        self._markDirty()
+        return None
+
+    def _markIndex(self, index):
+        if self._is_fancy(index):
+            return None
+        if not isinstance(index, (list,tuple)):
+            index = (index,)
+        bounds = []
+        for axis in range(2):
+            dim = self._shape[axis]
+            if axis >= len(index):
+                bounds.append((0, dim))
+                continue
+            i = index[axis]
+            if isinstance(i, slice):
+                start, length, step = _slice_range(i.start, i.stop, i.step, dim)
+                last = start + step*(length-1)
+                bounds.append((min(start, last), max(start, last)+1))
+            else:
+                if i < 0:
+                    i += dim
+                bounds.append((i, i+1))
+        self._markDirty(bounds[1][0], bounds[0][0], bounds[1][1]-bounds[1][0], bounds[0][1]-bounds[0][0])
+        return None
+
+    def __setitem__(self, index, value):
+        Ndarray.__setitem__(self, index, value)
+        if self._dirty is not None:
+            self._markIndex(index)
+        return None
+
+    def __setslice__(self, lower, upper, data):
+        Ndarray.__setslice__(self, lower, upper, data)
+        if self._dirty is not None:
+            self._markIndex(slice(lower, upper))
+        return None
+
     def getPixel(self, index):
         """
         Get pixel RGBA.
@@ -1438,6 +5783,8 @@ class ImageMatrix(Ndarray):
         """
         i = (index[0]*self._indices[0]) + (index[1]*4)
         self._imagedata.data[i], self._imagedata.data[i+1], self._imagedata.data[i+2], self._imagedata.data[i+3] = value[0], value[1], value[2], value[3]
+        if self._dirty is not None:
+            self._markDirty(index[1], index[0], 1, 1)
         return None
 
     def getPixelRGB(self, index):
@@ -1455,6 +5802,8 @@ class ImageMatrix(Ndarray):
         """
         i = (index[0]*self._indices[0]) + (index[1]*4)
         self._imagedata.data[i], self._imagedata.data[i+1], self._imagedata.data[i+2] = value[0], value[1], value[2]
+        if self._dirty is not None:
+            self._markDirty(index[1], index[0], 1, 1)
         return None
 
     def getPixelAlpha(self, index):
@@ -1472,6 +5821,8 @@ class ImageMatrix(Ndarray):
         """
         i = (index[0]*self._indices[0]) + (index[1]*4)
         self._imagedata.data[i+3] = value
+        if self._dirty is not None:
+            self._markDirty(index[1], index[0], 1, 1)
         return None
 
     def getPixelInteger(self, index):
@@ -1479,16 +5830,332 @@ class ImageMatrix(Ndarray):
         Get pixel integer color.
         The index arguement references the 2D array element.
         """
-        i = (index[0]*self._indices[0]) + (index[1]*4)
-        return self._imagedata.data[i]<<16 | self._imagedata.data[i+1]<<8 | self._imagedata.data[i+2] | self.imagedata.data[i+3]<<24
+        if self._pixels is None:
+            i = (index[0]*self._indices[0]) + (index[1]*4)
+            data = self._imagedata.data._data
+            return JS("((@{{data}}[+@{{i}}+3] << 24) | (@{{data}}[+@{{i}}] << 16) | (@{{data}}[+@{{i}}+1] << 8) | @{{data}}[+@{{i}}+2]) >>> 0")
+        i = (index[0]*self._imagedata.width) + index[1]
+        pixels = self._pixels._data
+        return JS("@{{_pixel_argb}}(@{{pixels}}[@{{i}}])")
 
     def setPixelInteger(self, index, value):
         """
         Set pixel integer color.
         The arguements index references the 2D array element and value is pixel color.
         """
-        i = (index[0]*self._indices[0]) + (index[1]*4)
-        self._imagedata.data[i], self._imagedata.data[i+1], self._imagedata.data[i+2], self._imagedata.data[i+3] = value>>16 & 0xff, value>>8 & 0xff, value & 0xff, value>>24 & 0xff
+        if self._pixels is None:
+            i = (index[0]*self._indices[0]) + (index[1]*4)
+            self._imagedata.data[i], self._imagedata.data[i+1], self._imagedata.data[i+2], self._imagedata.data[i+3] = value>>16 & 0xff, value>>8 & 0xff, value & 0xff, value>>24 & 0xff
+            if self._dirty is not None:
+                self._markDirty(index[1], index[0], 1, 1)
+            return None
+        i = (index[0]*self._imagedata.width) + index[1]
+        pixels = self._pixels._data
+        if not pyjs_mode.optimized:
+            value = value.valueOf()
+        JS("@{{pixels}}[@{{i}}] = @{{_pixel_native}}(@{{value}});")
+        if self._dirty is not None:
+            self._markDirty(index[1], index[0], 1, 1)
+        return None
+
+    def getPixelArray(self):
+        """
+        Return Uint32Array view of the pixels sharing the ImageData buffer.
+        Elements are in platform byte order, see getPixelInteger for ARGB integer color.
+        """
+        return self._pixels
+
+    def _rect(self, rect):
+        width, height = self._imagedata.width, self._imagedata.height
+        if rect is None:
+            return (0, 0, width, height, 0, 0)
+        x, y = max(rect[0], 0), max(rect[1], 0)
+        w = min(rect[0]+rect[2], width) - x
+        h = min(rect[1]+rect[3], height) - y
+        return (x, y, max(w, 0), max(h, 0), x-rect[0], y-rect[1])
+
+    def _pixelop(self, op, rect, data, dw, value):
+        if self._pixels is None:
+            raise TypeError('packed pixel access requires Uint8ClampedArray ImageData')
+        x, y, w, h, dx, dy = self._rect(rect)
+        if w == 0 or h == 0:
+            return (w, h)
+        pixels, stride = self._pixels._data, self._imagedata.width
+        if dw is None:
+            dw = w
+        doff = dy*dw + dx
+        if data is not None:
+            data = data._data
+        if op == 'get':
+            doff = 0
+        elif op == 'fill' and not pyjs_mode.optimized:
+            value = value.valueOf()
+        JS("@{{_kernel_pixels}}(@{{op}}, @{{pixels}}, @{{stride}}, @{{x}}, @{{y}}, @{{w}}, @{{h}}, @{{data}}, @{{dw}}, @{{doff}}, @{{value}});")
+        if op != 'get':
+            self._markDirty(x, y, w, h)
+        return (w, h)
+
+    def getPixels(self, rect=None):
+        """
+        Get pixels as integer color.
+        Optional rect argument (x, y, width, height) is the region clipped to the image, defaults to whole image.
+        Return Uint32Array of the region row by row.
+        """
+        x, y, w, h, dx, dy = self._rect(rect)
+        data = Uint32Array(max(w*h, 1))
+        self._pixelop('get', rect, data, w, 0)
+        return data
+
+    def setPixels(self, rect, data):
+        """
+        Set pixels from integer color.
+        The arguments rect (x, y, width, height) is the region clipped to the image, and data is a Uint32Array or list of colors laid out row by row over rect.
+        """
+        if rect is None:
+            rect = (0, 0, self._imagedata.width, self._imagedata.height)
+        if not isinstance(data, TypedArray):
+            data = Uint32Array(data)
+        if len(data) < rect[2]*rect[3]:
+            raise ValueError('data length does not match rect size')
+        self._pixelop('set', rect, data, rect[2], 0)
+        return None
+
+    def fillRect(self, rect, color):
+        """
+        Fill pixels with integer color.
+        The rect argument (x, y, width, height) is the region clipped to the image, or None for whole image.
+        """
+        self._pixelop('fill', rect, None, None, color)
+        return None
+
+    def mapPixels(self, func, rect=None):
+        """
+        Map pixels with function that takes and returns an integer color.
+        Optional rect argument (x, y, width, height) is the region clipped to the image, defaults to whole image.
+        """
+        self._pixelop('map', rect, None, None, func)
+        return None
+
+    def blit(self, src, dest_xy, src_rect=None, mode='copy', colorkey=None):
+        """
+        Draw ImageMatrix src onto this image at position dest_xy (x, y).
+        Optional src_rect (x, y, width, height) is the region of src to draw, defaults to whole src.
+        The mode argument is 'copy', 'colorkey' to skip src pixels with the RGB of integer color colorkey, 'alpha' for source-over alpha blending, or 'add' and 'multiply' to blend RGB keeping destination alpha.
+        Return the clipped destination rect (x, y, width, height).
+        """
+        if mode not in ('copy', 'colorkey', 'alpha', 'add', 'multiply'):
+            raise ValueError("mode must be 'copy', 'colorkey', 'alpha', 'add' or 'multiply'")
+        if mode == 'colorkey' and colorkey is None:
+            raise ValueError('colorkey mode requires colorkey color')
+        if self._pixels is None or src._pixels is None:
+            raise TypeError('packed pixel access requires Uint8ClampedArray ImageData')
+        sx, sy, w, h, ox, oy = src._rect(src_rect)
+        x, y, w, h, ox, oy = self._rect((dest_xy[0]+ox, dest_xy[1]+oy, w, h))
+        if w == 0 or h == 0:
+            return (x, y, w, h)
+        sx, sy = sx+ox, sy+oy
+        dst, dbytes, dstride = self._pixels._data, self._imagedata.data._data, self._imagedata.width
+        spixels, sbytes, sstride = src._pixels._data, src._imagedata.data._data, src._imagedata.width
+        JS("@{{_kernel_blit}}(@{{mode}}, @{{dst}}, @{{dbytes}}, @{{dstride}}, @{{x}}, @{{y}}, @{{spixels}}, @{{sbytes}}, @{{sstride}}, @{{sx}}, @{{sy}}, @{{w}}, @{{h}}, @{{colorkey}});")
+        self._markDirty(x, y, w, h)
+        return (x, y, w, h)
+
+    def _filter_radius(self, op, param):
+        if op == 'gaussian_blur':
+            if not param > 0:
+                raise ValueError("sigma must be positive")
+            return max(int(_ceil(param*3)), 1)
+        if op == 'sobel':
+            return 1
+        return param
+
+    def _filter(self, op, param, data, w, h):
+        if op == 'gaussian_blur':
+            radius = self._filter_radius(op, param)
+            weights = [_exp(-(i*i)/(2.0*param*param)) for i in range(-radius, radius+1)]
+            total = sum(weights)
+            vector = Float64Array([weight/total for weight in weights])._data
+            size = 2*radius+1
+            array = Uint8ClampedArray()
+            array.setArray(data)
+            band = Ndarray(array, 'uint8c')
+            band.setshape((h, w, 4))
+            band._convolve(None, size, size, vector, vector, 'same', 'nearest', 0, band)
+        elif op == 'box_blur':
+            JS("@{{_kernel_boxblur}}(@{{data}}, @{{w}}, @{{h}}, 4, @{{param}});")
+        elif op == 'median':
+            JS("@{{_kernel_median}}(@{{data}}, @{{w}}, @{{h}}, 4, @{{param}});")
+        else:
+            JS("@{{_kernel_sobel}}(@{{data}}, @{{w}}, @{{h}}, 4);")
+        return None
+
+    def gaussian_blur(self, sigma):
+        """
+        Blur image in place with a Gaussian of standard deviation sigma, as two 1D passes per channel.
+        Raises ValueError if sigma is not positive.
+        """
+        self._filter('gaussian_blur', sigma, self._imagedata.data._data, self._imagedata.width, self._imagedata.height)
+        self._modified()
+        return None
+
+    def box_blur(self, r):
+        """
+        Blur image in place with a (2r+1) square box, using running sums per channel.
+        """
+        self._filter('box_blur', r, self._imagedata.data._data, self._imagedata.width, self._imagedata.height)
+        self._modified()
+        return None
+
+    def median(self, r):
+        """
+        Filter image in place with the median of a (2r+1) square window per channel.
+        """
+        self._filter('median', r, self._imagedata.data._data, self._imagedata.width, self._imagedata.height)
+        self._modified()
+        return None
+
+    def sobel(self):
+        """
+        Replace image RGB in place with Sobel gradient magnitude per channel, alpha is kept.
+        """
+        self._filter('sobel', None, self._imagedata.data._data, self._imagedata.width, self._imagedata.height)
+        self._modified()
+        return None
+
+    def resize(self, height, width, method='bilinear', out=None):
+        """
+        Return image resampled to height and width, in the argument order of Ndarray.resize.
+        Optional argument method is 'nearest', 'bilinear' or 'area' for box-area averaging.
+        Optional argument out is an ImageMatrix of the result size to write into, otherwise a new ImageData is created.
+        """
+        if out is None:
+            if not pyjs_mode.optimized:
+                width, height = width.valueOf(), height.valueOf()
+            out = ImageMatrix(JS("new ImageData(@{{width}}, @{{height}})"))
+        Ndarray.resize(self, height, width, method, out)
+        return out
+
+    def to_grayscale(self, out=None):
+        """
+        Return image luma as a uint8 Ndarray of shape (height, width).
+        Optional argument out is a contiguous (height, width) array to write into, or an ImageMatrix of equal size to set its RGB to the luma keeping alpha.
+        """
+        w, h = self._imagedata.width, self._imagedata.height
+        rgba = isinstance(out, ImageMatrix)
+        if out is None:
+            out = Ndarray((h, w), 'uint8')
+        elif rgba:
+            if out.getWidth() != w or out.getHeight() != h:
+                raise TypeError("array shapes are not compatible")
+        elif tuple(out._shape) != (h, w) or not out._is_contiguous():
+            raise TypeError("array shapes are not compatible")
+        data, n, dst = self._imagedata.data._data, w*h, out._data._data
+        JS("@{{_kernel_grayscale}}(@{{data}}, @{{n}}, @{{dst}}, @{{rgba}});")
+        if rgba:
+            out._modified()
+        return out
+
+    def to_hsv(self, out=None):
+        """
+        Return image HSV as a float32 Ndarray of shape (height, width, 3) with components in range 0 to 1.
+        Optional argument out is a contiguous (height, width, 3) array to write into.
+        """
+        w, h = self._imagedata.width, self._imagedata.height
+        if out is None:
+            out = Ndarray((h, w, 3), 'float32')
+        elif tuple(out._shape) != (h, w, 3) or not out._is_contiguous():
+            raise TypeError("array shapes are not compatible")
+        op, data, n, hsv = 'to', self._imagedata.data._data, w*h, out._data._data
+        JS("@{{_kernel_hsv}}(@{{op}}, @{{data}}, @{{n}}, @{{hsv}});")
+        return out
+
+    def from_hsv(self, hsv):
+        """
+        Set image RGB from an HSV array of shape (height, width, 3) with components in range 0 to 1, alpha is kept.
+        """
+        w, h = self._imagedata.width, self._imagedata.height
+        if tuple(hsv._shape) != (h, w, 3):
+            raise TypeError("array shapes are not compatible")
+        hsv = hsv._ascontiguous()
+        op, data, n, array = 'from', self._imagedata.data._data, w*h, hsv._data._data
+        JS("@{{_kernel_hsv}}(@{{op}}, @{{data}}, @{{n}}, @{{array}});")
+        self._modified()
+        return None
+
+    def histogram(self, channel=None):
+        """
+        Return uint32 Ndarray of 256 counts of the channel index 0 to 3 (RGBA), or of shape (4, 256) for all channels.
+        """
+        if channel is None:
+            counts = Ndarray((4, 256), 'uint32')
+            channel = -1
+        elif channel < 0 or channel > 3:
+            raise ValueError("channel must be 0 to 3")
+        else:
+            counts = Ndarray(256, 'uint32')
+        data, n, _counts = self._imagedata.data._data, self._imagedata.width*self._imagedata.height, counts._data._data
+        JS("@{{_kernel_channelhist}}(@{{data}}, @{{n}}, @{{_counts}}, @{{channel}});")
+        return counts
+
+    def equalize(self):
+        """
+        Equalize histogram of the image RGB channels in place, alpha is kept.
+        """
+        data, n = self._imagedata.data._data, self._imagedata.width*self._imagedata.height
+        JS("@{{_kernel_equalize}}(@{{data}}, @{{n}});")
+        self._modified()
+        return None
+
+    def _palette(self, palette):
+        if len(palette) > 256:
+            raise ValueError("palette is limited to 256 colors")
+        colors = []
+        for color in palette:
+            if len(color) > 3:
+                alpha = color[3]
+            else:
+                alpha = 255
+            colors.extend([color[0], color[1], color[2], alpha])
+        return colors
+
+    def quantize(self, palette):
+        """
+        Return Uint8Array of the nearest palette index of each pixel RGB.
+        The palette argument is a list of RGB or RGBA colors, a lookup cube of 32 levels per channel is cached per palette.
+        """
+        colors = self._palette(palette)
+        key = ','.join([str(color) for color in colors])
+        cube = _palettes.get(key)
+        colors = _jsarray(colors)
+        if cube is None:
+            cube = Uint8Array(32768)
+            _cube = cube._data
+            JS("@{{_kernel_palette}}('cube', null, 0, @{{_cube}}, @{{colors}});")
+            _palettes.set(key, cube)
+        w, h = self._imagedata.width, self._imagedata.height
+        indices = Uint8Array(max(w*h, 1))
+        data, n, dst, _cube = self._imagedata.data._data, w*h, indices._data, cube._data
+        JS("@{{_kernel_palette}}('quantize', @{{data}}, @{{n}}, @{{dst}}, @{{_cube}});")
+        return indices
+
+    def apply_palette(self, indices, palette):
+        """
+        Set image pixels from palette indices.
+        The indices argument is a Uint8Array, Ndarray or list with an index per pixel, and palette is a list of RGB or RGBA colors with alpha defaulting to 255.
+        """
+        if self._pixels is None:
+            raise TypeError('packed pixel access requires Uint8ClampedArray ImageData')
+        n = self._imagedata.width*self._imagedata.height
+        if isinstance(indices, Ndarray):
+            indices = indices._ascontiguous()._data
+        elif not isinstance(indices, TypedArray):
+            indices = Uint8Array(indices)
+        if len(indices) < n:
+            raise ValueError('indices length does not match image size')
+        colors = _jsarray(self._palette(palette))
+        data, dst = indices._data, self._pixels._data
+        JS("@{{_kernel_palette}}('apply', @{{data}}, @{{n}}, @{{dst}}, @{{colors}});")
+        self._modified()
         return None
 
     def getImageData(self):
@@ -1497,6 +6164,12 @@ class ImageMatrix(Ndarray):
         """
         return self._imagedata.getImageData()
 
+    def getMask(self, threshold=127):
+        """
+        Return a BitMask2D of the pixels with alpha above threshold.
+        """
+        return BitMask2D(self.getWidth(), self.getHeight()).fromImageMatrix(self, threshold)
+
 
 class BitSet(object):
 
@@ -1506,6 +6179,7 @@ class BitSet(object):
 
     _bit = 8
     _bitmask = None
+    _dtype = 'uint8'
     __typedarray = Uint8Array
 
     def __init__(self, width=None):
@@ -1528,10 +6202,7 @@ class BitSet(object):
         return ''.join(s)
 
     def __repr__(self):
-        setBit = []
-        for index in range(self._width):
-            if self.get(index):
-                setBit.append(str(index))
+        setBit = [str(index) for index in self.iterSetBits()]
         return "{" + ", ".join(setBit) + "}"
 
     def __getitem__(self, index):
@@ -1541,15 +6212,17 @@ class BitSet(object):
         self.set(index, value)
 
     def __len__(self):
-        for index in range(self._width-1, -1, -1):
-            if self.get(index):
-                break
-        return index+1
+        return self.length()
 
     def __iter__(self):
         index = 0
+        bit = self.nextSetBit(0)
         while index < self._width:
-            yield self.get(index)
+            if index == bit:
+                yield True
+                bit = self.nextSetBit(index+1)
+            else:
+                yield False
             index += 1
 
     def get(self, index, toIndex=None):
@@ -1572,12 +6245,11 @@ class BitSet(object):
             size = toIndex-index
             if size > 0:
                 bitset = self.__class__(size)
-                ix = 0
                 if toIndex > self._width:
                     toIndex = self._width
-                for i in range(index, toIndex):
-                    bitset.set(ix, bool( self._data[ int(i/self._bit) ] & self._bitmask[ i%self._bit ] ))
-                    ix += 1
+                count = toIndex-index
+                dst, data, bits = bitset._data._data, self._data._data, self._bit
+                JS("@{{_kernel_bitslice}}(@{{dst}}, @{{data}}, @{{bits}}, @{{index}}, @{{count}});")
                 return bitset
             else:
                 return None
@@ -1604,14 +6276,14 @@ class BitSet(object):
         Optional argument index is bit index to set, and toIndex to set a range of bits.
         """
         if index is None and toIndex is None:
-            for i in range(0, self._width):
-                self.set(i, 1)
+            self._bitrange('fill', 0, self._width)
         else:
             if toIndex is None:
                 self.set(index, 1)
             else:
-                for i in range(index, toIndex):
-                    self.set(i, 1)
+                if toIndex > self._width:
+                    self.resize(toIndex)
+                self._bitrange('fill', index, toIndex)
 
     def clear(self, index=None, toIndex=None):
         """
@@ -1619,18 +6291,14 @@ class BitSet(object):
         Optional argument index is bit index to clear, and toIndex to clear a range of bits.
         """
         if index is None:
-            for i in range(len(self._data)):
-                self._data[i] = 0
+            self._wordop('assign', 0, len(self._data))
         else:
             if toIndex is None:
                 self.set(index, 0)
             else:
-                if index == 0 and toIndex == self._width:
-                    for dat in range(len(self._data)):
-                        self._data[dat] = 0
-                else:
-                    for i in range(index, toIndex):
-                        self.set(i, 0)
+                if toIndex > self._width:
+                    toIndex = self._width
+                self._bitrange('clear', index, toIndex)
 
     def flip(self, index, toIndex=None):
         """
@@ -1642,23 +6310,57 @@ class BitSet(object):
         else:
             if toIndex > self._width:
                 self.resize(toIndex)
-                toIndex = self._width
-            if index == 0 and toIndex == self._width:
-                for dat in range(len(self._data)):
-                    self._data[dat] = ~self._data[dat]
-            else:
-                for i in range(index, toIndex):
-                    self.set(i, not self.get(i))
+            self._bitrange('flip', index, toIndex)
 
     def cardinality(self):
         """
         Return the count of bit set.
         """
-        count = 0
-        for bit in range(self._width):
-            if self.get(bit):
-                count += 1
-        return count
+        data, bits, width = self._data._data, self._bit, self._width
+        return JS("@{{int}}(@{{_kernel_popcount}}(@{{data}}, @{{bits}}, @{{width}}))")
+
+    def _bitscan(self, op, index):
+        data, bits = self._data._data, self._bit
+        return JS("@{{int}}(@{{_kernel_bitscan}}(@{{op}}, @{{data}}, @{{bits}}, @{{index}}))")
+
+    def nextSetBit(self, index=0):
+        """
+        Return index of the first set bit at or after index, or -1 if none is set.
+        """
+        if index < 0:
+            index = 0
+        return self._bitscan('next', index)
+
+    def nextClearBit(self, index=0):
+        """
+        Return index of the first clear bit at or after index.
+        """
+        if index < 0:
+            index = 0
+        return self._bitscan('nextclear', index)
+
+    def previousSetBit(self, index):
+        """
+        Return index of the last set bit at or before index, or -1 if none is set.
+        """
+        if index < 0:
+            return -1
+        return self._bitscan('prev', index)
+
+    def length(self):
+        """
+        Return index of the highest set bit plus one, or 0 if none is set.
+        """
+        return self.previousSetBit(self._width-1) + 1
+
+    def iterSetBits(self):
+        """
+        Iterate over the index of each set bit, skipping clear storage words.
+        """
+        index = self.nextSetBit(0)
+        while index != -1:
+            yield index
+            index = self.nextSetBit(index+1)
 
     def intersects(self, bitset):
         """
@@ -1674,25 +6376,37 @@ class BitSet(object):
         """
         BitSet and BitSet.
         """
-        data = min(len(self._data), len(bitset._data))
-        for dat in range(data):
-            self._data[dat] = self._data[dat] & bitset._data[dat]
+        self._wordop('and', bitset, min(len(self._data), len(bitset._data)))
 
     def orSet(self, bitset):
         """
         BitSet or BitSet.
         """
-        data = min(len(self._data), len(bitset._data))
-        for dat in range(data):
-            self._data[dat] = self._data[dat] | bitset._data[dat]
+        self._wordop('or', bitset, min(len(self._data), len(bitset._data)))
 
     def xorSet(self, bitset):
         """
         BitSet xor BitSet.
         """
-        data = min(len(self._data), len(bitset._data))
-        for dat in range(data):
-            self._data[dat] = self._data[dat] ^ bitset._data[dat]
+        self._wordop('xor', bitset, min(len(self._data), len(bitset._data)))
+
+    def _bitrange(self, op, index, toIndex):
+        data, bits = self._data._data, self._bit
+        JS("@{{_kernel_bitrange}}(@{{op}}, @{{data}}, @{{bits}}, @{{index}}, @{{toIndex}});")
+        return None
+
+    def _wordop(self, op, other, count):
+        data = self._data._data
+        if isinstance(other, BitSet):
+            kernel = _op_kernel(op, self._dtype, self._dtype, other._dtype, True)
+            other = other._data._data
+            JS("@{{kernel}}(@{{count}}, @{{data}}, @{{data}}, @{{other}});")
+        else:
+            kernel = _op_kernel(op, self._dtype, self._dtype, None, True)
+            if not pyjs_mode.optimized:
+                other = other.valueOf()
+            JS("@{{kernel}}(@{{count}}, @{{data}}, @{{data}}, @{{other}});")
+        return None
 
     def resize(self, width):
         """
@@ -1724,10 +6438,7 @@ class BitSet(object):
         Check whether any bit is set.
         Return True if none set, otherwise return False.
         """
-        for data in self._data:
-            if data:
-                return False
-        return True
+        return self.nextSetBit(0) == -1
 
     def clone(self):
         """
@@ -1739,6 +6450,87 @@ class BitSet(object):
         new_bitset._width = self._width
         return new_bitset
 
+    def _bytes(self, data):
+        if isinstance(data, (list,tuple)):
+            return Uint8Array(data)
+        buffer, byteoffset, bytelength = _buffer(data)
+        return Uint8Array(buffer, byteoffset, bytelength)
+
+    def toBytes(self):
+        """
+        Return Uint8Array of the bits packed most significant bit first, the byte layout of BitSet independent of the storage word size.
+        Bits beyond the BitSet width are zero.
+        """
+        n = (self._width + 7) // 8
+        out = Uint8Array(n)
+        data, bits, width, _out = self._data._data, self._bit, self._width, out._data
+        JS("@{{_kernel_bitbytes}}('to', @{{data}}, @{{bits}}, @{{_out}}, @{{n}}, @{{width}});")
+        return out
+
+    def fromBytes(self, data, width=None):
+        """
+        Set the BitSet bits from bytes in the toBytes layout.
+        Argument data is a Uint8Array, list of byte values, ArrayBuffer or JavaScript typed array.
+        Optional argument width is the BitSet width, default eight bits per byte.
+        """
+        data = self._bytes(data)
+        if width is None:
+            width = len(data) * 8
+        elif width > len(data) * 8:
+            raise ValueError("width exceeds the bits of data")
+        self._width = width or self._bit
+        self._data = self._data.__class__( _ceil(self._width/(self._bit*1.0)) )
+        n = min(len(data), (width + 7) // 8)
+        _data, bits, _bytes = self._data._data, self._bit, data._data
+        JS("@{{_kernel_bitbytes}}('from', @{{_data}}, @{{bits}}, @{{_bytes}}, @{{n}}, @{{width}});")
+        return None
+
+    def toBase64(self):
+        """
+        Return base64 string of the toBytes data.
+        """
+        data = self.toBytes()._data
+        return JS("@{{_base64}}.encode(@{{data}})")
+
+    def fromBase64(self, text, width=None):
+        """
+        Set the BitSet bits from a base64 string of the toBytes data.
+        Optional argument width is the BitSet width, default eight bits per byte.
+        """
+        data = JS("@{{_base64}}.decode(@{{text}})")
+        if data is None:
+            raise ValueError("invalid base64 string")
+        self.fromBytes(data, width)
+        return None
+
+    def toRLE(self):
+        """
+        Return Uint32Array of the run lengths of the bits, alternating clear and set runs starting with a clear run, which may be zero.
+        Runs of whole clear or set storage words are counted without scanning their bits.
+        """
+        data, bits, width = self._data._data, self._bit, self._width
+        count = JS("@{{_kernel_bitruns}}(@{{data}}, @{{bits}}, @{{width}}, null)")
+        runs = Uint32Array(count)
+        _runs = runs._data
+        JS("@{{_kernel_bitruns}}(@{{data}}, @{{bits}}, @{{width}}, @{{_runs}});")
+        return runs
+
+    def fromRLE(self, runs):
+        """
+        Set the BitSet bits from run lengths in the toRLE layout.
+        Argument runs is a Uint32Array or list of run lengths, the BitSet width is their sum.
+        """
+        runs = list(runs)
+        width = sum(runs)
+        self._width = width or self._bit
+        self._data = self._data.__class__( _ceil(self._width/(self._bit*1.0)) )
+        index = 0
+        for i in range(len(runs)):
+            if i % 2 and runs[i]:
+                self._bitrange('fill', index, index+runs[i])
+            index += runs[i]
+        return None
+
 
 class BitSet16(BitSet):
     """
@@ -1746,6 +6538,7 @@ class BitSet16(BitSet):
     """
     _bit = 16
     _bitmask = None
+    _dtype = 'uint16'
     __typedarray = Uint16Array
 
     def __init__(self, width=None):
@@ -1758,12 +6551,175 @@ class BitSet32(BitSet):
     """
     _bit = 32
     _bitmask = None
+    _dtype = 'uint32'
     __typedarray = Uint32Array
 
     def __init__(self, width=None):
         BitSet.__init__(self, width)
 
 
+class BitMask2D(object):
+
+    """
+    BitMask2D provides a 2D bit mask for pixel-perfect collision detection. The mask is stored in a BitSet32 with each row padded to whole 32-bit words, the leftmost pixel in the most significant bit, so overlap tests shift and compare a word of pixels at a time.
+    """
+
+    def __init__(self, width, height):
+        self._width = width
+        self._height = height
+        self._words = int(_ceil(width/32.0))
+        self._bitset = BitSet32(max(self._words*32*height, 32))
+
+    def __str__(self):
+        s = []
+        for y in range(self._height):
+            for x in range(self._width):
+                if self.get(x, y):
+                    s.append('1')
+                else:
+                    s.append('0')
+            s.append('\n')
+        return ''.join(s)
+
+    def __repr__(self):
+        return '<BitMask2D(%d, %d)>' % (self._width, self._height)
+
+    def getWidth(self):
+        """
+        Return mask width.
+        """
+        return self._width
+
+    def getHeight(self):
+        """
+        Return mask height.
+        """
+        return self._height
+
+    def getSize(self):
+        """
+        Return mask (width, height).
+        """
+        return (self._width, self._height)
+
+    def getBitSet(self):
+        """
+        Return the BitSet32 storing the mask rows.
+        """
+        return self._bitset
+
+    def _bitindex(self, x, y):
+        if x < 0 or y < 0 or x >= self._width or y >= self._height:
+            raise IndexError('mask index out of range')
+        return y*self._words*32 + x
+
+    def get(self, x, y):
+        """
+        Get bit at position x, y.
+        """
+        return self._bitset.get(self._bitindex(x, y))
+
+    def set(self, x, y, value=1):
+        """
+        Set bit at position x, y.
+        Optional argument value is the bit state of 1(True) or 0(False). Default:1
+        """
+        self._bitset.set(self._bitindex(x, y), value)
+
+    def fill(self):
+        """
+        Set all bits of the mask.
+        """
+        row = self._words*32
+        for y in range(self._height):
+            self._bitset.fill(y*row, y*row+self._width)
+
+    def clear(self):
+        """
+        Clear all bits of the mask.
+        """
+        self._bitset.clear()
+
+    def fromImageMatrix(self, imagematrix, threshold=127):
+        """
+        Set mask bits from the pixels of an ImageMatrix with alpha above threshold.
+        The ImageMatrix must have the same width and height as the mask.
+        Return the mask.
+        """
+        w, h = imagematrix.getWidth(), imagematrix.getHeight()
+        if w != self._width or h != self._height:
+            raise ValueError('image size does not match mask size')
+        dst, words, data = self._bitset._data._data, self._words, imagematrix._imagedata.data._data
+        JS("@{{_kernel_maskalpha}}(@{{dst}}, @{{words}}, @{{data}}, @{{w}}, @{{h}}, @{{threshold}});")
+        return self
+
+    def count(self):
+        """
+        Return number of set bits.
+        """
+        return self._bitset.cardinality()
+
+    def centroid(self):
+        """
+        Return the (x, y) centroid of the set bits, or (0, 0) if none set.
+        """
+        data, words, h = self._bitset._data._data, self._words, self._height
+        result = JS("@{{_kernel_maskcentroid}}(@{{data}}, @{{words}}, @{{h}})")
+        n = JS("@{{result}}[0]")
+        if not n:
+            return (0, 0)
+        return (int(JS("@{{result}}[1]") // n), int(JS("@{{result}}[2]") // n))
+
+    def _overlap(self, op, mask, offset, out=None):
+        a, aw, ah, awords = self._bitset._data._data, self._width, self._height, self._words
+        b, bw, bh, bwords = mask._bitset._data._data, mask._width, mask._height, mask._words
+        ox, oy = offset[0], offset[1]
+        if out is not None:
+            out = out._bitset._data._data
+        return JS("@{{_kernel_maskoverlap}}(@{{op}}, @{{a}}, @{{aw}}, @{{ah}}, @{{awords}}, @{{b}}, @{{bw}}, @{{bh}}, @{{bwords}}, @{{ox}}, @{{oy}}, @{{out}})")
+
+    def overlap(self, mask, offset):
+        """
+        Check overlap with mask placed at offset (x, y) relative to this mask.
+        Return the first overlapping (x, y) position, or None if masks do not overlap.
+        """
+        pos = self._overlap('pos', mask, offset)
+        if pos < 0:
+            return None
+        return (int(pos % self._width), int(pos // self._width))
+
+    def overlap_area(self, mask, offset):
+        """
+        Return number of set bits overlapping with mask placed at offset (x, y).
+        """
+        return int(self._overlap('area', mask, offset))
+
+    def overlap_mask(self, mask, offset):
+        """
+        Return a BitMask2D of this size with the bits overlapping with mask placed at offset (x, y).
+        """
+        result = BitMask2D(self._width, self._height)
+        self._overlap('mask', mask, offset, result)
+        return result
+
+    def outline(self, every=1):
+        """
+        Trace the boundary of the first connected group of set bits.
+        Return a list of (x, y) points, including every nth point with the every argument.
+        Raises ValueError if every is less than 1.
+        """
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        every = int(every)
+        data, w, h, words = self._bitset._data._data, self._width, self._height, self._words
+        points = JS("@{{_kernel_maskoutline}}(@{{data}}, @{{w}}, @{{h}}, @{{words}}, @{{every}})")
+        n = JS("@{{points}}.length")
+        result = []
+        for i in range(0, n, 2):
+            result.append((int(JS("@{{points}}[@{{i}}]")), int(JS("@{{points}}[@{{i}}+1]"))))
+        return result
+
+
 def typeOf(obj):
     """
     Return typeof obj.
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import __pyjamas__
+except ImportError:
+    collect_ignore_glob = ['test_*.py']
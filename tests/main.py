@@ -0,0 +1,31 @@
+#PyjsArray tests - runner for a Pyjs build
+#Translate with this module as the main module, the tests also run under pytest where Pyjs is importable.
+
+import test_ndarray
+import test_bitset
+import test_imagematrix
+import test_interop
+import test_chunked
+
+modules = [test_ndarray, test_bitset, test_imagematrix, test_interop, test_chunked]
+
+
+def main():
+    count, failures = 0, []
+    for module in modules:
+        for name in dir(module):
+            if not name.startswith('test_'):
+                continue
+            count += 1
+            try:
+                getattr(module, name)()
+            except Exception as error:
+                failures.append('%s.%s: %s' % (module.__name__, name, error))
+    for failure in failures:
+        print('FAIL ' + failure)
+    print('%d tests, %d failures' % (count, len(failures)))
+    return len(failures)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#PyjsArray tests - BitSet and BitMask2D
+
+from pyjsarray import BitSet, BitSet16, BitSet32, BitMask2D
+from util import assert_raises
+
+
+def _setbits(bitset):
+    return [index for index in range(bitset.size()) if bitset.get(index)]
+
+
+def test_fill_clear_range():
+    for cls in (BitSet, BitSet16, BitSet32):
+        bitset = cls(100)
+        bitset.fill(5, 70)
+        assert _setbits(bitset) == list(range(5, 70))
+        bitset.clear(10, 65)
+        assert _setbits(bitset) == [5, 6, 7, 8, 9, 65, 66, 67, 68, 69]
+
+
+def test_flip_range():
+    for cls in (BitSet, BitSet16, BitSet32):
+        bitset = cls(40)
+        bitset.fill(0, 10)
+        bitset.flip(5, 50)
+        assert bitset.size() >= 50
+        assert _setbits(bitset) == list(range(0, 5)) + list(range(10, 50))
+
+
+def test_flip_all_stops_at_width():
+    bitset = BitSet32(40)
+    bitset.flip(0, 40)
+    assert bitset.cardinality() == 40
+    assert not bitset.get(40)
+
+
+def test_get_range():
+    bitset = BitSet16(64)
+    bitset.fill(3, 6)
+    bitset.set(40)
+    part = bitset.get(2, 42)
+    assert _setbits(part) == [1, 2, 3, 38]
+
+
+def test_cardinality():
+    for cls in (BitSet, BitSet16, BitSet32):
+        bitset = cls(200)
+        assert bitset.cardinality() == 0
+        for index in (0, 31, 32, 63, 150, 199):
+            bitset.set(index)
+        assert bitset.cardinality() == 6
+
+
+def test_bit_scans():
+    for cls in (BitSet, BitSet16, BitSet32):
+        bitset = cls(128)
+        assert bitset.isEmpty() and bitset.nextSetBit(0) == -1 and len(bitset) == 0
+        bitset.set(3)
+        bitset.set(70)
+        assert bitset.nextSetBit(0) == 3
+        assert bitset.nextSetBit(4) == 70
+        assert bitset.nextSetBit(71) == -1
+        assert bitset.previousSetBit(69) == 3
+        assert bitset.previousSetBit(2) == -1
+        assert bitset.length() == 71
+        assert list(bitset.iterSetBits()) == [3, 70]
+        bitset.fill(0, 5)
+        assert bitset.nextClearBit(0) == 5
+
+
+def _square(width, height, x0, y0, size):
+    mask = BitMask2D(width, height)
+    for y in range(y0, y0+size):
+        for x in range(x0, x0+size):
+            mask.set(x, y)
+    return mask
+
+
+def test_mask_count_centroid():
+    mask = _square(40, 8, 30, 2, 4)
+    assert mask.count() == 16
+    assert mask.centroid() == (31, 3)
+    assert mask.get(33, 5) and not mask.get(34, 5)
+
+
+def test_mask_overlap():
+    a = BitMask2D(40, 10)
+    a.set(35, 5)
+    b = _square(3, 3, 0, 0, 3)
+    assert a.overlap(b, (0, 0)) is None
+    assert a.overlap(b, (34, 4)) == (35, 5)
+    assert a.overlap_area(b, (34, 4)) == 1
+    assert a.overlap_area(_square(40, 10, 0, 0, 10), (30, 0)) == 1
+    assert a.overlap_mask(b, (33, 3)).count() == 1
+
+
+def test_mask_outline():
+    mask = _square(6, 6, 1, 1, 3)
+    points = mask.outline()
+    assert len(points) == 8
+    assert points[0] == (1, 1)
+    assert sorted(points) == [(1, 1), (1, 2), (1, 3), (2, 1), (2, 3), (3, 1), (3, 2), (3, 3)]
+    assert len(mask.outline(2)) < 8
+    assert_raises(ValueError, mask.outline, 0)
+
+
+def test_bytes_round_trip():
+    for cls in (BitSet, BitSet16, BitSet32):
+        bitset = cls(21)
+        for index in (0, 7, 8, 20):
+            bitset.set(index)
+        data = bitset.toBytes()
+        assert [data[i] for i in range(len(data))] == [0x81, 0x80, 0x08]
+        other = BitSet32()
+        other.fromBytes(data, 21)
+        assert other.size() >= 21 and _setbits(other) == [0, 7, 8, 20]
+        other = cls()
+        other.fromBytes([0xFF])
+        assert _setbits(other) == list(range(8))
+        assert_raises(ValueError, other.fromBytes, [0xFF], 9)
+
+
+def test_base64_round_trip():
+    bitset = BitSet16(12)
+    bitset.set(0)
+    assert BitSet(1).toBase64() == 'AA=='
+    text = bitset.toBase64()
+    assert text == 'gAA='
+    other = BitSet()
+    other.fromBase64(text, 12)
+    assert _setbits(other) == [0]
+    assert_raises(ValueError, other.fromBase64, 'a*b=')
+
+
+def test_rle_round_trip():
+    for cls in (BitSet, BitSet32):
+        bitset = cls(100)
+        bitset.fill(2, 5)
+        bitset.fill(40, 100)
+        runs = bitset.toRLE()
+        assert [runs[i] for i in range(len(runs))] == [2, 3, 35, 60]
+        other = cls()
+        other.fromRLE(runs)
+        assert _setbits(other) == _setbits(bitset)
+        first = cls(4)
+        first.fill()
+        assert list(first.toRLE()) == [0, 4]
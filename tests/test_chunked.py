@@ -0,0 +1,97 @@
+#PyjsArray tests - chunked runs
+
+from __pyjamas__ import JS
+from pyjsarray import Ndarray, ImageMatrix, np
+from util import assert_raises, assert_close, is_nan
+
+
+def _result(op, array, other=None, chunk=4, axis=None, out=None):
+    run = np.run_chunked(op, array, other, chunk, axis, out)
+    assert run.run()
+    assert run.isFinished() and run.getProgress() == 1.0
+    return run.getResult()
+
+
+def _same(value, expected):
+    if is_nan(expected):
+        assert is_nan(value), (value, expected)
+    else:
+        assert value == expected, (value, expected)
+
+
+def test_steps():
+    a = Ndarray((8, 2), 'float64')
+    a.fill(1)
+    run = np.run_chunked('sum', a, None, 4)
+    assert run.getResult() is None and run.getProgress() == 0.0
+    steps = 0
+    for step in run:
+        steps += 1
+    assert steps == 4 and run.getResult() == 16
+    assert_raises(ValueError, np.run_chunked, 'sum', a, None, 0)
+    assert_raises(ValueError, np.run_chunked, 'svd', a)
+
+
+def test_elementwise_set_matmul():
+    a = Ndarray([[1, 2], [3, 4], [5, 6]], 'float64')
+    assert _result('add', a, Ndarray([10, 20], 'float64')).tolist() == [[11, 22], [13, 24], [15, 26]]
+    out = Ndarray((3, 2), 'uint8')
+    assert _result('gt', a, 3, 2, None, out) is out
+    assert out.tolist() == [[0, 0], [0, 1], [1, 1]]
+    target = Ndarray((3, 2), 'float64')
+    _result('set', target, [[1, 1], [2, 2], [3, 3]], 2)
+    assert target.tolist() == [[1, 1], [2, 2], [3, 3]]
+    b = Ndarray([[1, 0, 2], [0, 1, 3]], 'float64')
+    assert _result('matmul', a, b, 4).tolist() == a.matmul(b).tolist()
+    stack = Ndarray([[[1, 2], [3, 4]], [[5, 6], [7, 8]]], 'float64')
+    assert _result('matmul', stack, b, 2).tolist() == stack.matmul(b).tolist()
+
+
+def test_reductions_match_single_shot():
+    a = Ndarray([[3, 1, 4], [1, 5, 9], [2, 6, 5], [3, 5, 8], [9, 7, 9]], 'float64')
+    for chunk in (1, 3, 6, 100):
+        for op in ('sum', 'prod', 'min', 'max', 'argmin', 'argmax'):
+            _same(_result(op, a, None, chunk), getattr(a, op)())
+            assert _result(op, a, None, chunk, 0).tolist() == getattr(a, op)(0).tolist()
+            assert _result(op, a, None, chunk, 1).tolist() == getattr(a, op)(1).tolist()
+        assert_close([_result('mean', a, None, chunk)], [a.mean()])
+        assert_close(_result('mean', a, None, chunk, 0).tolist(), a.mean(0).tolist())
+        for op in ('var', 'std'):
+            assert_close([_result(op, a, 1, chunk)], [getattr(a, op)(None, False, 1)])
+            assert_close(_result(op, a, 0, chunk, 0).tolist(), getattr(a, op)(0).tolist())
+
+
+def test_reductions_with_nan():
+    nan = float('nan')
+    for values in ([3, 1, nan, 0, nan, -1], [nan, 2, 1], [2, 1, 0, nan]):
+        a = Ndarray(values, 'float64')
+        b = Ndarray([[value, 1] for value in values], 'float64')
+        for chunk in (1, 2, 3, 4):
+            for op in ('min', 'max', 'argmin', 'argmax'):
+                _same(_result(op, a, None, chunk), getattr(a, op)())
+                _same(_result(op, b, None, chunk), getattr(b, op)())
+                expected, value = getattr(b, op)(0).tolist(), _result(op, b, None, chunk, 0).tolist()
+                for i in range(2):
+                    _same(value[i], expected[i])
+    assert is_nan(Ndarray([1, nan, 0], 'float64').min())
+    assert Ndarray([1, nan, 0], 'float64').argmax() == 1
+
+
+def test_empty_reductions():
+    assert is_nan(_result('mean', Ndarray(0, 'float64')))
+    assert is_nan(_result('mean', Ndarray((3, 0), 'float64')))
+    assert_raises(ValueError, _result, 'min', Ndarray(0, 'float64'))
+
+
+def test_filter_bands_match_whole_image():
+    for op, param in (('gaussian_blur', 1.0), ('box_blur', 2), ('median', 1), ('sobel', None)):
+        whole = ImageMatrix(JS("new ImageData(7, 9)"))
+        for i in range(7*9):
+            whole.getPixelArray()[i] = (i * 2654435761) % 4294967296
+        banded = ImageMatrix(JS("new ImageData(7, 9)"))
+        banded.set(whole)
+        getattr(whole, op)(*([param] if param is not None else []))
+        assert _result(op, banded, param, 14) is banded
+        assert banded.tolist() == whole.tolist()
+    assert_raises(TypeError, np.run_chunked, 'sobel', Ndarray((2, 2), 'uint8'))
+    assert_raises(ValueError, np.run_chunked, 'gaussian_blur', banded, 0)
@@ -0,0 +1,186 @@
+#PyjsArray tests - ImageMatrix
+
+from __pyjamas__ import JS
+from pyjsarray import ImageMatrix, Ndarray
+from util import assert_raises, assert_close
+
+
+def _image(width, height):
+    return ImageMatrix(JS("new ImageData(@{{width}}, @{{height}})"))
+
+
+def test_pixel_integer():
+    image = _image(4, 3)
+    image.setPixelInteger((1, 2), 0xFF102030)
+    assert image.getPixelInteger((1, 2)) == 0xFF102030
+    assert tuple(image.getPixel((1, 2))) == (0x10, 0x20, 0x30, 0xFF)
+    assert image.getPixelInteger((0, 0)) == 0
+
+
+def test_pixel_integer_byte_fallback():
+    image = _image(4, 3)
+    image.setPixel((2, 1), (0x10, 0x20, 0x30, 0xFF))
+    image._pixels = None
+    assert image.getPixelInteger((2, 1)) == 0xFF102030
+    image.setPixelInteger((0, 3), 0x80FFFFFF)
+    assert image.getPixelInteger((0, 3)) == 0x80FFFFFF
+
+
+def test_bulk_pixels():
+    image = _image(4, 4)
+    image.fillRect((1, 1, 2, 2), 0xFF00FF00)
+    pixels = image.getPixels((0, 0, 4, 2))
+    assert len(pixels) == 8
+    assert [pixels[i] for i in range(8)] == [0, 0, 0, 0, 0, 0xFF00FF00, 0xFF00FF00, 0]
+    image.setPixels((3, 3, 1, 1), [0xFFFF0000])
+    assert image.getPixelInteger((3, 3)) == 0xFFFF0000
+    assert len(image.getPixelArray()) == 16
+
+
+def test_blit_copy_clipped():
+    dest, src = _image(4, 4), _image(2, 2)
+    src.fillRect(None, 0xFF112233)
+    assert dest.blit(src, (3, 3)) == (3, 3, 1, 1)
+    assert dest.getPixelInteger((3, 3)) == 0xFF112233
+    assert dest.getPixelInteger((2, 2)) == 0
+    assert dest.blit(src, (5, 5))[2] == 0
+
+
+def test_blit_colorkey_alpha():
+    dest, src = _image(2, 1), _image(2, 1)
+    dest.fillRect(None, 0xFF0000FF)
+    src.setPixelInteger((0, 0), 0xFFFF0000)
+    src.setPixelInteger((0, 1), 0xFF00FF00)
+    dest.blit(src, (0, 0), None, 'colorkey', 0xFF0000)
+    assert dest.getPixelInteger((0, 0)) == 0xFF0000FF
+    assert dest.getPixelInteger((0, 1)) == 0xFF00FF00
+    src.setPixelInteger((0, 1), 0x00FFFFFF)
+    dest.blit(src, (0, 0), None, 'alpha')
+    assert dest.getPixelInteger((0, 0)) == 0xFFFF0000
+    assert dest.getPixelInteger((0, 1)) == 0xFF00FF00
+
+
+def test_blit_add_and_mode():
+    dest, src = _image(1, 1), _image(1, 1)
+    dest.fillRect(None, 0x80102030)
+    src.fillRect(None, 0xFFF01010)
+    dest.blit(src, (0, 0), None, 'add')
+    assert dest.getPixelInteger((0, 0)) == 0x80FF2040
+    assert_raises(ValueError, dest.blit, src, (0, 0), None, 'xor')
+    assert_raises(ValueError, dest.blit, src, (0, 0), None, 'colorkey')
+
+
+def test_filters_uniform():
+    image = _image(6, 5)
+    image.fillRect(None, 0xFF406080)
+    image.gaussian_blur(1.5)
+    assert image.getPixelInteger((2, 3)) == 0xFF406080
+    image.box_blur(2)
+    assert image.getPixelInteger((0, 0)) == 0xFF406080
+    image.sobel()
+    assert tuple(image.getPixel((2, 2))) == (0, 0, 0, 0xFF)
+
+
+def test_median_outlier():
+    image = _image(5, 5)
+    image.fillRect(None, 0xFF101010)
+    image.setPixelInteger((2, 2), 0xFFFFFFFF)
+    image.median(1)
+    assert image.getPixelInteger((2, 2)) == 0xFF101010
+
+
+def test_gaussian_blur_sigma():
+    image = _image(2, 2)
+    assert_raises(ValueError, image.gaussian_blur, 0)
+    assert_raises(ValueError, image.gaussian_blur, -1)
+
+
+def test_resize_image():
+    image = _image(4, 2)
+    image.fillRect(None, 0xFF204060)
+    out = image.resize(3, 5)
+    assert out.getWidth() == 5 and out.getHeight() == 3
+    assert out.getPixelInteger((2, 4)) == 0xFF204060
+    target = _image(2, 6)
+    assert image.resize(6, 2, 'nearest', target) is target
+    assert target.getPixelInteger((5, 1)) == 0xFF204060
+
+
+def test_grayscale():
+    image = _image(2, 1)
+    image.setPixelInteger((0, 0), 0xFFFFFFFF)
+    image.setPixelInteger((0, 1), 0x80000000)
+    gray = image.to_grayscale()
+    assert gray._dtype == 'uint8' and tuple(gray.getshape()) == (1, 2)
+    assert gray.tolist() == [[255, 0]]
+    image.to_grayscale(image)
+    assert image.getPixelInteger((0, 1)) == 0x80000000
+
+
+def test_hsv_round_trip():
+    image = _image(2, 1)
+    image.setPixelInteger((0, 0), 0xFFFF0000)
+    image.setPixelInteger((0, 1), 0x7F00FF00)
+    hsv = image.to_hsv()
+    assert_close(hsv[0, 0].tolist(), [0, 1, 1])
+    assert_close(hsv[0, 1].tolist(), [1/3.0, 1, 1])
+    image.fillRect(None, 0xFF000000)
+    image.from_hsv(hsv)
+    assert image.getPixelInteger((0, 0)) == 0xFFFF0000
+    assert image.getPixelInteger((0, 1)) == 0xFF00FF00
+
+
+def test_palette():
+    palette = [(0, 0, 0), (255, 255, 255), (255, 0, 0, 128)]
+    image = _image(3, 1)
+    image.setPixelInteger((0, 0), 0xFF101010)
+    image.setPixelInteger((0, 1), 0xFFF0F0F0)
+    image.setPixelInteger((0, 2), 0xFFF00808)
+    indices = image.quantize(palette)
+    assert [indices[i] for i in range(3)] == [0, 1, 2]
+    image.apply_palette([2, 0, 1], palette)
+    assert image.getPixelInteger((0, 0)) == 0x80FF0000
+    assert image.getPixelInteger((0, 2)) == 0xFFFFFFFF
+    assert_raises(ValueError, image.quantize, [(0, 0, 0)] * 257)
+
+
+def test_dirty_regions():
+    image = _image(8, 8)
+    image.setPixelInteger((1, 1), 0xFFFFFFFF)
+    assert image.getDirtyRects() == []
+    image.setDirtyTracking(True)
+    image.setPixelInteger((2, 3), 0xFFFFFFFF)
+    assert image.getDirtyRects() == [(3, 2, 1, 1)]
+    image.fillRect((4, 2, 2, 2), 0xFF000000)
+    assert image.getDirtyRects() == [(3, 2, 3, 2)]
+    image.clearDirty()
+    image[5:7] = 0
+    assert image.getDirtyRects() == [(0, 5, 8, 2)]
+
+
+def test_dirty_whole_image_writes():
+    image = _image(4, 4)
+    image.setDirtyTracking(True)
+    image.op('add', 1, image)
+    assert image.getDirtyRects() == [(0, 0, 4, 4)]
+    image.clearDirty()
+    image[image.cmp('gt', 0)] = 0
+    assert image.getDirtyRects() == [(0, 0, 4, 4)]
+    image.clearDirty()
+    image.box_blur(1)
+    assert image.getDirtyRects() == [(0, 0, 4, 4)]
+
+
+def test_image_histogram_equalize():
+    image = _image(2, 1)
+    image.setPixelInteger((0, 0), 0xFF0A0A0A)
+    image.setPixelInteger((0, 1), 0x80141414)
+    assert image.histogram(0)[0x0A] == 1
+    counts = image.histogram()
+    assert tuple(counts.getshape()) == (4, 256)
+    assert counts[3, 0xFF] == 1 and counts[3, 0x80] == 1
+    assert_raises(ValueError, image.histogram, 4)
+    image.equalize()
+    dark, light = image.getPixel((0, 0)), image.getPixel((0, 1))
+    assert light[0] == 255 and dark[0] < light[0]
+    assert dark[3] == 0xFF and light[3] == 0x80
@@ -0,0 +1,104 @@
+#PyjsArray tests - binary interop and serialization
+
+from pyjsarray import Ndarray, DataView, Uint8Array, np
+from util import assert_raises, assert_close
+
+
+def test_dataview():
+    data = Uint8Array(8)
+    view = DataView(data)
+    view.setUint16(0, 0x1234)
+    assert data[0] == 0x12 and data[1] == 0x34
+    assert view.getUint16(0, True) == 0x3412
+    view.pack('<hI', 2, -2, 7)
+    assert view.unpack('<hI', 2) == (-2, 7)
+    assert view.calcsize('<hI') == 6
+    assert_raises(ValueError, DataView, data, 4, 8)
+    assert_raises(ValueError, view.pack, '<hI', 0, 1)
+
+
+def test_frombuffer_tobytes():
+    a = Ndarray([1, 2, 3, 4], 'float32')
+    data = a.tobytes()
+    assert len(data) == 16
+    b = np.frombuffer(data, 'float32')
+    assert b.tolist() == [1, 2, 3, 4]
+    b[0] = 9
+    assert a[0] == 9
+    assert np.frombuffer(a, 'float32', 4, 2).tolist() == [2, 3]
+    c = np.frombuffer(Uint8Array([0, 1, 0, 2, 0]), 'uint8', 1)
+    assert c.tolist() == [1, 0, 2, 0]
+    t = Ndarray([[1, 2], [3, 4]], 'uint8').transpose().tobytes()
+    assert [t[i] for i in range(4)] == [1, 3, 2, 4]
+
+
+def test_record_dtype():
+    dtype = np.dtype([('id', 'u1'), ('pos', 'f4', 2), ('weight', 'f8')])
+    assert dtype.getnames() == ('id', 'pos', 'weight')
+    assert dtype.getfield('pos') == ('float32', (2,), 4)
+    assert dtype.getfield('weight')[2] == 16
+    assert dtype.getitemsize() == 24
+    assert_raises(ValueError, np.dtype, [('a', 'i4'), ('a', 'f8')])
+
+
+def test_record_array():
+    fields = [('id', 'u1'), ('pos', 'f4', 2), ('weight', 'f8')]
+    for layout in ('aos', 'soa'):
+        records = np.recarray(3, fields, layout)
+        records[1] = (7, [0.5, 1.5], 2.0)
+        records['weight'].op('mul', 3, records['weight'])
+        assert records['id'].tolist() == [0, 7, 0]
+        assert records['pos'][1].tolist() == [0.5, 1.5]
+        assert records[1][2] == 6.0
+        assert records[-1][0] == 0
+        assert_raises(IndexError, records.__getitem__, 3)
+        assert_raises(KeyError, records.__getitem__, 'mass')
+    records = np.recarray(2, fields)
+    records['id'] = [4, 5]
+    shared = np.recarray(2, fields, 'aos', records.getBuffer())
+    assert shared['id'].tolist() == [4, 5]
+    assert len(records.tobytes()) == 48
+    assert_raises(ValueError, np.recarray, 2, fields, 'columns')
+
+
+def _npy(header, data):
+    header += ' ' * ((64 - (11 + len(header)) % 64) % 64) + '\n'
+    raw = [0x93] + [ord(c) for c in 'NUMPY'] + [1, 0, len(header) % 256, len(header) // 256]
+    return Uint8Array(raw + [ord(c) for c in header] + data)
+
+
+def test_npy_round_trip():
+    for dtype in ('uint8c', 'int8', 'uint16', 'int32', 'float32', 'float64'):
+        a = Ndarray([[1, 2, 3], [4, 5, 6]], dtype)
+        data = a.tobytes_npy()
+        assert data[0] == 0x93 and ''.join([chr(data[i]) for i in range(1, 6)]) == 'NUMPY'
+        assert (data[8] + data[9]*256 + 10) % 64 == 0
+        b = np.load_npy(data)
+        assert tuple(b.getshape()) == (2, 3)
+        assert b.tolist() == a.tolist()
+    t = np.load_npy(Ndarray([[1, 2], [3, 4]], 'int16').transpose().tobytes_npy())
+    assert t.tolist() == [[1, 3], [2, 4]]
+
+
+def test_npy_load_layouts():
+    data = _npy("{'descr': '<i2', 'fortran_order': True, 'shape': (2, 3), }", [1, 0, 4, 0, 2, 0, 5, 0, 3, 0, 6, 0])
+    assert np.load_npy(data).tolist() == [[1, 2, 3], [4, 5, 6]]
+    data = _npy("{'descr': '>u2', 'fortran_order': False, 'shape': (2,), }", [0, 1, 1, 2])
+    assert np.load_npy(data).tolist() == [1, 258]
+    assert_raises(ValueError, np.load_npy, Uint8Array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]))
+    data = _npy("{'descr': '<c16', 'fortran_order': False, 'shape': (1,), }", [0] * 16)
+    assert_raises(ValueError, np.load_npy, data)
+
+
+def test_ndarray_base64_rle():
+    a = Ndarray([[1, 2], [3, 4]], 'int16')
+    b = np.frombase64(a.tobase64(), 'int16')
+    assert b.tolist() == [1, 2, 3, 4]
+    assert Ndarray([1, 2, 3], 'uint8').tobase64() == 'AQID'
+    assert np.frombase64('AQID').tolist() == [1, 2, 3]
+    assert_raises(ValueError, np.frombase64, '!!')
+    values, counts = Ndarray([5, 5, 5, 0, 0, 5], 'uint8').torle()
+    assert values.tolist() == [5, 0, 5] and counts.tolist() == [3, 2, 1]
+    c = np.fromrle(values, counts, (2, 3))
+    assert c._dtype == 'uint8' and c.tolist() == [[5, 5, 5], [0, 0, 5]]
+    assert_raises(ValueError, np.fromrle, [1, 2], [3])
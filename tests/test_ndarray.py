@@ -0,0 +1,350 @@
+#PyjsArray tests - Ndarray
+
+from pyjsarray import Ndarray, np, BitSet, _KernelCache, _kernels
+from util import assert_raises, assert_close, is_nan
+
+
+def test_broadcast_row():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    b = Ndarray([10, 20, 30], 'int32')
+    c = a.op('add', b)
+    assert tuple(c.getshape()) == (2, 3)
+    assert c.tolist() == [[11, 22, 33], [14, 25, 36]]
+
+
+def test_broadcast_column():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    b = Ndarray([[2], [3]], 'int32')
+    assert a.op('mul', b).tolist() == [[2, 4, 6], [12, 15, 18]]
+
+
+def test_broadcast_incompatible():
+    a = Ndarray((2, 3), 'int32')
+    b = Ndarray((2,), 'int32')
+    assert_raises(TypeError, a.op, 'add', b)
+
+
+def test_scalar_ops():
+    a = Ndarray([-7, 7], 'int32')
+    assert a.op('mod', 3).tolist() == [2, 1]
+    assert np.absolute(Ndarray([-2, 3], 'int32')).tolist() == [2, 3]
+    b = Ndarray([0xFFFFFFFF], 'uint32')
+    assert b.op('rshift', 28).tolist() == [15]
+
+
+def test_compare():
+    a = Ndarray([1, 5, 3], 'float64')
+    c = a.cmp('gt', 2)
+    assert c._dtype == 'uint8'
+    assert c.tolist() == [0, 1, 1]
+
+
+def test_transpose_view():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    t = a.transpose()
+    assert t.tolist() == [[1, 4], [2, 5], [3, 6]]
+    t[0, 1] = 9
+    assert a[1, 0] == 9
+
+
+def test_step_slice_view():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    assert a[:, ::2].tolist() == [[1, 3], [4, 6]]
+    assert a[0, ::-1].tolist() == [3, 2, 1]
+    v = a[:, 1]
+    v.fill(0)
+    assert a.tolist() == [[1, 0, 3], [4, 0, 6]]
+
+
+def test_strided_view_op():
+    a = Ndarray([[1, 2], [3, 4]], 'float64')
+    assert a.transpose().op('add', a).tolist() == [[2, 5], [5, 8]]
+
+
+def test_reshape_dtype():
+    a = Ndarray([1, 2, 3, 4], 'int16')
+    b = a.reshape((2, 2))
+    assert b._dtype == 'int16'
+    assert b.tolist() == [[1, 2], [3, 4]]
+
+
+def test_reduce_axis():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    assert a.sum() == 21
+    assert a.sum(0).tolist() == [5, 7, 9]
+    assert a.sum(1, True).getshape() == (2, 1)
+    assert a.max(1).tolist() == [3, 6]
+    assert a.argmin() == 0
+    assert a.argmax(0).tolist() == [1, 1, 1]
+    assert a.transpose().sum(0).tolist() == [6, 15]
+
+
+def test_mean_var_std():
+    a = Ndarray([2, 4, 4, 4, 5, 5, 7, 9], 'float64')
+    assert_close([a.mean(), a.var(), a.std()], [5.0, 4.0, 2.0])
+    assert_close([a.var(None, False, 1)], [32.0 / 7])
+
+
+def test_mean_empty():
+    assert is_nan(Ndarray(0, 'float64').mean())
+    means = Ndarray((0, 2), 'float64').mean(0)
+    assert is_nan(means[0]) and is_nan(means[1])
+
+
+def test_min_empty():
+    assert_raises(ValueError, Ndarray(0, 'float64').min)
+
+
+def test_np_reduce_sequence():
+    assert np.sum([1, 2, 3]) == 6
+    assert_close([np.mean((1, 2, 3, 4))], [2.5])
+    assert np.argmax([3, 9, 1]) == 1
+
+
+def test_matmul():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'float64')
+    b = Ndarray([[7, 8], [9, 10], [11, 12]], 'float64')
+    assert a.matmul(b).tolist() == [[58, 64], [139, 154]]
+    assert a.matmul(b.transpose(), None, True).tolist() == [[58, 64], [139, 154]]
+    assert a.matmul(Ndarray([1, 1, 1], 'float64')).tolist() == [6, 15]
+    assert Ndarray([1, 2], 'float64').matmul(Ndarray([3, 4], 'float64')) == 11
+
+
+def test_matmul_stack():
+    a = Ndarray([[[1, 0], [0, 1]], [[2, 0], [0, 2]]], 'float64')
+    b = Ndarray([[1, 2], [3, 4]], 'float64')
+    assert a.matmul(b).tolist() == [[[1, 2], [3, 4]], [[2, 4], [6, 8]]]
+
+
+def test_matmul_out():
+    a = Ndarray([[1, 2], [3, 4]], 'float64')
+    out = Ndarray((2, 2), 'float64')
+    assert a.matmul(a, out) is out
+    assert out.tolist() == [[7, 10], [15, 22]]
+    v = Ndarray([1, 2], 'float64')
+    assert_raises(ValueError, v.matmul, v, Ndarray(1, 'float64'))
+    assert_raises(ValueError, a.matmul, a, Ndarray((2, 2), 'int32'))
+
+
+def test_op_out():
+    a = Ndarray([1, 2, 3], 'float64')
+    out = Ndarray(3, 'float64')
+    assert a.op('mul', 2, out) is out
+    assert out.tolist() == [2, 4, 6]
+    assert np.add(a, out, out) is out
+    assert out.tolist() == [3, 6, 9]
+    mask = Ndarray(3, 'uint8')
+    assert np.less(a, 2, mask) is mask
+    assert mask.tolist() == [1, 0, 0]
+
+
+def test_op_out_incompatible():
+    a = Ndarray([1, 2, 3], 'float64')
+    assert_raises(TypeError, a.op, 'add', 1, Ndarray(2, 'float64'))
+    assert_raises(TypeError, a.op, 'add', 1, Ndarray(3, 'int32'))
+    assert_raises(TypeError, a.cmp, 'lt', 1, Ndarray(3, 'float64'))
+
+
+def test_lazy_fused():
+    a = Ndarray([1, 2, 3], 'float64')
+    b = Ndarray([[10], [20]], 'float64')
+    expr = np.lazy(a).op('mul', 2).op('add', b).op('neg')
+    assert expr.evaluate().tolist() == [[-12, -14, -16], [-22, -24, -26]]
+    out = Ndarray((2, 3), 'float64')
+    assert expr.evaluate(out) is out
+    assert out[1, 2] == -26
+
+
+def test_lazy_repeated_operand():
+    a = Ndarray([1, 2, 3], 'float64')
+    assert a.deferred().op('mul', a.deferred()).evaluate().tolist() == [1, 4, 9]
+
+
+def test_lazy_compare_is_mask():
+    a = Ndarray([1, 5, 3], 'float64')
+    mask = np.lazy(a).op('gt', 2).evaluate()
+    assert a[mask].tolist() == [5, 3]
+
+
+def test_kernel_cache_eviction():
+    cache = _KernelCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('c', 3)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2 and cache.get('c') == 3
+
+
+def test_kernel_reuse():
+    a = Ndarray([1, 2, 3], 'int16')
+    a.op('sub', 1)
+    count = len(_kernels._keys)
+    for i in range(3):
+        a.op('sub', i)
+    assert len(_kernels._keys) == count
+    assert a.op('sub', 1).tolist() == [0, 1, 2]
+
+
+def test_convolve2d():
+    a = Ndarray([[1, 2, 3], [4, 5, 6], [7, 8, 9]], 'float64')
+    ones = [[1, 1, 1], [1, 1, 1], [1, 1, 1]]
+    assert a.convolve2d(ones, 'valid').tolist() == [[45]]
+    same = a.convolve2d(ones)
+    assert same[1, 1] == 45 and same[0, 0] == 12
+    assert a.convolve2d(ones, 'same', 'nearest')[0, 0] == 21
+    assert a.convolve2d([[1, 2, 1], [2, 4, 2], [1, 2, 1]], 'valid').tolist() == [[80]]
+    assert_raises(ValueError, a.convolve2d, ones, 'full')
+    assert_raises(ValueError, a.convolve2d, ones, 'same', 'mirror')
+    assert_raises(TypeError, a.convolve2d, [1, 2, 1])
+
+
+def test_resize():
+    a = Ndarray([[0, 10], [20, 30]], 'float64')
+    assert a.resize(4, 4, 'nearest').tolist()[0] == [0, 0, 10, 10]
+    assert a.resize(2, 2).tolist() == [[0, 10], [20, 30]]
+    b = Ndarray([[1, 3, 5, 7], [1, 3, 5, 7]], 'float64')
+    assert b.resize(1, 2, 'area').tolist() == [[2, 6]]
+    c = Ndarray((2, 2, 3), 'uint8')
+    assert tuple(c.resize(3, 5).getshape()) == (3, 5, 3)
+    assert_raises(ValueError, a.resize, 2, 2, 'cubic')
+    assert_raises(TypeError, Ndarray(4, 'float64').resize, 2, 2)
+
+
+def test_histogram():
+    counts, edges = np.histogram([0, 1, 1, 2, 3, 4], 4)
+    assert counts._dtype == 'uint32'
+    assert counts.tolist() == [1, 2, 1, 2]
+    assert edges.tolist() == [0, 1, 2, 3, 4]
+    counts, edges = np.histogram([0, 1, 1, 2, 3, 4, 9], [0, 2, 5])
+    assert counts.tolist() == [3, 3]
+
+
+def test_bincount():
+    values = Ndarray([1, 1, 3], 'int32')
+    assert np.bincount(values).tolist() == [0, 2, 0, 1]
+    assert np.bincount(values, [0.5, 0.5, 2]).tolist() == [0, 1, 0, 2]
+    assert len(np.bincount(values, None, 6).tolist()) == 6
+    assert_raises(TypeError, np.bincount, Ndarray([1.5], 'float64'))
+
+
+def test_cumulative():
+    a = Ndarray([[1, 2], [3, 4]], 'int32')
+    assert a.cumsum().tolist() == [1, 3, 6, 10]
+    assert a.cumsum(0).tolist() == [[1, 2], [4, 6]]
+    assert a.transpose().cumsum(1).tolist() == [[1, 4], [2, 6]]
+    assert Ndarray([1, 2, 3], 'float64').cumprod().tolist() == [1, 2, 6]
+
+
+def test_mask_indexing():
+    a = Ndarray([[1, 6], [7, 2]], 'int32')
+    mask = a.cmp('gt', 5)
+    assert a[mask].tolist() == [6, 7]
+    a[mask] = 0
+    assert a.tolist() == [[1, 0], [0, 2]]
+    a[a.cmp('eq', 0)] = [8, 9]
+    assert a.tolist() == [[1, 8], [9, 2]]
+    assert_raises(ValueError, a.__setitem__, a.cmp('gt', 0), [1, 2])
+    bits = BitSet(4)
+    bits.set(3)
+    assert a[bits].tolist() == [2]
+
+
+def test_mask_after_arithmetic():
+    a = Ndarray([10, 20, 30, 40, 50], 'int32')
+    mask = a.cmp('gt', 25)
+    assert a[mask].tolist() == [30, 40, 50]
+    mask.op('mul', 3, mask)
+    assert a[mask].tolist() == [10, 10, 40, 40, 40]
+    assert a[mask.copy()].tolist() == [10, 10, 40, 40, 40]
+    assert a[np.asmask(mask)].tolist() == [30, 40, 50]
+    positions = Ndarray([1, 1, 0, 0, 0], 'uint8')
+    assert a[positions].tolist() == [20, 20, 10, 10, 10]
+
+
+def test_where_clip_select():
+    a = Ndarray([1, 5, 3], 'float64')
+    assert np.where(a.cmp('gt', 2), a, 0).tolist() == [0, 5, 3]
+    assert [index.tolist() for index in np.nonzero(Ndarray([[0, 1], [2, 0]], 'int32'))] == [[0, 1], [1, 0]]
+    assert np.count_nonzero([0, 1, 2]) == 2
+    assert np.clip(a, 2, 4).tolist() == [2, 4, 3]
+    assert np.clip(a, None, 2).tolist() == [1, 2, 2]
+    assert np.select([a.cmp('lt', 2), a.cmp('gt', 4)], [-1, 1]).tolist() == [-1, 1, 0]
+    assert_raises(ValueError, np.clip, a, None, None)
+
+
+def test_compress():
+    a = Ndarray([[1, 2], [3, 4], [5, 6]], 'int32')
+    assert a.compress([0, 1, 1], 0).tolist() == [[3, 4], [5, 6]]
+    assert a.compress([1, 0], 1).tolist() == [[1], [3], [5]]
+    assert a.compress([1, 0, 0, 1]).tolist() == [1, 4]
+    assert_raises(IndexError, a.compress, [0, 0, 0, 1], 0)
+
+
+def test_take_put():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    assert a.take([5, 0, -1]).tolist() == [6, 1, 6]
+    assert a.take([2, 0], 1).tolist() == [[3, 1], [6, 4]]
+    assert_raises(IndexError, a.take, [6])
+    b = a.transpose()
+    b.put([0, 5], [7, 9])
+    assert a.tolist() == [[7, 2, 3], [4, 5, 9]]
+    assert_raises(IndexError, a.put, [0, 6], 1)
+    assert a[0, 0] == 7
+
+
+def test_index_arrays():
+    a = Ndarray([[1, 2, 3], [4, 5, 6]], 'int32')
+    index = Ndarray([1, 0], 'int32')
+    assert a[index].tolist() == [[4, 5, 6], [1, 2, 3]]
+    assert a[(index, Ndarray([2, 2], 'int32'))].tolist() == [6, 3]
+    assert a[(index, 0)].tolist() == [4, 1]
+    a[(index, Ndarray([0, 1], 'int32'))] = 0
+    assert a.tolist() == [[1, 0, 3], [0, 5, 6]]
+
+
+def test_index_array_row_assignment():
+    a = Ndarray((3, 2), 'int32')
+    index = Ndarray([2, -3], 'int32')
+    a[index] = [[1, 2], [3, 4]]
+    assert a.tolist() == [[3, 4], [0, 0], [1, 2]]
+    a[index] = [5, 6]
+    assert a.tolist() == [[5, 6], [0, 0], [5, 6]]
+    a[Ndarray([1], 'int32')] = 7
+    assert a.tolist() == [[5, 6], [7, 7], [5, 6]]
+    t = Ndarray((2, 3), 'int32').transpose()
+    t[Ndarray([1], 'int32')] = [8, 9]
+    assert t.tolist() == [[0, 0], [8, 9], [0, 0]]
+    assert_raises(TypeError, a.__setitem__, index, [1, 2, 3])
+    assert_raises(IndexError, a.__setitem__, Ndarray([3], 'int32'), 0)
+
+
+def test_sort():
+    a = Ndarray([[3, 1, 2], [9, 7, 8]], 'int32')
+    assert np.sort(a).tolist() == [[1, 2, 3], [7, 8, 9]]
+    assert np.sort(a, 0).tolist() == [[3, 1, 2], [9, 7, 8]]
+    assert np.sort(a, None).tolist() == [1, 2, 3, 7, 8, 9]
+    t = a.transpose()
+    t.sort(0)
+    assert a.tolist() == [[1, 2, 3], [7, 8, 9]]
+    nan = float('nan')
+    s = np.sort(Ndarray([2, nan, -1], 'float64')).tolist()
+    assert s[:2] == [-1, 2] and is_nan(s[2])
+
+
+def test_argsort_partition():
+    a = Ndarray([3, 1, 2, 1], 'float64')
+    assert np.argsort(a).tolist() == [1, 3, 2, 0]
+    p = np.partition(Ndarray([5, 1, 4, 2, 3], 'int32'), 2).tolist()
+    assert p[2] == 3 and max(p[:2]) <= 3 and min(p[3:]) >= 3
+    i = np.argpartition(Ndarray([5, 1, 4, 2, 3], 'int32'), 0).tolist()
+    assert i[0] == 1
+
+
+def test_searchsorted_unique():
+    a = Ndarray([1, 2, 2, 5], 'float64')
+    assert np.searchsorted(a, 2) == 1
+    assert np.searchsorted(a, 2, 'right') == 3
+    assert np.searchsorted(a, [0, 6]).tolist() == [0, 4]
+    values, counts = np.unique([3, 1, 3, 2, 3], True)
+    assert values.tolist() == [1, 2, 3]
+    assert counts.tolist() == [1, 1, 3]
@@ -0,0 +1,29 @@
+#PyjsArray tests - shared assertions usable in Pyjs builds and under pytest
+
+
+def assert_raises(exception, func, *args):
+    """
+    Assert that calling func with args raises exception.
+    """
+    try:
+        func(*args)
+    except exception:
+        return None
+    raise AssertionError("%s not raised" % exception.__name__)
+
+
+def assert_close(values, expected, tolerance=1e-6):
+    """
+    Assert that two flat lists of numbers are equal within tolerance.
+    """
+    assert len(values) == len(expected), (values, expected)
+    for value, other in zip(values, expected):
+        assert abs(value - other) <= tolerance, (values, expected)
+    return None
+
+
+def is_nan(value):
+    """
+    Return whether value is NaN.
+    """
+    return value != value